@@ -14,9 +14,14 @@ scriptDir,_ = os.path.split(os.path.abspath(sys.argv[0]))
 sys.path.append(os.path.join(scriptDir,'python/modules')) # Look for modules in these subdirectories of the directory containing QAarchive.py
 sys.path.append(os.path.join(scriptDir,'python/utils'))
 
-import Utils, Alert, Filter, Database
+import Utils, Alert, Filter, Database, FileRegister, BuildServer
 Alert.ObjectPrinter = Database.ItemRepr
 
+if "--sendToServer" in sys.argv: # Pass the command line to a running build server without parsing it here
+    argIndex = sys.argv.index("--sendToServer")
+    sys.exit(BuildServer.SendCommand(int(sys.argv[argIndex + 1]),sys.argv[1:argIndex] + sys.argv[argIndex + 2:]))
+
+
 def PrintModuleSeparator(moduleName:str) -> None:
     if moduleName:
         Alert.structure(f"{'-'*10} {moduleName} {'-'*(25 - len(moduleName))}")
@@ -87,8 +92,55 @@ def ReadArgsFile(argsFilename: str,parser: argparse.ArgumentParser) -> None:
     
     ApplyDefaults(argumentStrings,parser)
 
-def LoadDatabaseAndAddMissingOps(opSet: set[str]) -> Tuple[dict,set[str]]:
-    "Scan the list of specified ops to see if we can load a database to save time. Add any ops needed to support those specified."
+def CodeFiles() -> list[str]:
+    "Return the list of Python source files whose contents define the code version."
+    
+    codeFiles = [os.path.join(scriptDir,"QSarchive.py")]
+    for directory in ["python/modules","python/utils"]:
+        directory = os.path.join(scriptDir,directory)
+        codeFiles += sorted(os.path.join(directory,f) for f in os.listdir(directory) if f.endswith(".py"))
+    return codeFiles
+
+def StageKey(stage: str) -> str:
+    """Return the stage cache key for stage ('ParseCSV' or 'Render') based on the current input files and options."""
+
+    options = {option:getattr(clOptions,option,None) for option in stageOptions[stage]}
+    if stage == "ParseCSV":
+        inputFiles = sorted(Utils.PosixJoin(clOptions.csvDir,f) for f in os.listdir(clOptions.csvDir) if f.lower().endswith(".csv"))
+        options["sessionMp3Files"] = FileRegister.FileListing(clOptions.sessionMp3Dir,r".*\.mp3$")
+            # ParseCSV reads the duration of local session mp3 files
+    else:
+        inputFiles = [clOptions.spreadsheetDatabase,Utils.PosixJoin(clOptions.prototypeDir,'assets/citationHelper/Suttas.json')]
+        options["sessionMp3Files"] = FileRegister.FileListing(clOptions.sessionMp3Dir,r".*\.mp3$")
+        options["excerptMp3Files"] = FileRegister.FileListing(clOptions.excerptMp3Dir,r".*\.mp3$")
+            # Link checks the local mp3 files, which are too large to hash
+    return FileRegister.StageKey(inputFiles,options,CodeFiles())
+
+def StageUpToDate(stage: str) -> bool:
+    "Can we skip stage because its output file was created from identical inputs, options, and code?"
+    
+    if clOptions.ignoreStageCache:
+        return False
+    return gStageCache.UpToDate(stageOutput[stage],StageKey(stage))
+
+def LoadRenderedDatabase() -> dict:
+    "Load the rendered database. In server mode, reuse the resident database if the file hasn't changed."
+
+    if not gServing:
+        return Database.LoadDatabase(clOptions.renderedDatabase)
+    
+    fileHash = FileRegister.FileHash(clOptions.renderedDatabase)
+    if gResidentDatabase.get("md5") != fileHash:
+        gResidentDatabase["database"] = Database.LoadDatabase(clOptions.renderedDatabase)
+        gResidentDatabase["md5"] = fileHash
+    else:
+        Alert.info("Using the resident copy of",clOptions.renderedDatabase)
+    return gResidentDatabase["database"]
+
+def LoadDatabaseAndAddMissingOps(opSet: set[str],namedOps: set[str] = frozenset()) -> Tuple[dict,set[str]]:
+    """Scan the list of specified ops to see if we can load a database to save time. Add any ops needed to support those specified.
+    Remove ParseCSV, Link, and Render if the stage cache indicates their output is up to date,
+    but never remove namedOps, the ops named on the command line: Link depends on remote files that the stage key can't see."""
 
     newDB = {}
     opSet:set = set(opSet) # Clone opSet
@@ -98,21 +150,28 @@ def LoadDatabaseAndAddMissingOps(opSet: set[str]) -> Tuple[dict,set[str]]:
             opSet.add('ParseCSV')
         else:
             return newDB,opSet
+    elif 'ParseCSV' in opSet and 'ParseCSV' not in namedOps and StageUpToDate('ParseCSV'):
+        Alert.info("Skipping ParseCSV: the csv files, options, and code are unchanged since",clOptions.spreadsheetDatabase,"was written.")
+        opSet.remove('ParseCSV')
     
     requireSpreadsheetDBset = set(requireSpreadsheetDB)
     requireRenderedDBset = set(requireRenderedDB)
 
     if 'Render' in opSet: # Render requires link in all cases
         opSet.add('Link')
-    if opSet.intersection(requireRenderedDBset):
-        if 'ParseCSV' not in opSet and not opSet.intersection(requireSpreadsheetDBset) and \
-                      not Utils.DependenciesModified(clOptions.renderedDatabase,[clOptions.spreadsheetDatabase]):
+    renderOnly = requireSpreadsheetDBset.intersection(opSet) <= {'Link','Render'}
+    if opSet.intersection(requireRenderedDBset | {'Link','Render'}):
+        if 'ParseCSV' not in opSet and renderOnly and not namedOps & {'Link','Render'} and StageUpToDate('Render'):
             try:
-                newDB = Database.LoadDatabase(clOptions.renderedDatabase)
+                newDB = LoadRenderedDatabase()
+                if opSet.intersection({'Link','Render'}):
+                    Alert.info("Skipping Link and Render: the spreadsheet database, options, and code are unchanged since",clOptions.renderedDatabase,"was written.")
+                opSet.difference_update({'Link','Render'})
                 return newDB,opSet
             except OSError:
                 pass
-        opSet.update(['Link','Render'])
+        if opSet.intersection(requireRenderedDBset):
+            opSet.update(['Link','Render'])
     
     if 'ParseCSV' not in opSet and opSet.intersection(requireSpreadsheetDBset):
         try:
@@ -125,10 +184,19 @@ def LoadDatabaseAndAddMissingOps(opSet: set[str]) -> Tuple[dict,set[str]]:
 
 # The list of code modules/ops to implement
 requireSpreadsheetDB = ['ReviewDatabase','DownloadFiles','SplitMp3','ExportAudio','Link','Render']
-requireRenderedDB = ['Document','Prototype','SetupSearch','SetupRandom','TagMp3','PrepareUpload','CheckLinks']
+requireRenderedDB = ['Document','Prototype','SetupSearch','SetupRandom','FingerprintAssets','TagMp3','PrepareUpload','CheckLinks']
 moduleList = ['DownloadCSV','ParseCSV'] + requireSpreadsheetDB + requireRenderedDB
 optionalModules = {'ExportAudio'} # These aren't included in All
 
+# The stages which write a database to disk, their output files, and the options that affect their output
+stageOutput = {} # Filled in after the options are parsed
+stageOptions = {
+    'ParseCSV': ['csvDir','sessionMp3Dir','events','ignoreTeacherConsent','pendingMeansYes','ignoreExcludes','parseOnlySpecifiedEvents',
+                 'includeTestEvent','draftFTags','detailedCount','keepUnusedTags','jsonNoClean'],
+    'Render': ['mirror','sessionMp3','excerptMp3','reference','uploadMirror','linkCheckLevel',
+               'sessionMp3Dir','excerptMp3Dir','referenceDir','prototypeDir','attributeAll']
+}
+
 modules = {modName:importlib.import_module(modName) for modName in moduleList}
 priorityInitialization = ['Link']
 Utils.ExtendUnique(priorityInitialization,modules.keys())
@@ -143,6 +211,7 @@ SplitMp3 - split mp3 files into individual excerpts based on the times in Spread
 Render - use pryatemp and markdown to convert excerpts into html and saves to RenderedDatabase.json.
 Document - create the .md files in documentation/about from documentation/aboutSources.
 Prototype - create html files for all menus and excerpts.
+FingerprintAssets - copy javascript, css, and json assets to file names containing their md5 hash.
 TagMp3 - update the ID3 tags on excerpt mp3 files.
 All - run all the above modules in sequence.
 """)
@@ -153,7 +222,13 @@ parser.add_argument("--args",type=str,action="append",default=[],help="Read argu
 parser.add_argument('--skip',type=str,default='',help='A comma-separated list of operations to skip')
 parser.add_argument('--events',type=str,default='All',help='A comma-separated list of event codes to process; Default: All')
 parser.add_argument('--spreadsheetDatabase',type=str,default='pages/assets/SpreadsheetDatabase.json',help='Database created from the csv files; keys match spreadsheet headings; Default: pages/assets/SpreadsheetDatabase.json')
+parser.add_argument('--stageCache',type=str,default='pages/assets/StageCache.json',help='Record the inputs used to create the databases in this file; Default: pages/assets/StageCache.json')
+parser.add_argument('--ignoreStageCache',**Utils.STORE_TRUE,help="Run ParseCSV, Link, and Render even if their inputs haven't changed")
 parser.add_argument('--multithread',**Utils.STORE_TRUE,help="Multithread some operations")
+parser.add_argument('--serve',type=int,default=None,help="After running ops, keep the database in memory and run the QSarchive.py command lines POSTed to this localhost port")
+parser.add_argument('--watch',**Utils.STORE_TRUE,help="After running ops, keep the database in memory and rebuild whenever the csv files, documentation sources, or templates change")
+parser.add_argument('--watchInterval',type=float,default=1.0,help="Check for changes this often in seconds when watching; Default: 1.0")
+parser.add_argument('--sendToServer',type=int,default=None,help="Send the rest of the command line to the build server running on this localhost port")
 parser.add_argument('--dumpArgs',**Utils.STORE_TRUE,help="Print the argument parser arguments and exit")
 
 for mod in modules.values():
@@ -163,6 +238,184 @@ parser.add_argument('--verbose','-v',default=0,action='count',help='increase ver
 parser.add_argument('--quiet','-q',default=0,action='count',help='decrease verbosity')
 parser.add_argument('--debug',**Utils.STORE_TRUE,help="Print debugging logs")
 
+def ConfigureOptions(argList: list[str]) -> None:
+    """Parse argList using the defaults currently applied to the parser and distribute the options to the modules."""
+    global clOptions, gOptionsRepr
+    
+    clOptions = parser.parse_args(argList)
+    gOptionsRepr = repr(vars(clOptions)) # Before the modules convert options into objects
+    clOptions.verbose -= clOptions.quiet
+    Alert.verbosity = clOptions.verbose
+    Alert.Debugging(clOptions.debug)
+
+    for mod in modules.values():
+        mod.gOptions = clOptions
+            # Let each module access all arguments
+    Utils.gOptions = clOptions
+    Database.gOptions = clOptions
+
+    for modName in priorityInitialization:
+        modules[modName].ParseArguments()
+            # Tell each module to parse its own arguments
+
+    if Alert.error.count:
+        print("Aborting due to argument parsing errors.")
+        sys.exit(2)
+
+    if clOptions.dumpArgs:
+        print("Parsed arguments (clOptions):")
+        for attribute in sorted(dir(clOptions)):
+            if not attribute.startswith("_"):
+                print(f"   {attribute} = {repr(getattr(clOptions,attribute))}")
+        sys.exit(0)
+
+    if clOptions.events != 'All':
+        clOptions.events = clOptions.events.split(',')
+            # clOptions.events is now either the string 'All' or a list of strings
+
+def RunOps() -> None:
+    """Load the database, run the operations specified by clOptions, and summarize the errors."""
+    global stageOutput, gStageCache, gPreviousDatabase, gPreviousOptions
+
+    if clOptions.ops.strip() == 'All':
+        opSet = set(moduleList) - optionalModules
+        namedOps = set() # Stages included by All are skipped if they are up to date
+    else:
+        opSet = set(verb.strip() for verb in clOptions.ops.split(','))
+        namedOps = set(opSet)
+
+    # Check for unsuppported ops
+    for verb in opSet:
+        if verb not in moduleList:
+            Alert.warning("Unsupported operation",verb)
+
+    # Skip specified ops; useful when all operations are specified.
+    skipOps = set(verb.strip() for verb in clOptions.skip.split(','))
+    for verb in skipOps:
+        if verb and verb not in moduleList:
+            Alert.caution("Can't skip unknown operation",verb)
+    opSet -= skipOps
+
+    stageOutput = {'ParseCSV': clOptions.spreadsheetDatabase,'Render': clOptions.renderedDatabase}
+    gStageCache = FileRegister.StageCache("./",clOptions.stageCache)
+    database, newOpSet = LoadDatabaseAndAddMissingOps(opSet,namedOps)
+    if newOpSet - opSet:
+        Alert.info(f"Will run additional module(s): {newOpSet - opSet}.")
+    if opSet - newOpSet:
+        Alert.info(f"Skipping up-to-date module(s): {opSet - newOpSet}.")
+    opSet = newOpSet
+
+    if database is not gPreviousDatabase or gOptionsRepr != gPreviousOptions:
+        # Discard anything cached from the database or options used by an earlier build
+        Utils.ClearDatabaseCaches(list(modules.values()) + [Utils,Database,Filter])
+        Database.RegisterAnnotationOwners(database.get("excerpts",()))
+        gPreviousDatabase = database
+        gPreviousOptions = gOptionsRepr
+
+    # Set up the global namespace for each module - this allows the modules to call each other out of order
+    for mod in modules.values():
+        mod.gDatabase = database
+    Database.gDatabase = database
+    Filter.gDatabase = database
+
+    # Then run the specified operations in sequential order
+    initialized = False
+    for moduleName in moduleList:
+        if database and not initialized:
+            for modName in priorityInitialization:
+                modules[modName].Initialize() # Run each module's initialize function when the database fills up
+            initialized = True
+
+        if moduleName in opSet:
+            PrintModuleSeparator(moduleName)
+            modules[moduleName].main()
+            if moduleName in stageOutput:
+                gStageCache.RecordStage(stageOutput[moduleName],StageKey(moduleName))
+                gStageCache.Flush()
+            if moduleName == 'Render' and gServing:
+                gResidentDatabase["database"] = database
+                gResidentDatabase["md5"] = FileRegister.FileHash(clOptions.renderedDatabase)
+    PrintModuleSeparator("")
+
+    if clOptions.ignoreTeacherConsent:
+        Alert.warning("Teacher consent has been ignored. This should only be used for testing and debugging purposes.")
+    if clOptions.pendingMeansYes:
+        Alert.warning("Pending teacher consent has been treated as yes. This should only be used for testing and debugging purposes.")
+    if clOptions.ignoreExcludes:
+        Alert.warning("Session/excerpt exclusion flags have been ignored. This should only be used for testing and debugging purposes.")
+
+    errorCountList = []
+    for error in [Alert.error, Alert.warning, Alert.caution, Alert.notice]:
+        countString = error.CountString()
+        if countString:
+            errorCountList.append(countString)
+
+    if errorCountList:
+        Alert.essential("  ***** " + ", ".join(errorCountList) + " *****")
+    else:
+        Alert.status("No errors reported.")
+
+def BuildRequest(requestArgs: list[str]) -> None:
+    """Run the QSarchive.py command line requestArgs using the defaults the server or watcher started with
+    and the database held in memory."""
+
+    Alert.ResetCounts()
+    parser.set_defaults(**gServerDefaults)
+    if requestArgs and requestArgs[0] in ("Job","Jobs"):
+        requestArgs = ReadJobOptions(requestArgs[1] if len(requestArgs) >= 2 else None) + requestArgs[2:]
+    Alert.essential('Build request:'," ".join(requestArgs))
+    PrintModuleSeparator("")
+
+    gParsedArgsFileCount.clear()
+    gErrorArgsFiles.clear()
+    for argsFile in parser.parse_args(requestArgs).args:
+        ReadArgsFile(argsFile,parser)
+    ConfigureOptions(requestArgs)
+    RunOps()
+    Alert.structure("Build request finished.")
+
+def WatchedDirectories() -> list[str]:
+    "Return the directories whose contents are watched by --watch."
+    sourceDirs = [Utils.PosixJoin(clOptions.documentationDir,d) for d in sorted(os.listdir(clOptions.documentationDir)) if d.endswith("Sources")]
+    return [clOptions.csvDir] + sourceDirs + [Utils.PosixJoin(clOptions.prototypeDir,"templates")]
+
+def WatchCommands(changedFiles: set[str]) -> list[list[str]]:
+    """Return the command line which rebuilds what depends on changedFiles:
+    An event sheet or its excerpt sheet (<event>x.csv) requires ParseCSV and a targeted build of that event (--buildEvent);
+    other csv files and templates require ParseCSV and all Prototype sections;
+    documentation sources require Document and Prototype, which always builds the about pages."""
+
+    ops = set()
+    events = set()
+    fullBuild = False
+    for path in changedFiles:
+        if path.startswith(Utils.PosixJoin(clOptions.csvDir,"")):
+            if path.lower().endswith(".csv"):
+                ops.update(['ParseCSV','Prototype','SetupSearch','SetupRandom'])
+                eventCode = os.path.splitext(os.path.basename(path))[0]
+                if eventCode not in Database.gDatabase.get("event",()) and eventCode.endswith("x"):
+                    eventCode = eventCode[:-1] # A separate excerpt sheet; see ParseCSV.LoadEventFile
+                if eventCode in Database.gDatabase.get("event",()):
+                    events.add(eventCode)
+                else:
+                    fullBuild = True
+        elif path.startswith(Utils.PosixJoin(clOptions.prototypeDir,"templates/")):
+            ops.add('Prototype')
+            fullBuild = True
+        elif path.endswith(".md"):
+            ops.update(['Document','Prototype'])
+    
+    if not ops:
+        return []
+    argList = [",".join(op for op in moduleList if op in ops)]
+    if not fullBuild:
+        if events:
+            for eventCode in sorted(events):
+                argList += ["--buildEvent",eventCode]
+        else:
+            argList += ["--buildOnly","none"]
+    return [argList]
+
 if sys.argv[1] == "Job" or sys.argv[1] == "Jobs": # If ops == "Job", 
     jobOptionsList = ReadJobOptions(sys.argv[2] if len(sys.argv) >= 3 else None)
     argList = jobOptionsList + sys.argv[3:]
@@ -196,93 +449,25 @@ if gErrorArgsFiles:
     Alert.structure("Could not read:",", ".join(gErrorArgsFiles))
 
 ## STEP 3: Parse the command line again to override arguments specified by the .args files
-clOptions = parser.parse_args(argList)
-clOptions.verbose -= clOptions.quiet
-Alert.verbosity = clOptions.verbose
-Alert.Debugging(clOptions.debug)
-
-for mod in modules.values():
-    mod.gOptions = clOptions
-        # Let each module access all arguments
-Utils.gOptions = clOptions
-Database.gOptions = clOptions
-
-for modName in priorityInitialization:
-    modules[modName].ParseArguments()
-        # Tell each module to parse its own arguments
-
-if Alert.error.count:
-    print("Aborting due to argument parsing errors.")
+gServing = False # Are we running as a build server or watcher?
+gResidentDatabase = {} # In server mode, the rendered database and the md5 hash of the file it was loaded from
+gPreviousDatabase = None
+gPreviousOptions = None # gOptionsRepr when the caches were last cleared
+ConfigureOptions(argList)
+
+if clOptions.serve and clOptions.watch:
+    Alert.error("--serve and --watch can't be used together.")
     sys.exit(2)
-
-if clOptions.dumpArgs:
-    print("Parsed arguments (clOptions):")
-    for attribute in sorted(dir(clOptions)):
-        if not attribute.startswith("_"):
-            print(f"   {attribute} = {repr(getattr(clOptions,attribute))}")
-    sys.exit(0)
-
-if clOptions.events != 'All':
-    clOptions.events = clOptions.events.split(',')
-        # clOptions.events is now either the string 'All' or a list of strings
-
-if clOptions.ops.strip() == 'All':
-    opSet = set(moduleList) - optionalModules
-else:
-    opSet = set(verb.strip() for verb in clOptions.ops.split(','))
-
-# Check for unsuppported ops
-for verb in opSet:
-    if verb not in moduleList:
-        Alert.warning("Unsupported operation",verb)
-
-# Skip specified ops; useful when all operations are specified.
-skipOps = set(verb.strip() for verb in clOptions.skip.split(','))
-for verb in skipOps:
-    if verb and verb not in moduleList:
-        Alert.caution("Can't skip unknown operation",verb)
-opSet -= skipOps
-
-database, newOpSet = LoadDatabaseAndAddMissingOps(opSet)
-if newOpSet != opSet:
-    Alert.info(f"Will run additional module(s): {newOpSet.difference(opSet)}.")
-    opSet = newOpSet
-
-# Set up the global namespace for each module - this allows the modules to call each other out of order
-for mod in modules.values():
-    mod.gDatabase = database
-Database.gDatabase = database
-Filter.gDatabase = database
-
-# Then run the specified operations in sequential order
-initialized = False
-for moduleName in moduleList:
-    if database and not initialized:
-        for modName in priorityInitialization:
-            modules[modName].Initialize() # Run each module's initialize function when the database fills up
-        initialized = True
-
-    if moduleName in opSet:
-        PrintModuleSeparator(moduleName)
-        modules[moduleName].main()
-PrintModuleSeparator("")
-
-if clOptions.ignoreTeacherConsent:
-    Alert.warning("Teacher consent has been ignored. This should only be used for testing and debugging purposes.")
-if clOptions.pendingMeansYes:
-    Alert.warning("Pending teacher consent has been treated as yes. This should only be used for testing and debugging purposes.")
-if clOptions.ignoreExcludes:
-    Alert.warning("Session/excerpt exclusion flags have been ignored. This should only be used for testing and debugging purposes.")
-
-errorCountList = []
-for error in [Alert.error, Alert.warning, Alert.caution, Alert.notice]:
-    countString = error.CountString()
-    if countString:
-        errorCountList.append(countString)
-
-if errorCountList:
-    Alert.essential("  ***** " + ", ".join(errorCountList) + " *****")
-else:
-    Alert.status("No errors reported.")
+if clOptions.serve or clOptions.watch:
+    # The command line options become the defaults for each subsequent build
+    gServerDefaults = vars(parser.parse_args(argList))
+    gServerDefaults.update(serve=None,watch=False,args=[])
+    gServing = True
+
+RunOps()
+if clOptions.serve:
+    BuildServer.Serve(clOptions.serve,BuildRequest)
+elif clOptions.watch:
+    BuildServer.Watch(WatchedDirectories(),WatchCommands,BuildRequest,clOptions.watchInterval)
 
 Alert.structure("QSarchive.py finished.")
\ No newline at end of file
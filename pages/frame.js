@@ -49,6 +49,17 @@ export function setFrameSearch(params,modifyLocation = null) {
 	}
 }
 
+function fetchPage(pUrl) {
+	// Fetch the body-only fragment of the page written by Prototype --writeFragments if available;
+	// otherwise fetch the entire page.
+	if (frame.dataset.fragments) {
+		return fetch(join(frame.dataset.fragments,pUrl))
+			.then((r) => r.ok ? r : fetch("./" + pUrl))
+			.catch(() => fetch("./" + pUrl));
+	} else
+		return fetch("./" + pUrl);
+}
+
 function pageText(r,url) {
 	if (r.ok) {
 		return r.text().then((text) => Promise.resolve([text,url]))
@@ -115,11 +126,11 @@ export function configureLinks(frame,url) {
 async function changeURL(pUrl,scrollTo = null) {
 	pUrl = decodeURIComponent(pUrl);
 	console.log("changeURL",pUrl);
-	await fetch("./" + pUrl)
+	await fetchPage(pUrl)
 		.then((r) => pageText(r,pUrl))
 		.then((result) => {
 			let [text, resultUrl] = result;
-			text = text.replaceAll(/<link[^>]*rel="stylesheet"[^>]*style\.css[^>]*>/gi,"");
+			text = text.replaceAll(/<link[^>]*rel="stylesheet"[^>]*style(\.[0-9a-f]+)?\.css[^>]*>/gi,"");
 			frame.innerHTML = text;
 
 			let innerTitle = frame.querySelector("title");
@@ -1,19 +1,48 @@
 import {configureLinks} from './frame.js';
+import {decodeStringTable} from './stringTable.js';
 
 const DEBUG = false;
 
-let gDatabase = null; // The global database, loaded from assets/RandomExcerpts.json
+let gIndex = null; // The random excerpt index, loaded from assets/RandomExcerpts.json
+let gShards = []; // gShards[n] holds the excerpts in shard n once it has been loaded
 
-let currentExcerpt = 0; // The excerpt currently displayed
+let currentExcerpt = 0; // The excerpt currently displayed relative to today's excerpt
 
-function displayExcerpt() {
+function todaysExcerpt() {
+    // Return the number of the excerpt featured today. The excerpts are shuffled when the database is built,
+    // so this selects a random shard to load first.
+    let now = new Date();
+    let day = Math.floor((now.getTime() - now.getTimezoneOffset() * 60000) / 86400000);
+    return day % gIndex.excerptCount;
+}
+
+async function loadShard(shardNumber) {
+    // Load one shard of the random excerpt database if it hasn't been loaded already.
+    if (!gShards[shardNumber]) {
+        await fetch('./' + gIndex.shards[shardNumber])
+        .then((response) => response.json())
+        .then((json) => {
+            gShards[shardNumber] = decodeStringTable(json).excerpts;
+            if (DEBUG)
+                console.log("Loaded random excerpt shard",shardNumber);
+        });
+    }
+    return gShards[shardNumber];
+}
+
+async function displayExcerpt() {
     // Display the html code for current excerpt
 
-    let excerptCount = gDatabase.excerpts.length;
-    let excerptToDisplay = ((currentExcerpt % excerptCount) + excerptCount) % excerptCount
+    let excerptCount = gIndex.excerptCount;
+    let excerptToDisplay = (((todaysExcerpt() + currentExcerpt) % excerptCount) + excerptCount) % excerptCount;
+    let displaying = currentExcerpt;
+
+    let shard = await loadShard(Math.floor(excerptToDisplay / gIndex.shardSize));
+    if (displaying != currentExcerpt)
+        return; // The user has moved on to another excerpt while the shard was loading
 
     let displayArea = document.getElementById("random-excerpt");
-    displayArea.innerHTML = gDatabase.excerpts[excerptToDisplay].html;
+    displayArea.innerHTML = shard[excerptToDisplay % gIndex.shardSize].html;
     configureLinks(displayArea,"indexes/homepage.html");
 
     let titleArea = document.getElementById("date-title");
@@ -41,20 +70,20 @@ export async function loadHomepage() {
     prevButton.onclick = () => { displayNextExcerpt(-1); };
     nextButton.onclick = () => { displayNextExcerpt(1); };
 
-    if (!gDatabase) {
+    if (!gIndex) {
         await fetch('./assets/RandomExcerpts.json')
         .then((response) => response.json())
         .then((json) => {
-            gDatabase = json; 
-            console.log("Loaded random excerpt database.");
+            gIndex = json;
+            console.log("Loaded random excerpt index.");
         });
     }
-    displayNextExcerpt(0);
+    await displayNextExcerpt(0);
 }
 
-function displayNextExcerpt(increment) {
+async function displayNextExcerpt(increment) {
     // display the next or previous (increment = -1) random excerpt
     currentExcerpt += increment;
 
-    displayExcerpt(currentExcerpt);
+    await displayExcerpt();
 }
\ No newline at end of file
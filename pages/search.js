@@ -1,5 +1,6 @@
 import {configureLinks,frameSearch,setFrameSearch} from './frame.js';
 import { loadToggleView } from './toggle-view.js';
+import { decodeStringTable } from './stringTable.js';
 
 const TEXT_DELIMITERS = "][{}<>^";
 const METADATA_DELIMITERS = "#&@";
@@ -22,6 +23,8 @@ Object.keys(PALI_DIACRITICS).forEach((letter) => {
 
 const DEBUG = false;
 
+const SEARCH_INDEX_VERSION = 1; // See FORMAT_VERSION in python/utils/SearchIndex.py
+
 export function regExpEscape(literal_string) {
     return literal_string.replace(/[-[\]{}()*+!<>=:?.\/\\^$|#\s,]/g, '\\$&');
 }
@@ -78,13 +81,27 @@ export async function loadSearchPage() {
         await fetch('./assets/SearchDatabase.json')
         .then((response) => response.json())
         .then((json) => {
-            gDatabase = json; 
+            gDatabase = decodeStringTable(json);
             console.log("Loaded search database.");
             for (let code in gSearchers) {
                 gSearchers[code].loadItemsFomDatabase(gDatabase)
             }
         });
 
+        await fetch('./assets/SearchIndex.json')
+        .then((response) => response.json())
+        .then((json) => {
+            if (json.version != SEARCH_INDEX_VERSION)
+                throw new Error(`unknown version ${json.version}`);
+            for (let code in gSearchers) {
+                if (code != "random")
+                    gSearchers[code].loadIndex(json);
+            }
+            console.log("Loaded search index.");
+        })
+        .catch((error) => {
+            console.log("Searching without an index:",error);
+        });
     }
 
     searchFromURL();
@@ -109,6 +126,90 @@ function matchEnclosedText(separators,dontMatchAfterSpace) {
     ].join("");
 }
 
+const POSTING_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_";
+const POSTING_DIGIT_VALUE = new Int8Array(128);
+for (let n = 0; n < POSTING_DIGITS.length; n++)
+    POSTING_DIGIT_VALUE[POSTING_DIGITS.charCodeAt(n)] = n;
+
+function trigrams(text) {
+    // Return an array of the three-character substrings of text.
+    // Count characters by code point to match Python.
+    let chars = Array.from(text);
+    let result = [];
+    for (let n = 0; n + 3 <= chars.length; n++)
+        result.push(chars.slice(n,n + 3).join(""));
+    return result;
+}
+
+function literalTrigrams(literal) {
+    // Return the trigrams that every blob matched by this search term must contain:
+    // those of the literal text between the wildcards *, _, and $.
+    let result = [];
+    for (const segment of literal.replace(/^[$*]+/,"").replace(/[$*]+$/,"").split(/[*_$]/))
+        result.push(...trigrams(segment));
+    return result;
+}
+
+class TrigramIndex {
+    // The index of one search in assets/SearchIndex.json created by SetupSearch.py.
+    // Maps each trigram to the sorted numbers of the items whose blobs contain it.
+    // See python/utils/SearchIndex.py for a description of the encoding.
+    itemCount; // The number of items indexed
+    postings; // postings[trigram] is a string of delta-encoded item numbers
+    decoded = new Map(); // Posting lists we have already decoded
+
+    constructor(searchIndex) {
+        this.itemCount = searchIndex.itemCount;
+        this.postings = searchIndex.postings;
+    }
+
+    itemNumbers(trigram) {
+        // Return the array of item numbers containing trigram.
+        let result = this.decoded.get(trigram);
+        if (result)
+            return result;
+
+        result = [];
+        const encoded = Object.hasOwn(this.postings,trigram) ? this.postings[trigram] : "";
+        let previous = -1;
+        let gap = 0;
+        for (let n = 0; n < encoded.length; n++) {
+            const value = POSTING_DIGIT_VALUE[encoded.charCodeAt(n)];
+            gap = (gap << 5) | (value & 31);
+            if (!(value & 32)) {
+                previous += gap + 1;
+                result.push(previous);
+                gap = 0;
+            }
+        }
+        this.decoded.set(trigram,result);
+        return result;
+    }
+
+    candidates(searchQuery) {
+        // Return the sorted numbers of the items that might match searchQuery
+        // or null if the index can't narrow the search.
+        let required = new Set();
+        for (const group of searchQuery.groups) {
+            for (const term of group.terms)
+                term.trigrams.forEach((t) => required.add(t));
+        }
+        if (!required.size)
+            return null;
+
+        let lists = [...required].map((t) => this.itemNumbers(t));
+        lists.sort((a,b) => a.length - b.length); // Start with the shortest list
+        let result = lists[0];
+        for (const list of lists.slice(1)) {
+            if (!result.length)
+                break;
+            let inList = new Set(list);
+            result = result.filter((n) => inList.has(n));
+        }
+        return result;
+    }
+}
+
 function substituteWildcards(regExpString) {
     // Convert the following wildcards to RegExp strings:
     // * Match any or no characters
@@ -159,6 +260,7 @@ class SearchBase {
 class SearchTerm extends SearchBase {
     matcher; // A RegEx created from searchElement
     matchesMetadata = false; // Does this search term apply to metadata?
+    trigrams = []; // Every item this term matches contains these trigrams; empty if negated
     boldTextMatcher = ""; // A RegEx string used to highlight this term when displaying results
 
     constructor(searchElement) {
@@ -192,6 +294,9 @@ class SearchTerm extends SearchBase {
                 break;
         }
 
+        if (!this.negate)
+            this.trigrams = literalTrigrams(unwrapped);
+
         // Replace inner * and $ with appropriate operators.
         let escaped = substituteWildcards(unwrapped);
         let finalRegEx = escaped;
@@ -421,6 +526,8 @@ class Searcher {
     items = []; // A list of items of the form:
         // database[n].blobs: an array of search blobs to match
         // database[n].html: the html code to display this item when found
+    blobHash = ""; // A hash of the items' blobs written by SetupSearch.py to the database and the index
+    index = null; // A TrigramIndex of items or null if assets/SearchIndex.json isn't available
     query = null; // A searchQuery object describing the search
     foundItems = []; // The items we have found.
     multiSearcher = null; // Set to the MultiSearcher object we are part of.
@@ -435,12 +542,31 @@ class Searcher {
     loadItemsFomDatabase(database) {
         // Called after SearchDatabase.json is loaded to prepare for searching
         this.items = database.searches[this.code].items;
+        this.blobHash = database.searches[this.code].blobHash || "";
+    }
+
+    loadIndex(searchIndex) {
+        // Called after SearchIndex.json is loaded. Ignore indexes that don't match the database.
+        let ourIndex = searchIndex.searches[this.code];
+        if (ourIndex && ourIndex.itemCount == this.items.length && this.blobHash && ourIndex.blobHash == this.blobHash)
+            this.index = new TrigramIndex(ourIndex);
+        else
+            console.log(this.name,"search index doesn't match the database.");
+    }
+
+    candidateItems(searchQuery) {
+        // Return the items which might match searchQuery.
+        let candidates = this.index ? this.index.candidates(searchQuery) : null;
+        if (candidates == null)
+            return this.items;
+        console.log(this.name,"search index narrowed",this.items.length,"items to",candidates.length);
+        return candidates.map((n) => this.items[n]);
     }
 
     search(searchQuery) {
         console.log(this.name,"search.");
         this.query = searchQuery
-        this.foundItems = searchQuery.filterItems(this.items);
+        this.foundItems = searchQuery.filterItems(this.candidateItems(searchQuery));
     }
 
     renderItems(startItem = 0,endItem = null) {
@@ -716,6 +842,12 @@ class MultiSearcher {
         }
     }
 
+    loadIndex(searchIndex) {
+        for (let s of this.searches) {
+            s.loadIndex(searchIndex);
+        }
+    }
+
     search(searchQuery) {
         console.log("Multisearch.");
         this.query = searchQuery;
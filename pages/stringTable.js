@@ -0,0 +1,44 @@
+// Decode the string tables in SearchDatabase.json and RandomExcerpts.json.
+// See python/utils/StringTable.py for a description of the format.
+
+const STRING_TABLE_VERSION = 1; // See FORMAT_VERSION in python/utils/StringTable.py
+
+function decodeString(encoded,strings) {
+    // Return encoded unchanged if it is a string; otherwise join its literal strings and table references.
+    if (!Array.isArray(encoded))
+        return encoded;
+    return encoded.map((part) => (typeof part === "number") ? strings[part] : part).join("");
+}
+
+export function decodeStringTable(database) {
+    // Replace the string table references in database with the strings they refer to and remove the table.
+    // Databases without a string table are returned unchanged.
+    const table = database.stringTable;
+    if (!table)
+        return database;
+    if (table.version != STRING_TABLE_VERSION)
+        throw new Error(`Unknown string table version ${table.version}`);
+
+    const strings = table.strings;
+    const keys = new Set(table.keys);
+    function decodeNode(node) {
+        if (Array.isArray(node)) {
+            node.forEach(decodeNode);
+        } else if (node && typeof node === "object") {
+            for (const key in node) {
+                const value = node[key];
+                if (!keys.has(key))
+                    decodeNode(value);
+                else if (value && typeof value === "object" && !Array.isArray(value)) {
+                    for (const k in value)
+                        value[k] = decodeString(value[k],strings);
+                } else
+                    node[key] = decodeString(value,strings);
+            }
+        }
+    }
+
+    delete database.stringTable;
+    decodeNode(database);
+    return database;
+}
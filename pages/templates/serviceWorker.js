@@ -0,0 +1,59 @@
+// The service worker sw.js, written by Prototype.py from templates/serviceWorker.js when --serviceWorker is given.
+// Cache the files listed in PRECACHE so that the site shell, assets, and main index pages load without the network.
+// Each file is cached under its url and md5 hash, so after a new build only the files whose hash changed are fetched again.
+
+const PRECACHE = $!precache!$; // [{url, md5, size}]; urls are relative to this script
+const UNREGISTER = $!unregister!$; // Remove this service worker and its cache; written when --serviceWorker is turned off
+const CACHE_NAME = "precache";
+
+function cacheKey(entry) {
+	// The cache stores each file under its url with its hash in the query string
+	return new URL(entry.url + "?md5=" + entry.md5,self.location).href;
+}
+
+const keyOfPath = new Map(PRECACHE.map((entry) => [new URL(entry.url,self.location).pathname,cacheKey(entry)]));
+const indexEntry = PRECACHE.find((entry) => entry.url == "index.html");
+if (indexEntry) // Requests for the directory return index.html
+	keyOfPath.set(new URL("./",self.location).pathname,cacheKey(indexEntry));
+
+self.addEventListener("install",(event) => {
+	event.waitUntil(caches.open(CACHE_NAME).then(async (cache) => {
+		const cached = new Set((await cache.keys()).map((request) => request.url));
+		await Promise.all(PRECACHE.filter((entry) => !cached.has(cacheKey(entry))).map(async (entry) => {
+			const response = await fetch(new URL(entry.url,self.location),{cache: "no-cache"});
+			if (!response.ok)
+				throw new Error(`Unable to precache ${entry.url}: ${response.status}`);
+			await cache.put(cacheKey(entry),response);
+		}));
+	}).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate",(event) => {
+	event.waitUntil((async () => {
+		if (UNREGISTER) {
+			await caches.delete(CACHE_NAME);
+			await self.registration.unregister();
+			return;
+		}
+		// Delete files from previous builds
+		const current = new Set(keyOfPath.values());
+		const cache = await caches.open(CACHE_NAME);
+		for (const request of await cache.keys()) {
+			if (!current.has(request.url))
+				await cache.delete(request);
+		}
+		await self.clients.claim();
+	})());
+});
+
+self.addEventListener("fetch",(event) => {
+	const url = new URL(event.request.url);
+	if (event.request.method != "GET" || url.origin != self.location.origin)
+		return;
+	const key = keyOfPath.get(url.pathname);
+	if (!key)
+		return; // Let the browser fetch files that aren't precached
+	event.respondWith(caches.open(CACHE_NAME)
+		.then((cache) => cache.match(key))
+		.then((response) => response || fetch(event.request)));
+});
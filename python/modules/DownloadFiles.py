@@ -17,7 +17,7 @@ def DownloadItems(items: Iterable[dict]) -> int:
         if Link.DownloadItem(item):
                 downloadCount += 1
 
-    with Utils.ConditionalThreader() as pool:
+    with Link.OpenHttpClient(), Utils.ConditionalThreader() as pool:
         for item in items:
             pool.submit(DownloadItem,item)
     
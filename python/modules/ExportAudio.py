@@ -1,26 +1,135 @@
-"""A template for creating new modules.
-"""
+"""Export the audio files of selected excerpts and a catalog to a directory outside the website.
+Files are copied, hard linked, or reflinked in parallel; files which haven't changed since the last export
+are skipped. ExportManifest.json lists the exported files so that files no longer selected can be deleted."""
 
 from __future__ import annotations
 
-import os, shutil
+import os, shutil, json, contextlib
+from collections import Counter
 from typing import TextIO, NamedTuple, Iterable
-import Utils, Alert
+import Utils, Alert, LocalMp3, Mp3Frames
 import ReviewDatabase, Database, Filter, Link
 
-def CopyExcerptAudio(excerpt: dict[str],path: str) -> None:
-    "Copy the audio file associated with excerpt to a given path."
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
+
+FICLONE = 0x40049409 # Linux ioctl to share the data blocks of one file with another on btrfs, XFS, etc.
+MANIFEST_FILE = "ExportManifest.json"
+
+ExportPlan = dict[str,str] # Maps each exported file (relative to --exportPath) to its source file
+
+def CopyExcerptAudio(excerpt: dict[str],path: str,plan: ExportPlan) -> None:
+    "Add the audio file associated with excerpt to plan so that it will be exported to a given path."
 
     if gOptions.exportCatalogOnly:
         return
-    os.makedirs(path,exist_ok=True)
     audioFile = Link.LocalFile(excerpt)
     if audioFile:
-        shutil.copy2(audioFile,Utils.PosixJoin(path,Utils.PosixSplit(audioFile)[1]))
+        with contextlib.suppress(OSError,Mp3Frames.Mp3FormatError):
+            if LocalMp3.Read(audioFile,Link.gLocalMp3Cache).clips != json.dumps(excerpt["clips"]):
+                Alert.caution("The clips tag of",audioFile,"doesn't match",excerpt,"; the exported audio may be out of date.")
+        destination = Utils.PosixJoin(os.path.relpath(path,gOptions.exportPath),Utils.PosixSplit(audioFile)[1])
+        plan[os.path.normpath(destination).replace(os.sep,"/")] = audioFile
     else:
         Alert.warning("Could not copy audio file for",excerpt)
 
-def ExportFeaturedExcerptsBySubtopic(catalog: TextIO) -> int:
+def Reflink(source: str,destination: str) -> None:
+    """Create destination sharing the data blocks of source if the file system supports it.
+    Otherwise ask the kernel to copy the data with copy_file_range, which still avoids copying it
+    through user space. Fall back to an ordinary copy if neither is available."""
+
+    with open(source,"rb") as sourceFile, open(destination,"wb") as destFile:
+        if fcntl:
+            try:
+                fcntl.ioctl(destFile.fileno(),FICLONE,sourceFile.fileno())
+                return
+            except OSError:
+                pass
+        if hasattr(os,"copy_file_range"):
+            try:
+                remaining = os.fstat(sourceFile.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(sourceFile.fileno(),destFile.fileno(),remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining <= 0:
+                    return
+            except OSError:
+                pass
+            sourceFile.seek(0)
+            destFile.seek(0)
+            destFile.truncate()
+        shutil.copyfileobj(sourceFile,destFile)
+
+def ExportFile(source: str,destination: str,mode: str,skipUnchanged: bool = True) -> str:
+    """Export source to destination using mode "copy", "hardlink", or "reflink".
+    If skipUnchanged, skip files whose size and modification time already match. Return what we did:
+    "unchanged", "linked", "reflinked", or "copied", which is also the result if a hard link can't be created."""
+
+    sourceStat = os.stat(source)
+    with contextlib.suppress(FileNotFoundError):
+        destStat = os.stat(destination)
+        if skipUnchanged and destStat.st_size == sourceStat.st_size and destStat.st_mtime_ns == sourceStat.st_mtime_ns:
+            return "unchanged"
+        os.remove(destination)
+
+    os.makedirs(Utils.PosixSplit(destination)[0],exist_ok=True)
+    if mode == "hardlink":
+        try:
+            os.link(source,destination)
+            return "linked"
+        except OSError: # e.g. the export path is on a different file system
+            pass
+    elif mode == "reflink":
+        Reflink(source,destination)
+        shutil.copystat(source,destination)
+        return "reflinked"
+    
+    shutil.copy2(source,destination)
+    return "copied"
+
+def ExportPlannedFiles(plan: ExportPlan) -> None:
+    """Export the files in plan in parallel, delete files exported previously which are no longer in plan,
+    and write a manifest of the exported files."""
+
+    manifestPath = Utils.PosixJoin(gOptions.exportPath,MANIFEST_FILE)
+    try:
+        with open(manifestPath,encoding="utf-8") as file:
+            oldManifest = json.load(file)
+        oldFiles,oldMode = oldManifest["files"],oldManifest["mode"]
+    except (OSError,ValueError,KeyError):
+        oldFiles,oldMode = {},None
+    skipUnchanged = oldMode == gOptions.exportMode # Export all files again if the mode has changed
+    
+    results = Counter()
+    with Utils.ConditionalThreader() as pool:
+        jobs = {destination:pool.submit(ExportFile,source,Utils.PosixJoin(gOptions.exportPath,destination),gOptions.exportMode,skipUnchanged)
+                for destination,source in plan.items()}
+    
+    manifest = {}
+    for destination,job in jobs.items():
+        try:
+            results[job.result()] += 1
+        except OSError as error:
+            Alert.warning(error,"when exporting",plan[destination])
+            results["failed"] += 1
+            continue
+        stat = os.stat(Utils.PosixJoin(gOptions.exportPath,destination))
+        manifest[destination] = {"source":plan[destination],"size":stat.st_size,"mtime":stat.st_mtime_ns}
+
+    for destination in oldFiles.keys() - plan.keys():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(Utils.PosixJoin(gOptions.exportPath,destination))
+            results["deleted"] += 1
+
+    with open(manifestPath,"w",encoding="utf-8") as file:
+        json.dump({"mode":gOptions.exportMode,"files":manifest},file,ensure_ascii=False,indent=2)
+    Alert.extra("Export results:",", ".join(f"{action}: {count}" for action,count in sorted(results.items())))
+
+def ExportFeaturedExcerptsBySubtopic(catalog: TextIO,plan: ExportPlan) -> int:
     """Copy the audio files for featured excerpts into a directory structure organized by subtopic.
     The --exportFTagFilter options specify with subtopics and tags to export.
     Returns the number of excerpts exported."""
@@ -48,7 +157,7 @@ def ExportFeaturedExcerptsBySubtopic(catalog: TextIO) -> int:
 
         path = Utils.PosixJoin(gOptions.exportPath,"subtopics" if isSubtopic else "tags",Utils.slugify(subtopicOrTag["tag"]))
         for excerpt in featuredExcerpts:
-            CopyExcerptAudio(excerpt,path)
+            CopyExcerptAudio(excerpt,path,plan)
     return exportCount
 
 def CatalogLine(excerpt: dict[str], header:bool=False) -> str:
@@ -68,7 +177,7 @@ def CatalogLine(excerpt: dict[str], header:bool=False) -> str:
     
     return "\n".join(lines)
 
-def ExportExcerpts(catalog: TextIO) -> int:
+def ExportExcerpts(catalog: TextIO,plan: ExportPlan) -> int:
     """Export excerpts specified by the various --exportFilter options.
     Returns the number of excerpts exported"""
 
@@ -82,7 +191,7 @@ def ExportExcerpts(catalog: TextIO) -> int:
         print(CatalogLine(excerpt,header=firstLine),file=catalog)
         firstLine = False
 
-        CopyExcerptAudio(excerpt,gOptions.exportPath)
+        CopyExcerptAudio(excerpt,gOptions.exportPath,plan)
         exportCount += 1
     return exportCount
 
@@ -90,6 +199,7 @@ def AddArguments(parser) -> None:
     "Add command-line arguments used by this module"
     parser.add_argument('--exportPath',type=str,default="../exportedAudio",help="Directory to export audio to.")
     parser.add_argument('--exportCatalogOnly',**Utils.STORE_TRUE,help='Write Catalog.tsv without copying any files.')
+    parser.add_argument('--exportMode',type=str,default="copy",choices=["copy","hardlink","reflink"],help="Export files by copying them, creating hard links, or creating reflinks (copy-on-write clones); default: copy")
     parser.add_argument('--exportFilterFlags',type=str,default="",help="Export excerpts with one or more of these flags.")
 
 def ParseArguments() -> None:
@@ -103,17 +213,22 @@ gDatabase:dict[str] = {} # These globals are overwritten by QSArchive.py, but we
 
 def main() -> None:
     os.makedirs(gOptions.exportPath,exist_ok=True)
-    with open(Utils.PosixJoin(gOptions.exportPath,"Catalog.tsv"),mode="w",encoding="utf-8") as catalog:
+    plan:ExportPlan = {}
+    with (open(Utils.PosixJoin(gOptions.exportPath,"Catalog.tsv"),mode="w",encoding="utf-8") as catalog,
+          Link.OpenLocalMp3Cache()):
         exportMode = "subtopic"
         for option in ["exportFilterFlags"]:
             if getattr(gOptions,option):
                 exportMode = "flat"
 
         if exportMode == "subtopic":
-            count = ExportFeaturedExcerptsBySubtopic(catalog)
+            count = ExportFeaturedExcerptsBySubtopic(catalog,plan)
         else:
-            count = ExportExcerpts(catalog)
+            count = ExportExcerpts(catalog,plan)
     
+    if not gOptions.exportCatalogOnly:
+        ExportPlannedFiles(plan)
+
     if gOptions.exportCatalogOnly:
         Alert.info("Created catalog file listing",count,"excerpts.")
     else:
@@ -0,0 +1,193 @@
+"""Copy the website's javascript, css, and json assets to file names containing their md5 hash
+(e.g. search.js -> search.0f3a9c21d4.js) so that web servers can send them with immutable, year-long cache headers.
+assets/AssetManifest.json maps each asset to its fingerprinted copy. Prototype links to the copies listed in the
+manifest, and index.html maps javascript module imports to them with an import map.
+Copies from the previous build are kept so that browsers holding an old index.html can still load them, as are older
+copies still linked to by html pages that recent builds haven't rewritten.
+Prototype copies the assets in PAGE_ASSETS before writing pages so that the pages link to the current copies."""
+
+from __future__ import annotations
+
+import os, json, re, hashlib, contextlib
+import Utils, Alert, FileRegister, Prototype
+
+MANIFEST_FILE = "assets/AssetManifest.json" # Relative to prototypeDir
+MANIFEST_VERSION = 1
+HASH_LENGTH = 10 # Hex digits of the md5 hash added to file names
+FINGERPRINTED_ASSETS = [ # Relative to prototypeDir. Assets may refer only to the json and css assets listed before them.
+    "assets/SearchDatabase.json","assets/SearchIndex.json","assets/RandomExcerpts.json",
+    "style.css",
+    "path.js","stringTable.js","toggle-view.js","search.js","randomExcerpt.js","frame.js","audioPlayer.js","audioChip.js"
+]
+PAGE_ASSETS = ["style.css"] # Assets linked to by every html page; see pages/templates/Global.html
+REWRITE_REFERENCES_IN = r".*\.js$" # Replace references to other assets in these files
+REFERENCED_ASSETS = r".*\.(json|css)$" # Javascript modules import each other in cycles, so index.html uses an import map instead
+
+def FingerprintedName(asset: str,md5: str) -> str:
+    "Return the name of the fingerprinted copy of asset."
+    return Utils.AppendToFilename(asset,"." + md5[:HASH_LENGTH])
+
+def EmptyManifest() -> dict:
+    return {"version":MANIFEST_VERSION,"assets":{},"retired":[]}
+
+def ReadManifest() -> dict:
+    """Return the contents of the asset manifest or an empty manifest if there is none.
+    Key "assets" maps each asset to a dict with keys:
+        file: the fingerprinted copy
+        source: the md5 hash of the asset when it was copied
+        refersTo: the assets whose fingerprinted names were substituted into the copy
+    Key "retired" lists the copies of the previous build which are no longer current."""
+    try:
+        with open(Utils.PosixJoin(gOptions.prototypeDir,MANIFEST_FILE),encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (FileNotFoundError,json.JSONDecodeError):
+        return EmptyManifest()
+    if manifest.get("version") != MANIFEST_VERSION:
+        return EmptyManifest()
+    return manifest
+
+def SourceHash(asset: str,writer: FileRegister.HashWriter) -> str|None:
+    """Return the md5 hash of asset. Use the hash recorded by writer if writer wrote the file and it hasn't changed since.
+    Return None if asset doesn't exist."""
+    path = Utils.PosixJoin(gOptions.prototypeDir,asset)
+    if path in writer.record and not writer.UpdatedOnDisk(path):
+        return writer.record[path]["md5"]
+    try:
+        return FileRegister.FileHash(path)
+    except FileNotFoundError:
+        return None
+
+def CopyIsCurrent(entry: dict,source: str,names: dict[str,str],writer: FileRegister.HashWriter) -> bool:
+    "Is the copy described by manifest entry up to date given the source hash and the current names of the assets it refers to?"
+    path = Utils.PosixJoin(gOptions.prototypeDir,entry["file"])
+    return (entry["source"] == source and all(ref in names for ref in entry["refersTo"])
+            and path in writer.record and not writer.UpdatedOnDisk(path))
+
+def CurrentNames() -> dict[str,str]:
+    """Return a dict mapping each asset in the manifest to its fingerprinted copy.
+    Omit assets which have changed since they were copied, assets which refer to them, and missing copies.
+    The remaining assets can safely be linked to by their fingerprinted names."""
+    manifest = ReadManifest()
+    writer = Prototype.AssetWriter()
+    names = {}
+    for asset,entry in manifest["assets"].items(): # Assets are listed in dependency order
+        if CopyIsCurrent(entry,SourceHash(asset,writer),names,writer):
+            names[asset] = entry["file"]
+    return names
+
+def RewriteReferences(text: str,names: dict[str,str]) -> tuple[str,list[str]]:
+    """Replace quoted references such as './assets/SearchDatabase.json' with the fingerprinted copies in names.
+    Return the new text and the assets referred to."""
+    refersTo = []
+    for asset,copy in names.items():
+        if re.match(REFERENCED_ASSETS,asset):
+            text,count = re.subn(r"(?<=[\"'/])" + re.escape(asset) + r"(?=[\"'])",copy,text)
+            if count:
+                refersTo.append(asset)
+    return text,refersTo
+
+def CopyAsset(asset: str,source: str,names: dict[str,str],writer: FileRegister.HashWriter) -> dict:
+    "Write the fingerprinted copy of asset, whose md5 hash is source, and return its manifest entry."
+    with open(Utils.PosixJoin(gOptions.prototypeDir,asset),"rb") as file:
+        contents = file.read()
+    refersTo = []
+    if re.match(REWRITE_REFERENCES_IN,asset):
+        text,refersTo = RewriteReferences(contents.decode("utf-8"),names)
+        contents = text.encode("utf-8")
+    entry = {"file":FingerprintedName(asset,hashlib.md5(contents,usedforsecurity=False).hexdigest()),
+             "source":source,"refersTo":refersTo}
+    writer.WriteBinaryFile(Utils.PosixJoin(gOptions.prototypeDir,entry["file"]),contents)
+    return entry
+
+def PageAssetNames() -> dict[str,str]:
+    """Return CurrentNames() after copying any assets in PAGE_ASSETS which have changed since they were last copied.
+    Prototype calls this before writing pages. Otherwise pages would link to style.css itself after it changes
+    and then be rewritten again to link to its copy after the next build."""
+    names = CurrentNames()
+    with Prototype.AssetWriter() as writer:
+        for asset in PAGE_ASSETS:
+            if asset not in names:
+                source = SourceHash(asset,writer)
+                if source is not None:
+                    names[asset] = CopyAsset(asset,source,names,writer)["file"]
+    return names
+
+def CopiesLinkedFromPages(copies: set[str]) -> set[str]:
+    """Return the copies (relative to prototypeDir) linked to by the html pages registered by Prototype.
+    Targeted builds, --buildOnly, and --keepOldHtmlFiles leave pages which link to copies made by earlier builds."""
+    if not copies:
+        return set()
+    pattern = re.compile("|".join(re.escape(Utils.PosixSplit(copy)[1]) for copy in copies))
+    pages = FileRegister.FileRegister(gOptions.prototypeDir,"assets/HashCache.json")
+    linked = set()
+    for page in pages.record:
+        if page.endswith(".html"):
+            try:
+                html = Utils.ReadFile(Utils.PosixJoin(gOptions.prototypeDir,page))
+            except FileNotFoundError:
+                continue
+            linked.update(pattern.findall(html))
+            if len(linked) == len(copies):
+                break
+    return set(copy for copy in copies if Utils.PosixSplit(copy)[1] in linked)
+
+def DeleteCopy(path: str,writer: FileRegister.HashWriter) -> None:
+    "Delete a fingerprinted copy and its compressed copies."
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    FileRegister.RemoveCompressedCopies(path)
+    writer.record.pop(path,None)
+
+def AddArguments(parser) -> None:
+    "Add command-line arguments used by this module"
+    pass
+
+def ParseArguments() -> None:
+    pass
+
+def Initialize() -> None:
+    pass
+
+gOptions = None
+gDatabase:dict[str] = {} # These globals are overwritten by QSArchive.py, but we define them to keep Pylance happy
+
+def main() -> None:
+    oldManifest = ReadManifest()
+    manifest = EmptyManifest()
+    names = {}
+    copied = 0
+    with Prototype.AssetWriter() as writer:
+        for asset in FINGERPRINTED_ASSETS:
+            source = SourceHash(asset,writer)
+            if source is None:
+                Alert.caution(f"Cannot fingerprint {asset} because it doesn't exist.")
+                continue
+
+            oldEntry = oldManifest["assets"].get(asset)
+            if oldEntry and CopyIsCurrent(oldEntry,source,names,writer) and all(names[ref] == oldManifest["assets"][ref]["file"] for ref in oldEntry["refersTo"]):
+                writer.SetStatus(Utils.PosixJoin(gOptions.prototypeDir,oldEntry["file"]),FileRegister.Status.UNCHANGED)
+                entry = oldEntry
+            else:
+                entry = CopyAsset(asset,source,names,writer)
+                copied += 1
+
+            manifest["assets"][asset] = entry
+            names[asset] = entry["file"]
+
+        # Keep the copies of the previous build for browsers that haven't reloaded index.html; delete older ones
+        # unless html pages still link to them.
+        currentFiles = set(names.values())
+        previousFiles = set(e["file"] for e in oldManifest["assets"].values()) - currentFiles
+        olderFiles = set(oldManifest["retired"]) - currentFiles - previousFiles
+        linkedFiles = CopiesLinkedFromPages(olderFiles)
+        manifest["retired"] = sorted(previousFiles | linkedFiles)
+        deleted = 0
+        for file in olderFiles - linkedFiles:
+            DeleteCopy(Utils.PosixJoin(gOptions.prototypeDir,file),writer)
+            deleted += 1
+
+        writer.WriteTextFile(Utils.PosixJoin(gOptions.prototypeDir,MANIFEST_FILE),json.dumps(manifest,indent=2))
+
+    Alert.extra(f"Fingerprinted {len(names)} assets; copied {copied} changed asset(s); deleted {deleted} old copies.")
+
+    Prototype.UpdateIndexPage()
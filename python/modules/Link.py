@@ -4,19 +4,17 @@ LinkValidator and its subclasses determine whether a given hyperlink is valid.
 
 from __future__ import annotations
 
-import os
-from functools import reduce
-from datetime import timedelta
+import os, posixpath, asyncio, threading, itertools
+from datetime import timedelta, datetime
 from io import BytesIO
 import Database
 import Mp3DirectCut
-import Utils, Alert
+import Utils, Alert, AsyncHttp, FileRegister, Mp3Frames, RemoteMp3, LocalMp3, Mp3Index, Download
 from urllib.parse import urljoin,urlparse,quote,urlunparse
 import urllib.request, urllib.error
 import shutil
-import mutagen, mutagen.id3, mutagen.easyid3, mutagen.mp3
 import json
-from typing import Tuple, Type, Callable, Iterable, BinaryIO
+from typing import Tuple, Type, Callable, Iterable, Iterator, BinaryIO, Mapping, Awaitable, TypeVar
 from enum import Enum
 from collections import Counter
 import copy
@@ -53,15 +51,24 @@ class LinkValidator:
         else:
             return os.path.isfile(url)
     
+    async def ValidLinkAsync(self,url:str,item:dict,client:AsyncHttp.AsyncHttpClient) -> bool:
+        """The asynchronous version of ValidLink used by LinkItems.
+        This class doesn't access the network, so we simply call ValidLink."""
+        return self.ValidLink(url,item)
+
     def DownloadValidLink(self,url:str,item:dict,downloadLocation:str) -> bool:
         """If the link is valid, download the file to downloadLoaction.
-        Return True if the link is valid and the file has been sucessfully downloaded."""
+        Return True if the link is valid and the file has been sucessfully downloaded.
+        Remote files are streamed by Download.DownloadToFile, which resumes a partial file left at downloadLocation."""
 
         if self.ValidLink(url,item):
             try:
                 os.makedirs(Utils.PosixSplit(downloadLocation)[0],exist_ok=True)
-                with (Utils.OpenUrlOrFile(url) as remoteFile, open(downloadLocation,"wb") as localFile):
-                    shutil.copyfileobj(remoteFile, localFile)
+                if Utils.RemoteURL(url):
+                    Download.DownloadToFile(Utils.QuotePath(url),downloadLocation,retries=gOptions.linkRetries)
+                else:
+                    with (open(url,"rb") as remoteFile, open(downloadLocation,"wb") as localFile):
+                        shutil.copyfileobj(remoteFile, localFile)
                 return True
             except (OSError,urllib.error.HTTPError) as error:
                 Alert.warning("Error",error,"when trying to download",item,"from",url)
@@ -80,6 +87,7 @@ class RemoteURLChecker(LinkValidator):
     Subclasses can override ValidateContents to implement additional checks."""
     
     openLocalFiles: bool # Do we open local files as well as remote ones?
+    contentBytes: int|None = 0 # The number of bytes ValidateContents needs: 0 = headers only; None = the entire file
 
     def __init__(self,openLocalFiles = False):
         self.openLocalFiles = openLocalFiles
@@ -89,10 +97,19 @@ class RemoteURLChecker(LinkValidator):
             return False
         if Utils.RemoteURL(url):
             url = Utils.QuotePath(url)
+            trusted,conditionalHeaders = self.CachedResult(url,item)
+            if trusted:
+                return True
             try:
-                with urllib.request.urlopen(url) as request:
-                    return self.ValidateContents(url,item,request)
+                with urllib.request.urlopen(urllib.request.Request(url,headers=conditionalHeaders)) as request:
+                    valid = self.ValidateContents(url,item,request)
+                    self.RecordResult(url,item,valid,request.headers)
+                    return valid
             except urllib.error.HTTPError as error:
+                if error.code == 304: # Not modified since we last validated it
+                    self.RecordResult(url,item,True,error.headers)
+                    return True
+                self.RecordResult(url,item,False,error.headers)
                 Alert.warning(error,"when opening",url,"when processing",item)
                 return False
 
@@ -109,101 +126,183 @@ class RemoteURLChecker(LinkValidator):
             else:
                 return super().ValidLink(url,item)
     
+    async def ValidLinkAsync(self,url:str,item:dict,client:AsyncHttp.AsyncHttpClient) -> bool:
+        """Check remote URLs using client, which keeps connections to each host alive.
+        Send a HEAD request or ask for only the first contentBytes of the file if possible."""
+        if not url.strip() or not Utils.RemoteURL(url):
+            return self.ValidLink(url,item)
+        
+        url = Utils.QuotePath(url)
+        trusted,conditionalHeaders = self.CachedResult(url,item)
+        if trusted:
+            return True
+        
+        if self.contentBytes == 0:
+            response = await client.Request("HEAD",url,conditionalHeaders)
+            if response.status in (405,501): # The server doesn't implement HEAD
+                response = await client.Request("GET",url,{"Range":"bytes=0-0"} | conditionalHeaders,maxBody=1)
+        elif self.contentBytes:
+            response = await client.Request("GET",url,{"Range":f"bytes=0-{self.contentBytes - 1}"} | conditionalHeaders,maxBody=self.contentBytes)
+        else:
+            response = await client.Request("GET",url,conditionalHeaders)
+        
+        if response.status == 304: # Not modified since we last validated it
+            self.RecordResult(url,item,True,response.headers)
+            return True
+        if not response.Ok():
+            self.RecordResult(url,item,False,response.headers)
+            Alert.warning(f"HTTP Error {response.status}: {response.reason}","when opening",url,"when processing",item)
+            return False
+        valid = self.ValidateContents(url,item,BytesIO(response.body))
+        self.RecordResult(url,item,valid,response.headers)
+        return valid
+
+    def Fingerprint(self,item: dict) -> str:
+        """Return a string describing the parts of item that ValidateContents checks.
+        Cached results are used only if the fingerprint hasn't changed."""
+        return ""
+
+    def CachedResult(self,url:str,item:dict) -> tuple[bool,dict[str,str]]:
+        """Look for a previous valid result for url and item in gLinkCache.
+        Return (True,{}) if it was validated within --linkCacheDays, so we can trust it without contacting the server.
+        Otherwise return False and the headers needed to revalidate it with a conditional request."""
+        if gLinkCache is None:
+            return False,{}
+        record = gLinkCache.ValidRecord(url,type(self).__name__,self.Fingerprint(item))
+        if not record:
+            return False,{}
+        if datetime.now() - record["_modified"] < timedelta(days=gOptions.linkCacheDays):
+            return True,{}
+        
+        headers = {}
+        if record["etag"]:
+            headers["If-None-Match"] = record["etag"]
+        if record["lastModified"]:
+            headers["If-Modified-Since"] = record["lastModified"]
+        return False,headers
+
+    def RecordResult(self,url:str,item:dict,valid:bool,headers:Mapping[str,str]) -> None:
+        """Record the result of validating url in gLinkCache. headers are the HTTP response headers."""
+        if gLinkCache is None:
+            return
+        if not valid:
+            gLinkCache.Forget(url)
+            return
+        
+        previous = gLinkCache.record.get(url,{})
+        size = headers.get("content-range","").rpartition("/")[2] or headers.get("content-length","")
+        gLinkCache.RecordValid(url,type(self).__name__,self.Fingerprint(item),
+                               size=int(size) if size.isdigit() else previous.get("size"),
+                               etag=headers.get("etag") or previous.get("etag",""),
+                               lastModified=headers.get("last-modified") or previous.get("lastModified",""))
+
     def ValidateContents(self,url:str,item:dict,contents:BinaryIO) -> bool:
         """This method should be overriden by subclasses that validate file contents."""
         return True
 
-def RemoteMp3Tags(url:str) -> dict:
-    """Read the id3 tags from a remote mp3 file.
-    From https://stackoverflow.com/questions/26889317/extract-id3-tags-of-a-mp3-url-with-partial-download-using-python"""
-    def get_n_bytes(url, size):
-        req = urllib.request.Request(url)
-        req.headers['Range'] = 'bytes=%s-%s' % (0, size-1)
-        response = urllib.request.urlopen(req)
-        return response.read()
-
-    data = get_n_bytes(url, 10)
-    if data[0:3] != 'ID3':
-        return {} # raise Exception('ID3 not in front of mp3 file')
-
-    size_encoded = bytearray(data[-4:])
-    size = reduce(lambda a,b: a*128+b, size_encoded, 0)
-
-    header = BytesIO()
-    # mutagen needs one full frame in order to function. Add max frame size
-    data = get_n_bytes(url, size+2881) 
-    header.write(data)
-    header.seek(0)
-    mp3 = mutagen.mp3.EasyMP3(header)
-    return mp3.tags
-
-    if f.tags and 'APIC:' in f.tags.keys():
-        artwork = f.tags['APIC:'].data
-        with open('image.jpg', 'wb') as img:
-            img.write(artwork)
-
-class Mp3ClipChecker(RemoteURLChecker):
-    """Read the ID3 CLIP tag created by SplitMp3 and verify that it matches the excerpt clips field."""
-    trustCache: bool    # If true, use cached ID3 tags rather than reading the file
+class Mp3Checker(RemoteURLChecker):
+    """Base class for validators that check mp3 files.
+    Rather than downloading remote files, read their duration and ID3 CLIP tag with a few small
+    Range requests (RemoteMp3.Inspect) and pass them to ValidateMp3.
+    Local files are read by LocalMp3.Read, which reopens only files that have changed since they were
+    recorded in gLocalMp3Cache."""
+    trustCache = False  # If true, use cached information about local files rather than checking whether they have changed
 
-    def __init__(self,trustCache = False):
+    def __init__(self):
         super().__init__(openLocalFiles=True)
-        self.trustCache = trustCache
-
-    def ValidateContents(self, url: str, item: dict, contents: BinaryIO) -> bool:
-
-        header = contents
-        try:
-            header.seek(0)
-        except OSError: # If contents is an http request, it doesn't support seek, so read the ID3 header.
-            header = BytesIO()
-            header.write(contents.read(64000)) # The first 64K should contain the entire header. (Our mp3s don't have album art.)
-            header.seek(0)
 
+    def ValidLink(self,url:str,item:dict) -> bool:
+        if not url.strip():
+            return False
+        if Utils.RemoteURL(url):
+            return RunWithHttpClient(lambda client: self.ValidLinkAsync(url,item,client))
+        if not os.path.isfile(url):
+            return False
+        
         try:
-            tags = mutagen.easyid3.EasyID3(header)
-        except (OSError, mutagen.MutagenError) as error:
+            mp3 = LocalMp3.Read(url,gLocalMp3Cache,self.trustCache)
+        except (OSError,Mp3Frames.Mp3FormatError) as error:
             Alert.notice("Unable to open",url,"for",item,". Error:",error)
             return False
+        return self.ValidateMp3(url,item,mp3)
+
+    async def ValidLinkAsync(self,url:str,item:dict,client:AsyncHttp.AsyncHttpClient) -> bool:
+        if not url.strip() or not Utils.RemoteURL(url):
+            return self.ValidLink(url,item)
+
+        url = Utils.QuotePath(url)
+        trusted,_ = self.CachedResult(url,item)
+        if trusted:
+            return True
 
-        if "clips" not in tags:
+        try:
+            mp3 = await RemoteMp3.Inspect(url,client,gMp3InfoCache)
+        except Mp3Frames.Mp3FormatError as error:
+            Alert.warning(error,"when reading",url,"when processing",item)
+            self.RecordResult(url,item,False,{})
+            return False
+        if not mp3.Ok():
+            self.RecordResult(url,item,False,mp3.headers)
+            Alert.warning(f"HTTP Error {mp3.status}: {mp3.reason}","when opening",url,"when processing",item)
             return False
         
-        excerptClipsStr = json.dumps(item["clips"])
-        oldClipStr = tags.get("clips",[None])[0]
-        return oldClipStr == excerptClipsStr
+        valid = self.ValidateMp3(url,item,mp3)
+        self.RecordResult(url,item,valid,mp3.headers)
+        return valid
+
+    def ValidateMp3(self,url:str,item:dict,mp3:RemoteMp3.RemoteMp3|LocalMp3.LocalMp3) -> bool:
+        """Validate an mp3 file given its duration and tags. Subclasses should override this."""
+        return True
+
+class Mp3ClipChecker(Mp3Checker):
+    """Read the ID3 CLIP tag created by SplitMp3 and verify that it matches the excerpt clips field."""
+
+    def __init__(self,trustCache = False):
+        super().__init__()
+        self.trustCache = trustCache
+
+    def Fingerprint(self,item: dict) -> str:
+        return json.dumps(item["clips"])
 
-class Mp3LengthChecker(RemoteURLChecker):
+    def ValidateMp3(self,url:str,item:dict,mp3:RemoteMp3.RemoteMp3|LocalMp3.LocalMp3) -> bool:
+        return mp3.clips == json.dumps(item["clips"])
+
+class Mp3LengthChecker(Mp3Checker):
     """Verify that the length of mp3 files is what we expect it to be."""
     
     warningDelta: float # Print a notice if the mp3 file length difference exceeds this
     invalidateDelta: float # Report an invalid link if the mp3 file length difference exceeds this
     def __init__(self,warningDelta: float = 1.0,invalidateDelta = 5.0):
-        super().__init__(openLocalFiles=True)
+        super().__init__()
         self.warningDelta = warningDelta
         self.invalidateDelta = invalidateDelta
 
-    def ValidateContents(self,url:str,item:dict,contents:BinaryIO) -> bool:
-        parsed = urlparse(url)
-        if not parsed.path.lower().endswith(".mp3"):
-            return True,contents
-        
-        try:
-            contents.seek(0)
-            data = contents
-        except IOError:
-            data = BytesIO()
-            data.write(contents.read())
-            data.seek(0)
-
-        audio = mutagen.mp3.MP3(data)
-        length = audio.info.length
+    def Fingerprint(self,item: dict) -> str:
+        return item.get("duration","0")
+
+    def ValidLink(self,url:str,item:dict) -> bool:
+        if not urlparse(url).path.lower().endswith(".mp3"):
+            return RemoteURLChecker.ValidLink(self,url,item) # Check only that other files exist
+        return super().ValidLink(url,item)
+
+    async def ValidLinkAsync(self,url:str,item:dict,client:AsyncHttp.AsyncHttpClient) -> bool:
+        if not urlparse(url).path.lower().endswith(".mp3"):
+            return await RemoteURLChecker.ValidLinkAsync(self,url,item,client)
+        return await super().ValidLinkAsync(url,item,client)
+
+    def ValidateMp3(self,url:str,item:dict,mp3:RemoteMp3.RemoteMp3|LocalMp3.LocalMp3) -> bool:
+        duration = mp3.duration
+        if isinstance(mp3,LocalMp3.LocalMp3) and gFrameIndexCache is not None:
+            duration = Mp3Index.Duration(url,gFrameIndexCache) or duration # Prefer the exact duration if the file has been indexed
+        return self.CheckLength(url,item,duration)
+
+    def CheckLength(self,url:str,item:dict,length:float) -> bool:
+        "Compare the length of the mp3 file with the item duration."
         expectedLengthStr = item.get("duration","0")
         expectedLength = Mp3DirectCut.ToTimeDelta(expectedLengthStr).total_seconds()
         diff = abs(length - expectedLength)
         lengthStr = Mp3DirectCut.TimeDeltaToStr(timedelta(seconds=length),decimal=True)
         
-        data.seek(0)
         if diff >= self.invalidateDelta:
             Alert.warning(item,"indicates a duration of",expectedLengthStr,"but its mp3 file has duration",lengthStr,"This invalidates",url)
             return False
@@ -336,6 +435,28 @@ class Linker:
         item["mirror"] = ""
         return ""
     
+    async def LinkItemAsync(self,item: dict,client: AsyncHttp.AsyncHttpClient) -> str:
+        """The asynchronous version of LinkItem, which checks remote links using client."""
+
+        if not LinkableItem(item):
+            return ""
+        currentMirror = item.get("mirror","")
+        if currentMirror and not currentMirror.endswith("*"):
+            return item["mirror"]
+
+        for mirror in self._UncheckedMirrors(item):
+            mirrorToCheck = self.CheckUploadMirror(mirror,item)
+            url = self.URL(item,mirrorToCheck)
+            try:
+                if await self.mirrorValidator[mirrorToCheck].ValidLinkAsync(url,item,client):
+                    item["mirror"] = mirror
+                    return mirror
+            except OSError as error:
+                Alert.warning(error,"when trying to access",url,"for item",item)
+        
+        item["mirror"] = ""
+        return ""
+    
     def LocalItemNeeded(self,item: dict) -> bool:
         """Check through the available mirrors until we either reach a valid item, the local mirror, or the upload mirror.
         In the latter two cases, report true and stop the search so that a local item can be acquired."""
@@ -444,16 +565,40 @@ def LinkableItem(item: dict) -> bool:
     
     return True
 
+async def LinkItemsAsync(client: AsyncHttp.AsyncHttpClient) -> None:
+    """Check the links of all items concurrently using client, which keeps connections to each host alive."""
+
+    tasks = [(item,gLinker[itemType].LinkItemAsync(item,client))
+             for itemType,items in gItemLists.items() for item in Utils.Contents(items) if LinkableItem(item)]
+    results = await asyncio.gather(*(task for _,task in tasks),return_exceptions=True)
+    
+    for (item,_),result in zip(tasks,results):
+        if isinstance(result,Exception):
+            Alert.warning(repr(result),"when linking",item)
+
+def RemoteURLs() -> set[str]:
+    """Return the URLs of all linkable items in each of their remote mirrors as quoted by RemoteURLChecker."""
+    urls = set()
+    for itemType,items in gItemLists.items():
+        for item in Utils.Contents(items):
+            if LinkableItem(item):
+                urls.update(Utils.QuotePath(url) for url in (URL(item,mirror) for mirror in getattr(gOptions,itemType))
+                            if Utils.RemoteURL(url))
+    return urls
+
 def LinkItems() -> None:
     """Find a valid mirror for all items that haven't already been linked to."""
 
-    with Utils.ConditionalThreader() as pool:
-        for itemType,items in gItemLists.items():
-            for item in Utils.Contents(items):
-                if not LinkableItem(item):
-                    continue
+    if gOptions.linkEngine == "async":
+        RunWithHttpClient(LinkItemsAsync)
+    else:
+        with Utils.ConditionalThreader() as pool:
+            for itemType,items in gItemLists.items():
+                for item in Utils.Contents(items):
+                    if not LinkableItem(item):
+                        continue
 
-                pool.submit(lambda itemType,item: gLinker[itemType].LinkItem(item),itemType,item)
+                    pool.submit(lambda itemType,item: gLinker[itemType].LinkItem(item),itemType,item)
 
     for itemType,items in gItemLists.items():
         unlinked = []
@@ -510,8 +655,16 @@ def AddArguments(parser) -> None:
     parser.add_argument("--sessionMp3Dir",type=str,default="audio/sessions",help="Read session mp3 files from this directory; Default: audio/sessions")
     parser.add_argument("--excerptMp3Dir",type=str,default="audio/excerpts",help="Write excerpt mp3 files from this directory; Default: audio/excerpts")
     parser.add_argument("--referenceDir",type=str,default="references",help="Directory for reference pdfs; Default: references")
+    parser.add_argument("--frameIndexDir",type=str,default="audio/frameIndex",help="Store the frame indexes of session mp3 files in this directory; Default: audio/frameIndex")
 
     parser.add_argument("--linkCheckLevel",type=str,action="append",default=["1"],help="Integer link check level. [ItemType]:[mirror]:LEVEL")
+    parser.add_argument("--linkEngine",type=str,choices=["async","threads"],default="async",help="Check links using asyncio with pooled connections or with a thread per item; default: async")
+    parser.add_argument("--linkConnectionsPerHost",type=int,default=4,help="Maximum simultaneous connections to each host when checking links; default: 4")
+    parser.add_argument("--linkTimeout",type=float,default=30.0,help="Seconds to wait for each remote link check; default: 30")
+    parser.add_argument("--linkCacheDays",type=float,default=7.0,help="Trust remote links validated within this many days; then revalidate them with conditional requests; default: 7")
+    parser.add_argument("--downloadConnections",type=int,default=4,help="Maximum simultaneous file downloads; default: 4")
+    parser.add_argument("--downloadRate",type=float,default=0,help="Limit the total download bandwidth to this many MB/s; default: 0 (no limit)")
+    parser.add_argument("--linkRetries",type=int,default=2,help="Retry failed remote link checks this many times; default: 2")
 
     """Link check levels are interpreted as follows:
         0: No link checking whatsoever (NoValidation)
@@ -519,6 +672,7 @@ def AddArguments(parser) -> None:
         2: Perform checks that require reading local cache files
         3: Perform checks that require reading file metadata and headers
         4: Perform checks that require reading the entire file (Mp3LengthChecker)
+           Remote mp3 files are checked by reading only their headers and a few kilobytes at the end.
 
         Round down if a given level is not implemented for a given file type.
     """
@@ -545,6 +699,7 @@ def ParseArguments() -> None:
         }
 
     gOptions.uploadMirror = CheckMirrorName(ItemType.EXCERPT,gOptions.uploadMirror)
+    Download.Configure(gOptions.downloadConnections,gOptions.downloadRate * 1e6)
 
     for itemType in ItemType:
         mirrorList = getattr(gOptions,itemType).split(",")
@@ -614,13 +769,124 @@ def Initialize() -> None:
 gOptions = None
 gDatabase:dict[str] = {} # These globals are overwritten by QSArchive.py, but we define them to keep Pylance happy
 gItemLists:dict[ItemType:dict|list] = {}
+gLinkCache:FileRegister.LinkCache|None = None # Remote link validation results; open only while main() runs, otherwise links aren't cached
+gMp3InfoCache:FileRegister.Mp3InfoCache|None = None # Durations and CLIP tags of remote mp3 files; also open only while main() runs
+gLocalMp3Cache:FileRegister.Mp3InfoCache|None = None # The same for local mp3 files; see OpenLocalMp3Cache
+gFrameIndexCache:FileRegister.FrameIndexCache|None = None # Frame indexes of session mp3 files; see OpenFrameIndexCache
+gHttpClient:AsyncHttp.AsyncHttpClient|None = None # The client shared by all remote link checks; see OpenHttpClient
+gHttpLoop:asyncio.AbstractEventLoop|None = None # The event loop gHttpClient runs in
+
+def LocalFilePaths(items: Iterable[dict]) -> set[str]:
+    """Return the normalized paths of the usual and NoUpload locations of the local files of items.
+    Registers of local files normalize paths with posixpath, but SplitMp3 passes paths in the operating system's format."""
+    paths = set()
+    for item in items:
+        if LinkableItem(item):
+            for path in (URL(item,"local"),NoUploadPath(item)):
+                paths.update((posixpath.normpath(path),os.path.normpath(path)))
+    return paths
+
+@contextlib.contextmanager
+def OpenLocalMp3Cache() -> Iterator[FileRegister.Mp3InfoCache]:
+    """Open the register of local mp3 file information and make it available to the link validators.
+    Modules that read local mp3 files call this so that only files that have changed are reopened.
+    Nested calls share the same register, which is written to disk when the outermost call exits."""
+    global gLocalMp3Cache
+    if gLocalMp3Cache is not None:
+        yield gLocalMp3Cache
+        return
+    
+    try:
+        with FileRegister.Mp3InfoCache(gOptions.prototypeDir,"assets/LocalMp3Cache.json") as gLocalMp3Cache:
+            yield gLocalMp3Cache
+    finally:
+        gLocalMp3Cache = None
+
+@contextlib.contextmanager
+def OpenFrameIndexCache(pruneUnused: bool = False) -> Iterator[FileRegister.FrameIndexCache]:
+    """Open the register of session mp3 frame indexes (see Mp3Index) in gOptions.frameIndexDir.
+    Nested calls share the same register. When the outermost call exits, forget files which haven't been used
+    and no longer exist, write the register, and delete index files which no longer describe any session mp3 file.
+    pruneUnused: the database is complete and linked, so also forget unused files which aren't the local file
+    of any audio source. Pass this only from untargeted passes which can call URL."""
+    global gFrameIndexCache
+    if gFrameIndexCache is not None:
+        yield gFrameIndexCache
+        return
+    
+    os.makedirs(gOptions.frameIndexDir,exist_ok=True)
+    try:
+        with FileRegister.FrameIndexCache(gOptions.frameIndexDir) as gFrameIndexCache:
+            yield gFrameIndexCache
+            usedKeys = None
+            if pruneUnused and gOptions.events == "All":
+                usedKeys = LocalFilePaths(gDatabase["audioSource"].values())
+            removed = gFrameIndexCache.RemoveUnusedRecords(usedKeys)
+            deleted = gFrameIndexCache.DeleteUnusedIndexes()
+            if removed or deleted:
+                Alert.extra("Frame index cache: forgot",removed,"file(s) and deleted",deleted,"unused index file(s).")
+    finally:
+        gFrameIndexCache = None
+
+@contextlib.contextmanager
+def OpenHttpClient() -> Iterator[AsyncHttp.AsyncHttpClient]:
+    """Start an event loop in a background thread and open an HTTP client in it which all link validators share,
+    so connections to each host are kept alive between items and limited to --linkConnectionsPerHost.
+    Nested calls share the same client, which is closed when the outermost call exits."""
+    global gHttpClient, gHttpLoop
+    if gHttpClient is not None:
+        yield gHttpClient
+        return
+    
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever,name="Link event loop",daemon=True)
+    thread.start()
+    try:
+        gHttpLoop = loop
+        gHttpClient = AsyncHttp.AsyncHttpClient(connectionsPerHost=gOptions.linkConnectionsPerHost,
+                                                timeout=gOptions.linkTimeout,retries=gOptions.linkRetries)
+        yield gHttpClient
+    finally:
+        if gHttpClient is not None:
+            asyncio.run_coroutine_threadsafe(gHttpClient.Close(),loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        gHttpClient = gHttpLoop = None
+
+T = TypeVar("T")
+
+def RunWithHttpClient(function: Callable[[AsyncHttp.AsyncHttpClient],Awaitable[T]]) -> T:
+    """Return the result of awaiting function(gHttpClient) in the shared event loop. This can be called from any thread
+    except the event loop's own. Open the client temporarily if OpenHttpClient hasn't been called."""
+    with OpenHttpClient() as client:
+        return asyncio.run_coroutine_threadsafe(function(client),gHttpLoop).result()
 
 def main() -> None:
-    global gItemLists
+    global gItemLists, gLinkCache, gMp3InfoCache
     gItemLists = {
         ItemType.EXCERPT: gDatabase["excerpts"],
         ItemType.AUDIO_SOURCE: gDatabase["audioSource"],
         ItemType.REFERENCE: gDatabase["reference"]
     }
     
-    LinkItems()
\ No newline at end of file
+    try:
+        with (FileRegister.LinkCache(gOptions.prototypeDir,"assets/LinkCache.json") as gLinkCache,
+              FileRegister.Mp3InfoCache(gOptions.prototypeDir,"assets/Mp3InfoCache.json") as gMp3InfoCache,
+              OpenLocalMp3Cache() as localMp3Cache,
+              OpenFrameIndexCache(pruneUnused=True),
+              OpenHttpClient()):
+            LinkItems()
+            Alert.extra("Link cache:",gLinkCache.StatusSummary())
+            if gOptions.events == "All": # Forget the links of items which are no longer in the database
+                removed = gLinkCache.RemoveStaleRecords(keep=RemoteURLs())
+                if removed:
+                    Alert.extra("Link cache: forgot",removed,"URL(s) which no item links to.")
+            Alert.extra("Mp3 info cache:",gMp3InfoCache.StatusSummary())
+            Alert.extra("Local mp3 cache:",localMp3Cache.StatusSummary())
+            if gOptions.events == "All": # Forget deleted or renamed mp3 files and those of items no longer in the database
+                removed = localMp3Cache.RemoveUnusedRecords(LocalFilePaths(itertools.chain(gDatabase["excerpts"],gDatabase["audioSource"].values())))
+                if removed:
+                    Alert.extra("Local mp3 cache: forgot",removed,"file(s).")
+    finally:
+        gLinkCache = gMp3InfoCache = None
\ No newline at end of file
@@ -6,7 +6,7 @@ import os, sys, re, csv, json, unicodedata, copy
 import Database
 import Filter
 import Render
-import SplitMp3,Mp3DirectCut
+import SplitMp3,Mp3DirectCut,Mp3Frames,Mp3Index,Link,FileRegister
 from Mp3DirectCut import TimeDeltaToStr,ToTimeDelta
 import Utils
 from typing import List, Iterator, Tuple, Callable, Any, TextIO
@@ -898,7 +898,7 @@ def AddAnnotation(database: dict, excerpt: dict,annotation: dict) -> None:
     if annotation["indentLevel"] - 1 > prevAnnotationLevel:
         Alert.warning("Annotation",annotation,"to",excerpt,": Cannot increase indentation level by more than one.")
     
-    excerpt["annotations"].append(annotation)
+    Database.AttachAnnotation(excerpt,annotation)
 
 gAuthorRegexList = None
 def ReferenceAuthors(textToScan: str) -> list[str]:
@@ -1039,6 +1039,21 @@ def CreateClips(excerpts: list[dict], sessions: list[dict], database: dict) -> N
                 except (Mp3DirectCut.ParseError,Mp3DirectCut.TimeError) as error:
                     Alert.error(annotation,"to",excerpt,"produces error:",error.args[0])
 
+    def LocalSessionDuration(session: dict,frameIndexCache: FileRegister.FrameIndexCache) -> str:
+        """Return the duration of the local mp3 file of session or "" if there is no such file.
+        Mp3Index stores the frame index of the file, so it needs to be scanned only once."""
+        path = Utils.PosixJoin(gOptions.sessionMp3Dir,session["event"],session["filename"])
+        if not os.path.isfile(path):
+            return ""
+        try:
+            duration = Mp3Index.Load(path,frameIndexCache).Duration()
+        except (OSError,Mp3Frames.Mp3FormatError) as error:
+            Alert.warning("Unable to read the duration of",path,":",error)
+            return ""
+        duration = TimeDeltaToStr(timedelta(seconds=round(duration)))
+        Alert.info(session,"has no duration; using the duration of",path,":",duration)
+        return duration
+
     def CalcEditedAudioDuration(excerpt:dict[str],nextExcerptStartTime:str) -> None:
         """If the duration of the Edited audio annotation to this excerpt is not already specified, 
         set it to the time between the beginning of this excerpt and the start of the next one."""
@@ -1068,81 +1083,84 @@ def CreateClips(excerpts: list[dict], sessions: list[dict], database: dict) -> N
             del excerpts[index]
 
     # Then scan through the excerpts and add key "clips"
-    for session,sessionExcerpts in Database.GroupBySession(excerpts,sessions):
-        if session["filename"]:
-            AddAudioSource(session["filename"],session["duration"],session["event"],session["remoteMp3Url"])
-            try:
-                sessionDuration = ToTimeDelta(session["duration"])
-            except ValueError:
-                sessionDuration = None
-        else:
-            sessionDuration = None
-        del session["remoteMp3Url"]
-
-        for x in sessionExcerpts:
-            # First check if there is an Alternate audio or Edited audio annotation
-            altAudioList = [a for a in x["annotations"] if a["kind"] in ("Alternate audio","Edited audio")]
-            if altAudioList:
-                if len(altAudioList) > 1:
-                    Alert.caution(x,"has more than one Alternate audio or Edited audio annotation. Only the first will be used.")
-                audioSource = SplitAudioSourceText(altAudioList[0]["text"])[0]
-                    # The annotation text contains the audio source file name
+    with Link.OpenFrameIndexCache() as frameIndexCache: # Read the register once for all sessions
+        for session,sessionExcerpts in Database.GroupBySession(excerpts,sessions):
+            if session["filename"]:
+                if not session["duration"]:
+                    session["duration"] = LocalSessionDuration(session,frameIndexCache)
+                AddAudioSource(session["filename"],session["duration"],session["event"],session["remoteMp3Url"])
+                try:
+                    sessionDuration = ToTimeDelta(session["duration"])
+                except ValueError:
+                    sessionDuration = None
             else:
-                audioSource = "$"
-
-            startTime = x["startTime"]
-            endTime = x["endTime"]
-            if startTime == "Session":
-                    # The session excerpt has the length of the session and has no clips key
-                session = Database.FindSession(sessions,x["event"],x["sessionNumber"])
-                x["duration"] = session["duration"]
-                if not x["duration"]:
-                    Alert.error("Deleting session excerpt",x,"since the session has no duration.")
-                    deletedExcerptIDs.add(id(x))
-                continue
+                sessionDuration = None
+            del session["remoteMp3Url"]
+
+            for x in sessionExcerpts:
+                # First check if there is an Alternate audio or Edited audio annotation
+                altAudioList = [a for a in x["annotations"] if a["kind"] in ("Alternate audio","Edited audio")]
+                if altAudioList:
+                    if len(altAudioList) > 1:
+                        Alert.caution(x,"has more than one Alternate audio or Edited audio annotation. Only the first will be used.")
+                    audioSource = SplitAudioSourceText(altAudioList[0]["text"])[0]
+                        # The annotation text contains the audio source file name
+                else:
+                    audioSource = "$"
+
+                startTime = x["startTime"]
+                endTime = x["endTime"]
+                if startTime == "Session":
+                        # The session excerpt has the length of the session and has no clips key
+                    session = Database.FindSession(sessions,x["event"],x["sessionNumber"])
+                    x["duration"] = session["duration"]
+                    if not x["duration"]:
+                        Alert.error("Deleting session excerpt",x,"since the session has no duration.")
+                        deletedExcerptIDs.add(id(x))
+                    continue
             
             
-            x["clips"] = [SplitMp3.Clip(audioSource,startTime,endTime)]
-            if altAudioList:
-                ProcessAltAudio(x,altAudioList[0])
+                x["clips"] = [SplitMp3.Clip(audioSource,startTime,endTime)]
+                if altAudioList:
+                    ProcessAltAudio(x,altAudioList[0])
             
-            appendAudioList = [a for a in x["annotations"] if a["kind"] in ("Append audio","Cut audio")]
-            if appendAudioList:
-                ProcessAppendAudio(x,appendAudioList)
-
-        # Calculate the duration of each excerpt and handle overlapping excerpts
-        # Excerpts without an end time end when the next non-fragment excerpt starts
-        for xf1,xf2 in itertools.pairwise(Database.GroupFragments(sessionExcerpts)):
-            if "clips" not in xf1[0]: # Skip the session excerpt
-                continue
+                appendAudioList = [a for a in x["annotations"] if a["kind"] in ("Append audio","Cut audio")]
+                if appendAudioList:
+                    ProcessAppendAudio(x,appendAudioList)
+
+            # Calculate the duration of each excerpt and handle overlapping excerpts
+            # Excerpts without an end time end when the next non-fragment excerpt starts
+            for xf1,xf2 in itertools.pairwise(Database.GroupFragments(sessionExcerpts)):
+                if "clips" not in xf1[0]: # Skip the session excerpt
+                    continue
             
-            nextExcerpt = xf2[0]
-            if "startTimeInSession" in nextExcerpt:
-                nextClip = Mp3DirectCut.Clip("$",nextExcerpt["startTimeInSession"])
-            else:
-                nextClip = nextExcerpt["clips"][0]
-            for x in xf1:
-                lastClip = x["clips"][-1]
-                sameFile = lastClip.file == nextClip.file
-                if not lastClip.end:
-                    if sameFile:
-                        x["clips"][-1] = lastClip._replace(end=nextClip.start)
+                nextExcerpt = xf2[0]
+                if "startTimeInSession" in nextExcerpt:
+                    nextClip = Mp3DirectCut.Clip("$",nextExcerpt["startTimeInSession"])
+                else:
+                    nextClip = nextExcerpt["clips"][0]
+                for x in xf1:
+                    lastClip = x["clips"][-1]
+                    sameFile = lastClip.file == nextClip.file
+                    if not lastClip.end:
+                        if sameFile:
+                            x["clips"][-1] = lastClip._replace(end=nextClip.start)
                     
-                    if "startTimeInSession" in x:
-                        CalcEditedAudioDuration(x,nextClip.start)
+                        if "startTimeInSession" in x:
+                            CalcEditedAudioDuration(x,nextClip.start)
 
-                endTime = lastClip.ToClipTD().end
-                if sameFile and endTime and endTime > nextClip.ToClipTD().start:
-                    if ExcerptFlag.OVERLAP not in nextExcerpt["flags"]:
-                        Alert.warning(f"excerpt",nextExcerpt,"unexpectedly overlaps with the previous excerpt. This should be either changed or flagged with 'o'.")
+                    endTime = lastClip.ToClipTD().end
+                    if sameFile and endTime and endTime > nextClip.ToClipTD().start:
+                        if ExcerptFlag.OVERLAP not in nextExcerpt["flags"]:
+                            Alert.warning(f"excerpt",nextExcerpt,"unexpectedly overlaps with the previous excerpt. This should be either changed or flagged with 'o'.")
         
-        # If a session ends with an Edited audio excerpt, calculate its duration.
-        if "startTimeInSession" in sessionExcerpts[-1]:
-            CalcEditedAudioDuration(sessionExcerpts[-1],session["duration"])
+            # If a session ends with an Edited audio excerpt, calculate its duration.
+            if "startTimeInSession" in sessionExcerpts[-1]:
+                CalcEditedAudioDuration(sessionExcerpts[-1],session["duration"])
 
-        for x in sessionExcerpts:
-            if "clips" in x:
-                x["duration"] = ExcerptDuration(x,sessionDuration)
+            for x in sessionExcerpts:
+                if "clips" in x:
+                    x["duration"] = ExcerptDuration(x,sessionDuration)
 
 def ProcessFragments(excerpt: dict[str]) -> list[dict[str]]:
     """Process the fragments in excerpt and return a list to add to the event."""
@@ -1180,7 +1198,7 @@ def ProcessFragments(excerpt: dict[str]) -> list[dict[str]]:
                 event = excerpt["event"],
                 sessionNumber = excerpt["sessionNumber"],
                 fileNumber = nextFileNumber,
-                annotations = fragmentAnnotations,
+                annotations = [],
 
                 kind = fragmentExcerptTemplate["kind"],
                 flags = fragmentExcerptTemplate["flags"] + ExcerptFlag.FRAGMENT,
@@ -1197,6 +1215,8 @@ def ProcessFragments(excerpt: dict[str]) -> list[dict[str]]:
 
                 exclude = False
             )
+            for a in fragmentAnnotations:
+                Database.AttachAnnotation(fragmentExcerpt,a)
 
             audioEdited = any(a["kind"] == "Edited audio" for a in excerpt["annotations"])
             relativeAudio = ExcerptFlag.RELATIVE_AUDIO in fragmentAnnotation["flags"]
@@ -1600,7 +1620,10 @@ def main():
     Each .csv sheet gets one entry in the database.
     Tags.csv and event files indicated by four digits e.g. TG2015.csv are parsed separately."""
 
-    global gDatabase
+    global gDatabase, gRemovedExcerpts, gRemovedAnnotations, gAuthorRegexList
+    gRemovedExcerpts = gRemovedAnnotations = 0
+    gAuthorRegexList = None
+    gUnattributedTeachers.clear()
     LoadSummary(gDatabase,os.path.join(gOptions.csvDir,"Summary.csv"))
    
     specialFiles = {'Summary','Tag','EventTemplate'}
@@ -1643,10 +1666,11 @@ def main():
     gDatabase["sessions"] = []
     gDatabase["audioSource"] = {}
     gDatabase["excerpts"] = []
-    for event in gDatabase["summary"]:
-        if not gOptions.parseOnlySpecifiedEvents or gOptions.events == "All" or event in gOptions.events:
-            if not event.startswith("Test") or gOptions.includeTestEvent:
-                LoadEventFile(gDatabase,event,gOptions.csvDir)
+    with Link.OpenFrameIndexCache(): # Share one register among the events
+        for event in gDatabase["summary"]:
+            if not gOptions.parseOnlySpecifiedEvents or gOptions.events == "All" or event in gOptions.events:
+                if not event.startswith("Test") or gOptions.includeTestEvent:
+                    LoadEventFile(gDatabase,event,gOptions.csvDir)
     ListifyKey(gDatabase["event"],"series")
     excludeAlert(f": {gRemovedExcerpts} excerpts and {gRemovedAnnotations} annotations in all.")
     gUnattributedTeachers.pop("Anon",None)
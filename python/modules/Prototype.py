@@ -10,14 +10,15 @@ import Database, ReviewDatabase
 import Utils, Alert, Filter, ParseCSV, Document, Render, SetupRandom
 import Html2 as Html
 from datetime import timedelta
-import re, copy, itertools
+import re, copy, itertools, json, gzip
+from xml.sax.saxutils import escape as XmlEscape
 import pyratemp, markdown
 from markdown_newtab_remote import NewTabRemoteExtension
 from typing import NamedTuple, Generator
 from collections import defaultdict, Counter
 from enum import Enum
 import itertools
-import FileRegister
+import FileRegister, FingerprintAssets, HtmlMinify
 from contextlib import nullcontext
 from functools import lru_cache
 import urllib.parse
@@ -49,12 +50,135 @@ def WriteIndentedTagDisplayList(fileName):
 def WritePage(page: Html.PageDesc,writer: FileRegister.HashWriter) -> None:
     """Write an html file for page using the global template"""
     page.gOptions = gOptions
+    page.Asset = Asset
 
     template = Utils.PosixJoin(gOptions.prototypeDir,gOptions.globalTemplate)
     if page.info.file.endswith("_print.html"):
         template = Utils.AppendToFilename(template,"_print")
     pageHtml = page.RenderWithTemplate(template)
-    writer.WriteTextFile(page.info.file,pageHtml)
+    writer.WriteTextFile(page.info.file,pageHtml,**Minification(page.info.file))
+    if gOptions.writeFragments:
+        writer.WriteTextFile(FragmentFile(page.info.file),PageFragment(pageHtml),**Minification(page.info.file))
+
+gMinifiedBytes:dict[str,list[int]] = defaultdict(lambda: [0,0,0]) # Section -> [pages minified, bytes before, bytes after]
+
+def Section(pageFile: str) -> str:
+    "Return the directory of pageFile relative to prototypeDir, which --minifyHtml refers to; '.' for the top directory."
+    return pageFile.split("/")[0] if "/" in pageFile else "."
+
+@lru_cache(maxsize=None)
+def MinifierName() -> str:
+    "Identify the minifier so that HashWriter minifies unchanged pages again when HtmlMinify.py changes."
+    return "HtmlMinify " + FileRegister.FileHash(HtmlMinify.__file__)
+
+def Minification(pageFile: str) -> dict[str]:
+    """Return the keyword arguments to HashWriter.WriteTextFile which minify pageFile if --minifyHtml includes its section.
+    Count the bytes saved in gMinifiedBytes."""
+    section = Section(pageFile)
+    if not ("all" in gOptions.minifyHtml or section in gOptions.minifyHtml):
+        return {}
+
+    def MinifyAndCount(html: str) -> str:
+        minified = HtmlMinify.Minify(html)
+        counts = gMinifiedBytes[section]
+        counts[0] += 1
+        counts[1] += len(html.encode("utf-8"))
+        counts[2] += len(minified.encode("utf-8"))
+        return minified
+    return {"transform":MinifyAndCount,"transformName":MinifierName()}
+
+def ReportMinification() -> None:
+    "Report the bytes saved by --minifyHtml in each section."
+    if not gMinifiedBytes:
+        return
+    for section,(pages,before,after) in sorted(gMinifiedBytes.items()):
+        Alert.extra(f"Minified {pages} html file(s) in {section}: {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB ({1 - after / before:.1%} saved).")
+    pages,before,after = (sum(counts) for counts in zip(*gMinifiedBytes.values()))
+    Alert.info(f"Minified {pages} changed html file(s); saved {(before - after) / 1024:.1f} KiB ({1 - after / before:.1%}).")
+    gMinifiedBytes.clear()
+
+FRAGMENT_DIR = "fragments"
+
+def FragmentFile(pageFile: str) -> str:
+    "Return the path of the fragment of pageFile relative to prototypeDir."
+    return Utils.PosixJoin(FRAGMENT_DIR,pageFile)
+
+def PageFragment(pageHtml: str) -> str:
+    """Return the part of pageHtml that frame.js displays in its frame: the <title> and keywords <meta> tags
+    followed by the contents of <body> without the javascript redirect script or link.
+    Links in the fragment are relative to the page, not to the fragment file."""
+
+    header = [match[0] for match in (re.search(r"<title>.*?</title>",pageHtml,flags=re.DOTALL),
+                                     re.search(r'<meta name="keywords"[^>]*>',pageHtml)) if match]
+    body = HtmlBody(pageHtml)
+    body = re.sub(r"<script>.*?</script>","",body,flags=re.DOTALL)
+    body = re.sub(r'<span id="javascript-link">.*?</span>',"",body,flags=re.DOTALL)
+    return "\n".join(header + [body.strip()])
+
+gAssetNames:dict[str,str] = {} # Maps assets to their fingerprinted copies; see FingerprintAssets.py
+
+def Asset(name: str) -> str:
+    "Return the name of the fingerprinted copy of asset name (relative to prototypeDir) if there is one."
+    return gAssetNames.get(name,name)
+
+def ImportMap() -> str:
+    "Return an import map which redirects imports of javascript modules to their fingerprinted copies or '' if there are none."
+    imports = {f"./{name}":f"./{copy}" for name,copy in gAssetNames.items() if name.endswith(".js")}
+    return json.dumps({"imports":imports},indent=2) if imports else ""
+
+def Precompression() -> dict[str,int]:
+    """Return the compression argument for HashWriters that write files served by the website:
+    which compressed copies to write according to --precompress, --gzipLevel, and --brotliQuality."""
+    if gOptions.precompress:
+        return FileRegister.CompressionSettings(gOptions.gzipLevel,gOptions.brotliQuality)
+    return {}
+
+def AssetWriter() -> FileRegister.HashWriter:
+    """Return a HashWriter for the json databases in prototypeDir/assets written by SetupSearch and SetupRandom.
+    Paths are relative to the directory containing QSarchive.py."""
+    return FileRegister.HashWriter("./",Utils.PosixJoin(gOptions.prototypeDir,"assets/AssetHashCache.json"),exactDates=True,compression=Precompression())
+
+gBuildTargets:dict[str,set[str]] = {} # Keys "tag", "event", "teacher": the pages to build; empty unless this is a targeted build
+
+def BuildTargets() -> dict[str,set[str]]:
+    """Convert the names given by --buildTag, --buildEvent, and --buildTeacher to database keys.
+    An event also targets the tags and teachers of the event and its excerpts.
+    Return an empty dict if this is not a targeted build."""
+
+    if not (gOptions.buildTag or gOptions.buildEvent or gOptions.buildTeacher):
+        return {}
+    
+    targets = {"tag":set(),"event":set(),"teacher":set()}
+    for name in gOptions.buildTag:
+        tag = Database.TagLookup(name)
+        if tag:
+            targets["tag"].add(tag)
+        else:
+            Alert.warning("--buildTag: Cannot find tag",repr(name))
+    for name in gOptions.buildTeacher:
+        teacher = Database.TeacherLookup(name)
+        if teacher:
+            targets["teacher"].add(teacher)
+        else:
+            Alert.warning("--buildTeacher: Cannot find teacher",repr(name))
+    for eventCode in gOptions.buildEvent:
+        event = gDatabase["event"].get(eventCode)
+        if not event:
+            Alert.warning("--buildEvent: Cannot find event",repr(eventCode))
+            continue
+        targets["event"].add(eventCode)
+        targets["tag"].update(event["tags"])
+        targets["teacher"].update(event["teachers"])
+        for excerpt in gDatabase["excerpts"]:
+            if excerpt["event"] == eventCode:
+                targets["tag"].update(Filter.AllTags(excerpt))
+                targets["teacher"].update(Filter.AllTeachers(excerpt))
+
+    return targets
+
+def Targeted(kind: str,key: str) -> bool:
+    "Should we build the pages for this tag, event, or teacher? Always True unless this is a targeted build."
+    return not gBuildTargets or key in gBuildTargets[kind]
 
 def DeleteUnwrittenHtmlFiles(writer: FileRegister.HashWriter) -> None:
     """Remove old html files from previous runs to keep things neat and tidy."""
@@ -68,6 +192,7 @@ def DeleteUnwrittenHtmlFiles(writer: FileRegister.HashWriter) -> None:
     deletedFiles = 0
     for dir in dirs:
         deletedFiles += writer.DeleteUnregisteredFiles(dir,filterRegex=r".*\.html$")
+        deletedFiles += writer.DeleteUnregisteredFiles(FragmentFile(dir),filterRegex=r".*\.html$")
     if deletedFiles:
         Alert.extra(deletedFiles,"html file(s) deleted.")
 
@@ -189,16 +314,16 @@ def ListLinkedTags(title:str, tags:Iterable[str],*args,**kwargs) -> str:
     linkedTags = [HtmlTagLink(tag) for tag in tags]
     return TitledList(title,linkedTags,*args,**kwargs)
 
-gAllTeacherRegex = ""
+@lru_cache(maxsize=None)
+def AllTeacherRegex() -> str:
+    "Return a regex matching the names of all teachers with teacher pages."
+    return Utils.RegexMatchAny(t["attributionName"] for t in gDatabase["teacher"].values() if t["htmlFile"])
+
 def LinkTeachersInText(text: str,specificTeachers:Iterable[str]|None = None) -> str:
     """Search text for the names of teachers with teacher pages and add hyperlinks accordingly."""
 
-    global gAllTeacherRegex
-    if not gAllTeacherRegex:
-        gAllTeacherRegex = Utils.RegexMatchAny(t["attributionName"] for t in gDatabase["teacher"].values() if t["htmlFile"])
-    
     if specificTeachers is None:
-        teacherRegex = gAllTeacherRegex
+        teacherRegex = AllTeacherRegex()
     else:
         teacherRegex = Utils.RegexMatchAny(gDatabase["teacher"][t]["attributionName"] for t in specificTeachers if gDatabase["teacher"][t]["htmlFile"])
 
@@ -1659,7 +1784,7 @@ def TagPages(tagPageDir: str) -> Iterator[Html.PageAugmentorType]:
 
     subsumesTags = Database.SubsumesTags()
     for tag,tagInfo in gDatabase["tag"].items():
-        if not tagInfo["htmlFile"]:
+        if not tagInfo["htmlFile"] or not Targeted("tag",tag):
             continue
 
         relevantExcerpts = Filter.Tag(tag)(gDatabase["excerpts"])
@@ -1721,7 +1846,7 @@ def TeacherPages(teacherPageDir: str) -> Html.PageDescriptorMenuItem:
     teacherDB = gDatabase["teacher"]
 
     for t,tInfo in teacherDB.items():
-        if not tInfo["htmlFile"]:
+        if not tInfo["htmlFile"] or not Targeted("teacher",t):
             continue
 
         relevantExcerpts = Filter.Teacher(t)(xDB)
@@ -1933,6 +2058,8 @@ def EventPages(eventPageDir: str) -> Iterator[Html.PageAugmentorType]:
         return
 
     for eventCode,eventInfo in gDatabase["event"].items():
+        if not Targeted("event",eventCode):
+            continue
         sessions = [s for s in gDatabase["sessions"] if s["event"] == eventCode]
         excerpts = [x for x in gDatabase["excerpts"] if x["event"] == eventCode]
         featuredExcerpts = Filter.FTag(Filter.All)(excerpts)
@@ -1991,10 +2118,8 @@ def EventPages(eventPageDir: str) -> Iterator[Html.PageAugmentorType]:
         page.AppendContent(f"Event: {eventInfo['title']}",section="citationTitle")
         yield page
         
-def ExtractHtmlBody(fileName: str) -> str:
-    """Extract the body text from a html page"""
-    
-    htmlPage = Utils.ReadFile(fileName)
+def HtmlBody(htmlPage: str,fileName: str = "page") -> str:
+    """Return the body text of a html page"""
     
     bodyStart = re.search(r'<body[^>]*>',htmlPage)
     bodyEnd = re.search(r'</body',htmlPage)
@@ -2006,6 +2131,11 @@ def ExtractHtmlBody(fileName: str) -> str:
     
     return htmlPage[bodyStart.span()[1]:bodyEnd.span()[0]]
 
+def ExtractHtmlBody(fileName: str) -> str:
+    """Extract the body text from a html page"""
+    
+    return HtmlBody(Utils.ReadFile(fileName),fileName)
+
 def DocumentationMenu(directory: str,makeMenu = True,specialFirstItem:Html.PageInfo|None = None,extraItems:Iterator[Iterator[Html.PageDescriptorMenuItem]] = []) -> Html.PageDescriptorMenuItem:
     """Read markdown pages from documentation/directory, convert them to html, 
     write them in prototype/about, and create a menu out of them.
@@ -2436,11 +2566,20 @@ def Homepage():
 
 SUBPAGE_SUFFIXES = {"qtag","atag","quote","text","reading","story","reference","from","by","meditation","teaching"}
 
-def WriteSitemapURL(pagePath:str,xml:Airium) -> None:
-    "Write the URL of the page at pagePath into an xml sitemap."
+SITEMAP_MAX_URLS = 50000 # The limits of a single sitemap file according to the sitemap protocol
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+class SitemapURL(NamedTuple):
+    loc: str
+    lastmod: str
+    priority: float
+
+def SitemapEntry(pagePath: str,record: dict) -> SitemapURL|None:
+    "Return the sitemap entry of the page at pagePath given its register record or None if it isn't listed in the sitemap."
     
     if not pagePath.endswith(".html"):
-        return
+        return None
 
     priority = 1.0
     pathParts = pagePath.split("/")
@@ -2449,32 +2588,69 @@ def WriteSitemapURL(pagePath:str,xml:Airium) -> None:
         pagePath = "index.html"
     elif directory == "about":
         if not re.match("[0-9]+_",pathParts[-1]):
-            return
+            return None
     elif directory == "events":
         priority = 0.9
     else:
-        return
-
-    with xml.url():
-        with xml.loc():
-            xml(f"{gOptions.info.cannonicalURL}{pagePath}")
-        with xml.lastmod():
-            xml(Utils.ModificationDate(Utils.PosixJoin(gOptions.prototypeDir,pagePath)).strftime("%Y-%m-%d"))
-        with xml.changefreq():
-            xml("weekly")
-        with xml.priority():
-            xml(priority)
-
-def XmlSitemap(siteFiles: FileRegister.HashWriter) -> str:
-    """Look through the html files we've written and create an xml sitemap."""
-    pass
+        return None
+
+    return SitemapURL(f"{gOptions.info.cannonicalURL}{pagePath}",record["_modified"].strftime("%Y-%m-%d"),priority)
+
+def UrlSetXml(urls: Iterable[SitemapURL]) -> str:
+    "Return a sitemap file listing urls."
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_XMLNS}">']
+    for url in urls:
+        lines.append(f"  <url><loc>{XmlEscape(url.loc)}</loc><lastmod>{url.lastmod}</lastmod><changefreq>weekly</changefreq><priority>{url.priority}</priority></url>")
+    lines.append("</urlset>")
+    return "\n".join(lines)
+
+def SitemapIndexXml(sitemaps: Iterable[tuple[str,str]]) -> str:
+    "Return a sitemap index listing the (url,lastmod) pairs in sitemaps."
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_XMLNS}">']
+    for loc,lastmod in sitemaps:
+        lines.append(f"  <sitemap><loc>{XmlEscape(loc)}</loc><lastmod>{lastmod}</lastmod></sitemap>")
+    lines.append("</sitemapindex>")
+    return "\n".join(lines)
+
+def SplitSitemap(urls: list[SitemapURL]) -> list[list[SitemapURL]]:
+    "Divide urls into groups that fit in a single sitemap file."
+    overhead = len(UrlSetXml([]).encode("utf-8"))
+    groups = [[]]
+    groupBytes = overhead
+    for url in urls:
+        urlBytes = len(UrlSetXml([url]).encode("utf-8")) - overhead + 1
+        if groups[-1] and (len(groups[-1]) >= SITEMAP_MAX_URLS or groupBytes + urlBytes > SITEMAP_MAX_BYTES):
+            groups.append([])
+            groupBytes = overhead
+        groups[-1].append(url)
+        groupBytes += urlBytes
+    return groups
+
+SITEMAP_FILES = r"sitemap(-[0-9]+)?\.xml(\.gz)?$" # The files written by WriteSitemap
+
+def WriteSitemap(siteFiles: FileRegister.HashWriter) -> None:
+    """Write sitemap.xml listing the pages in the register of siteFiles, using the modification dates it records.
+    If the pages don't fit in one sitemap or --gzipSitemap is given, sitemap.xml is a sitemap index which lists
+    sitemap-1.xml, sitemap-2.xml, etc. (or sitemap-1.xml.gz...). Since siteFiles writes only files whose contents
+    have changed, the sitemap files are rewritten only if the set of pages or their dates change."""
+
+    urls = sorted(filter(None,(SitemapEntry(pagePath,record) for pagePath,record in siteFiles.record.items())))
+    groups = SplitSitemap(urls)
+    if len(groups) == 1 and not gOptions.gzipSitemap:
+        siteFiles.WriteTextFile("sitemap.xml",UrlSetXml(groups[0]))
+    else:
+        sitemaps = []
+        for n,group in enumerate(groups,start=1):
+            fileName = f"sitemap-{n}.xml"
+            if gOptions.gzipSitemap:
+                fileName += ".gz"
+                siteFiles.WriteBinaryFile(fileName,gzip.compress((UrlSetXml(group) + "\n").encode("utf-8"),mtime=0))
+            else:
+                siteFiles.WriteTextFile(fileName,UrlSetXml(group))
+            sitemaps.append((f"{gOptions.info.cannonicalURL}{fileName}",max((url.lastmod for url in group),default="")))
+        siteFiles.WriteTextFile("sitemap.xml",SitemapIndexXml(sitemaps))
 
-    xml = Airium()
-    with xml.urlset(xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"):
-        for pagePath in siteFiles.record:
-            WriteSitemapURL(pagePath,xml)
-    
-    return str(xml)
+    siteFiles.DeleteUnregisteredFiles(filterRegex=r".*/sitemap-[0-9]+\.xml(\.gz)?$")
 
 def WriteIndexPage(writer: FileRegister.HashWriter):
     """Copy the contents of homepage.html into the body of index.html."""
@@ -2484,8 +2660,77 @@ def WriteIndexPage(writer: FileRegister.HashWriter):
 
     indexTemplate = Utils.ReadFile(Utils.PosixJoin(gOptions.prototypeDir,"templates","index.html"))
     
-    indexHtml = pyratemp.Template(indexTemplate)(bodyHtml = homepageBody,gOptions = gOptions)
-    writer.WriteTextFile(Utils.PosixJoin("index.html"),indexHtml)
+    indexHtml = pyratemp.Template(indexTemplate)(bodyHtml = homepageBody,gOptions = gOptions,Asset = Asset,importMap = ImportMap())
+    writer.WriteTextFile(Utils.PosixJoin("index.html"),indexHtml,**Minification("index.html"))
+
+SERVICE_WORKER = "sw.js"
+PRECACHE_MANIFEST = "assets/PrecacheManifest.json"
+PRECACHE_SHELL = ["index.html","homepage.html","style.css"] + [asset for asset in FingerprintAssets.FINGERPRINTED_ASSETS if asset.endswith(".js")] \
+    + ["assets/play.svg","assets/pause.svg","assets/RandomExcerpts.json"]
+PRECACHE_PAGES = ["search/Text-search.html","indexes/KeyTopics.html","drilldown/root.html","indexes/EventsBySubject.html",
+                  "teachers/TeachersAlphabetical.html","indexes/AllExcerpts.html"] # The pages linked to by the main menu
+PRECACHE_SEARCH = ["assets/SearchIndex.json","assets/SearchDatabase.json"]
+
+def PrecacheEntry(name: str,writers: Iterable[FileRegister.HashWriter]) -> dict|None:
+    """Return the precache manifest entry of file name (relative to prototypeDir) or None if it doesn't exist.
+    Take the md5 hash from the first writer which has written the file if it hasn't changed since."""
+    path = Utils.PosixJoin(gOptions.prototypeDir,name)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+    for writer in writers:
+        key = os.path.relpath(path,writer.basePath).replace(os.sep,"/")
+        if key in writer.record and not writer.UpdatedOnDisk(key):
+            return {"url":name,"md5":writer.record[key]["md5"],"size":size}
+    return {"url":name,"md5":FileRegister.FileHash(path),"size":size}
+
+def PrecacheManifest(writer: FileRegister.HashWriter) -> list[dict]:
+    """Return the list of files for the service worker to precache in order of priority:
+    the site shell and its assets, the main index pages, and the search databases.
+    If --precacheBudget is given, skip files that would exceed it."""
+    pages = [Asset(name) for name in PRECACHE_SHELL] + PRECACHE_PAGES
+    if gOptions.writeFragments:
+        pages = [f for page in pages for f in ((page,FragmentFile(page)) if page.endswith(".html") and page != "index.html" else (page,))]
+    pages += [Asset(name) for name in PRECACHE_SEARCH]
+
+    writers = [writer,AssetWriter()]
+    manifest = []
+    totalSize = 0
+    budget = gOptions.precacheBudget * 1024
+    for name in pages:
+        entry = PrecacheEntry(name,writers)
+        if entry and (not budget or totalSize + entry["size"] <= budget):
+            manifest.append(entry)
+            totalSize += entry["size"]
+    return manifest
+
+def WriteServiceWorker(writer: FileRegister.HashWriter) -> None:
+    """Write the precache manifest and the service worker sw.js, which caches the files in the manifest.
+    If --serviceWorker is off but a service worker was written previously, write one which unregisters itself."""
+    if gOptions.serviceWorker:
+        manifest = PrecacheManifest(writer)
+        writer.WriteTextFile(PRECACHE_MANIFEST,json.dumps({"files":manifest,"totalSize":sum(entry["size"] for entry in manifest)},indent=2))
+    elif os.path.isfile(Utils.PosixJoin(gOptions.prototypeDir,SERVICE_WORKER)):
+        manifest = []
+    else:
+        return
+
+    template = pyratemp.Template(filename=Utils.PosixJoin(gOptions.prototypeDir,"templates","serviceWorker.js"))
+    precache = "[" + ",".join("\n\t" + json.dumps(entry) for entry in manifest) + "\n]"
+    writer.WriteTextFile(SERVICE_WORKER,template(precache=precache,unregister=json.dumps(not gOptions.serviceWorker)))
+
+def UpdateIndexPage() -> None:
+    """Rewrite index.html and the service worker after other modules have changed the assets they refer to.
+    Do nothing if Prototype hasn't written homepage.html yet."""
+    global gAssetNames
+    if not os.path.isfile(Utils.PosixJoin(gOptions.prototypeDir,"homepage.html")):
+        return
+    gAssetNames = FingerprintAssets.PageAssetNames()
+    with FileRegister.HashWriter(gOptions.prototypeDir,"assets/HashCache.json",exactDates=True,compression=Precompression()) as writer:
+        WriteIndexPage(writer)
+        WriteServiceWorker(writer)
 
 def WriteRedirectPages(writer: FileRegister.HashWriter):
     indexPageRedirect = ("../index.html","homepage.html")
@@ -2511,6 +2756,9 @@ def AddArguments(parser):
     parser.add_argument('--globalTemplate',type=str,default='templates/Global.html',help='Template for all pages relative to prototypeDir; Default: templates/Global.html')
     parser.add_argument('--buildOnly',type=str,default='',help='Build only specified sections. Set of topics,tags,clusters,drilldown,events,teachers,search,allexcerpts.')
     parser.add_argument('--buildOnlyIndexes',**Utils.STORE_TRUE,help="Build only index pages")
+    parser.add_argument('--buildTag',type=str,action="append",default=[],help="Build only the pages for this tag and the indexes of its section; leave all other files untouched. May be repeated.")
+    parser.add_argument('--buildEvent',type=str,action="append",default=[],help="Build only the pages for this event code and the tag and teacher pages that contain its excerpts. May be repeated.")
+    parser.add_argument('--buildTeacher',type=str,action="append",default=[],help="Build only the pages for this teacher and the indexes of its section. May be repeated.")
     parser.add_argument('--excerptsPerPage',type=int,default=100,help='Maximum excerpts per page')
     parser.add_argument('--minSubsearchExcerpts',type=int,default=10,help='Create subsearch pages for pages with at least this many excerpts.')
     parser.add_argument('--attributeAll',**Utils.STORE_TRUE,help="Attribute all excerpts; mostly for debugging")
@@ -2520,10 +2768,28 @@ def AddArguments(parser):
     parser.add_argument('--redirectToJavascript',**Utils.STORE_TRUE,help="Redirect page to index.html/#page if Javascript is available.")
     parser.add_argument('--urlList',type=str,default='',help='Write a list of URLs to this file.')
     parser.add_argument('--keepOldHtmlFiles',**Utils.STORE_TRUE,help="Keep old html files from previous runs; otherwise delete them.")
+    parser.add_argument('--writeFragments',**Utils.STORE_TRUE,help="Also write the body of each page to prototypeDir/fragments so that frame.js can load pages without their <head>.")
+    parser.add_argument('--minifyHtml',type=str,default='',help="Remove indentation and line breaks from html files in these directories of prototypeDir before writing them. Comma-separated list of directories, '.' (top directory), all, or none; Default: none")
+    parser.add_argument('--gzipSitemap',**Utils.STORE_TRUE,help="Write gzipped sitemaps listed in the sitemap index sitemap.xml.")
+    parser.add_argument('--serviceWorker',**Utils.STORE_TRUE,help="Write a service worker which caches the site shell, assets, and main index pages for offline use.")
+    parser.add_argument('--precacheBudget',type=int,default=0,help="Limit the files cached by --serviceWorker to this many KB; Default: 0 (no limit)")
+    parser.add_argument('--precompress',**Utils.STORE_TRUE,help="Write .gz (and .br if the brotli module is installed) copies of html, json, and other text files.")
+    parser.add_argument('--gzipLevel',type=int,default=9,help="Compression level (1-9) of .gz files written by --precompress.")
+    parser.add_argument('--brotliQuality',type=int,default=11,help="Compression quality (0-11) of .br files written by --precompress.")
     
 gAllSections = {"topics","tags","clusters","drilldown","events","teachers","search","allexcerpts"}
 def ParseArguments():
-    if gOptions.buildOnly == "":
+    if gOptions.buildTag or gOptions.buildEvent or gOptions.buildTeacher:
+        if gOptions.buildOnly:
+            Alert.caution("--buildOnly is ignored in targeted builds (--buildTag, --buildEvent, --buildTeacher).")
+        gOptions.buildOnly = set()
+        if gOptions.buildTag:
+            gOptions.buildOnly.add("tags")
+        if gOptions.buildEvent:
+            gOptions.buildOnly.update(("events","tags","teachers"))
+        if gOptions.buildTeacher:
+            gOptions.buildOnly.add("teachers")
+    elif gOptions.buildOnly == "":
         if gOptions.buildOnlyIndexes:
             gOptions.buildOnly = {"topics","tags","clusters","events","teachers"}
         else:
@@ -2537,6 +2803,11 @@ def ParseArguments():
             Alert.warning(f"--buildOnly: Unrecognized section(s) {unknownSections} will be ignored.")
             gOptions.buildOnly = gOptions.buildOnly.difference(unknownSections)
 
+    if gOptions.minifyHtml.lower() in ("","none"):
+        gOptions.minifyHtml = set()
+    else:
+        gOptions.minifyHtml = set(directory.strip().strip("/") or "." for directory in gOptions.minifyHtml.split(','))
+
 def Initialize() -> None:
     pass
 
@@ -2551,10 +2822,16 @@ def YieldAllIf(iterator:Iterator,yieldAll:bool) -> Iterator:
         yield next(iter(iterator))
 
 def main():
+    global gBuildTargets, gAssetNames
     if not os.path.exists(gOptions.prototypeDir):
         os.makedirs(gOptions.prototypeDir)
     
-    if gOptions.buildOnly != gAllSections:
+    gBuildTargets = BuildTargets()
+    gAssetNames = FingerprintAssets.PageAssetNames()
+    if gBuildTargets:
+        targetCounts = ", ".join(f"{len(keys)} {kind}(s)" for kind,keys in gBuildTargets.items() if keys)
+        Alert.info(f"Targeted build of {targetCounts}; other pages are left untouched.")
+    elif gOptions.buildOnly != gAllSections:
         if gOptions.buildOnly:
             Alert.warning(f"Building only section(s) --buildOnly {gOptions.buildOnly}. This should be used only for testing and debugging purposes.")
         else:
@@ -2582,7 +2859,7 @@ def main():
     mainMenu.append([Html.PageInfo("Back to Abhayagiri.org","https://www.abhayagiri.org/questions-and-stories")])
     
     with (open(gOptions.urlList if gOptions.urlList else os.devnull,"w") as urlListFile,
-            FileRegister.HashWriter(gOptions.prototypeDir,"assets/HashCache.json",exactDates=True) as writer):
+            FileRegister.HashWriter(gOptions.prototypeDir,"assets/HashCache.json",exactDates=True,compression=Precompression()) as writer):
         
         startTime = time.perf_counter()
         pageWriteTime = 0.0
@@ -2595,12 +2872,15 @@ def main():
         Alert.extra(f"Prototype main build loop took {time.perf_counter() - startTime:.3f} seconds.")
         Alert.extra(f"File writing time: {pageWriteTime:.3f} seconds.")
 
-        writer.WriteTextFile("sitemap.xml",XmlSitemap(writer))
         WriteIndexPage(writer)
         WriteRedirectPages(writer)
+        WriteServiceWorker(writer)
+        ReportMinification()
         Alert.extra("html files:",writer.StatusSummary())
-        if gOptions.buildOnly == gAllSections and writer.Count(FileRegister.Status.STALE):
-            Alert.extra("stale files:",writer.FilesWithStatus(FileRegister.Status.STALE))
-        if not gOptions.keepOldHtmlFiles and not gOptions.buildOnlyIndexes:
+        staleFiles = [f for f in writer.FilesWithStatus(FileRegister.Status.STALE) if not re.match(SITEMAP_FILES,f)]
+        if gOptions.buildOnly == gAllSections and staleFiles:
+            Alert.extra("stale files:",staleFiles) # WriteSitemap rewrites the sitemap files below
+        if not gOptions.keepOldHtmlFiles and not gOptions.buildOnlyIndexes and not gBuildTargets:
             DeleteUnwrittenHtmlFiles(writer)
+        WriteSitemap(writer)
     
\ No newline at end of file
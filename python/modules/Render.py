@@ -101,7 +101,7 @@ def AddImplicitAttributions() -> None:
             if not readBy:
                 sessionTeachers = session["teachers"]
                 newAnnotation = {"kind": "Read by", "flags": "","text": "","teachers": sessionTeachers,"indentLevel": 1}
-                x["annotations"].insert(0,newAnnotation)
+                Database.AttachAnnotation(x,newAnnotation,0)
         for n,a in reversed(list(enumerate(x["annotations"]))): # Go backwards to allow multiple insertions
             if a["kind"] == "Reading":
                 readBy = [subA for subA in Database.ChildAnnotations(x,a) if subA["kind"] == "Read by"]
@@ -111,7 +111,7 @@ def AddImplicitAttributions() -> None:
                     else:
                         readers = x["teachers"]
                     newAnnotation = {"kind": "Read by", "flags": "","text": "","teachers": readers,"indentLevel": a["indentLevel"] + 1}
-                    x["annotations"].insert(n + 1,newAnnotation)
+                    Database.AttachAnnotation(x,newAnnotation,n + 1)
 
 @lru_cache(maxsize = None)
 def CompileTemplate(template: str) -> Type[pyratemp.Template]:
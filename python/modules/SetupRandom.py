@@ -1,14 +1,22 @@
-"""Maintain pages/assets/RandomExcerpts.json, which contains rendered random featured excerpts to display on the homepage.
+"""Maintain pages/assets/RandomExcerpts.json, which indexes rendered random featured excerpts to display on the homepage.
+The excerpts themselves are stored in small shards in pages/assets/RandomExcerpts/ so that the homepage needs to
+download only the shard containing the excerpt it displays. Each shard stores its repeated html fragments in a
+string table; see StringTable.py. Rendered excerpts are kept in assets/RandomExcerptCache.json, so only
+excerpts which have changed are rendered again.
 """
 
 from __future__ import annotations
 
-import os, json, datetime
+import os, json, datetime, hashlib
 import random
+from functools import lru_cache
 from typing import NamedTuple, Iterable
-import Utils, Alert, Prototype, Filter, Database
+import Utils, Alert, Prototype, Filter, Database, StringTable, FileRegister, Link
+import Html2
 import Filter
 
+SHARD_HASH_LENGTH = 10 # Shards are named by this many hex digits of their md5 hash
+
 def ExcerptEntry(excerpt:dict[str]) -> dict[str]:
     """Return a dictionary containing the information needed to display this excerpt on the front page."""
     
@@ -37,8 +45,37 @@ def ExcerptEntry(excerpt:dict[str]) -> dict[str]:
         "html": html,
     }
 
+def RenderContext() -> str:
+    "Return a hash of the options and code which affect ExcerptEntry."
+    options = {name:getattr(gOptions,name,None) for name in ("attributeAll","draftFTags","maxPlayerTitleLength","mirrorUrl","excerptMp3","prototypeDir")}
+    return FileRegister.StageKey([],options,[module.__file__ for module in (Prototype,Html2,Database,Link)] + [__file__])
+
+def EntryVersion(excerpt: dict[str],context: str,sessionDict: dict[str,dict[int,dict[str]]]) -> str:
+    """Return a hash of excerpt and the database records which affect its entry.
+    context: the value returned by RenderContext; sessionDict: the value returned by Database.SessionDict."""
+    
+    items = [excerpt] + excerpt["annotations"]
+    tags = set(tag for item in items for tag in list(item.get("tags",())) + list(item.get("fTags",())))
+    teachers = set(teacher for item in items for key,value in item.items() if key.startswith("teachers") for teacher in value)
+    subtopics = set(subtopic for tag in tags for subtopic in gDatabase["tag"].get(tag,{}).get("partOfSubtopics",()))
+    keyTopics = set(gDatabase["subtopic"][subtopic]["topicCode"] for subtopic in subtopics if subtopic in gDatabase["subtopic"])
+    related = {
+        "event": gDatabase["event"].get(excerpt["event"]),
+        "session": sessionDict[excerpt["event"]].get(excerpt["sessionNumber"]),
+        "tags": {tag:gDatabase["tag"].get(tag) for tag in sorted(tags)},
+        "teachers": {teacher:gDatabase["teacher"].get(teacher) for teacher in sorted(teachers)},
+        "subtopics": {subtopic:gDatabase["subtopic"].get(subtopic) for subtopic in sorted(subtopics)},
+        "keyTopics": {topic:gDatabase["keyTopic"].get(topic) for topic in sorted(keyTopics)}
+    }
+    data = json.dumps([context,excerpt,related],sort_keys=True,default=str)
+    return hashlib.md5(data.encode("utf-8"),usedforsecurity=False).hexdigest()
+
+@lru_cache(maxsize=None)
 def FeaturedExcerptEntries() -> list[dict[str]]:
-    """Return a list of entries corresponding to featured excerpts in key topics."""
+    """Return a list of entries corresponding to featured excerpts in key topics.
+    Only excerpts which have changed since they were stored in the entry cache are rendered.
+    The list is computed once per database and shared by SetupSearch and SetupRandom, so callers must
+    copy the entries before modifying them."""
 
     keyTopicFilter = Filter.FTag(Database.KeyTopicTags().keys())
     keyTopicFilter = Filter.And(keyTopicFilter,Filter.MaxFTagOrder(500))
@@ -46,7 +83,26 @@ def FeaturedExcerptEntries() -> list[dict[str]]:
 
     removeFragments = Filter.Kind(Filter.InverseSet(["Fragment"]))
     featuredExcerpts = [removeFragments.FilterAnnotations(x) for x in featuredExcerpts]
-    return [ExcerptEntry(x) for x in featuredExcerpts]
+
+    context = RenderContext()
+    sessionDict = Database.SessionDict()
+    entries = []
+    rendered = 0
+    with FileRegister.RenderCache(gOptions.prototypeDir,"assets/RandomExcerptCache.json") as cache:
+        for excerpt in featuredExcerpts:
+            itemCode = Database.ItemCode(excerpt)
+            version = EntryVersion(excerpt,context,sessionDict)
+            record = cache.Lookup(itemCode,version)
+            if record:
+                entries.append(record["entry"])
+            else:
+                entries.append(ExcerptEntry(excerpt))
+                cache.Store(itemCode,version,entries[-1])
+                rendered += 1
+        cache.RemoveStaleRecords()
+    
+    Alert.extra(f"Rendered {rendered} of {len(entries)} featured excerpts; the others were unchanged.")
+    return entries
 
 def Header() -> dict[str]:
     """Return a dict describing the conditions under which the random excerpts were built."""
@@ -62,7 +118,7 @@ def Header() -> dict[str]:
 def RemakeRandomExcerpts(maxLength:int = 0,shuffle = True) -> dict[str]:
     """Return a completely new random excerpt dictionary"""
 
-    entries = FeaturedExcerptEntries()
+    entries = [dict(entry) for entry in FeaturedExcerptEntries()]
     if shuffle:
         random.shuffle(entries)
     if maxLength:
@@ -70,14 +126,50 @@ def RemakeRandomExcerpts(maxLength:int = 0,shuffle = True) -> dict[str]:
     
     return dict(**Header(),excerpts=entries)
 
+def ShardDirectory() -> str:
+    "Return the directory containing the shards of the random excerpt database."
+    return os.path.splitext(gOptions.randomExcerptDatabase)[0]
+
+def PreviousShards() -> list[str]:
+    "Return the shards listed in the random excerpt index written by the previous build."
+    try:
+        with open(gOptions.randomExcerptDatabase,encoding='utf-8') as file:
+            return json.load(file).get("shards",[])
+    except (FileNotFoundError,json.JSONDecodeError):
+        return []
+
 def WriteDatabase(newDatabase: dict[str]) -> None:
-    """Write newDatabase to the random excerpt .json file"""
-    with open(gOptions.randomExcerptDatabase, 'w', encoding='utf-8') as file:
-        json.dump(newDatabase, file, ensure_ascii=False, indent=2)
+    """Split the excerpts in newDatabase into shards of --randomShardSize excerpts named by their md5 hash and write them.
+    Then write newDatabase with key "shards" listing the shards (relative to prototypeDir) in place of key "excerpts"
+    to the random excerpt index. The shards of the previous build are kept for browsers holding the previous index."""
+    
+    excerpts = newDatabase.pop("excerpts")
+    shardSize = max(1,gOptions.randomShardSize)
+    shardDir = ShardDirectory()
+    previousShards = PreviousShards()
+    shards = []
+    with Prototype.AssetWriter() as writer:
+        for start in range(0,len(excerpts),shardSize):
+            shard = StringTable.Encode({"excerpts":excerpts[start:start + shardSize]})
+            shardJson = json.dumps(shard,ensure_ascii=False,separators=(",",":"))
+            shardHash = hashlib.md5(shardJson.encode("utf-8"),usedforsecurity=False).hexdigest()
+            shardFile = Utils.PosixJoin(shardDir,shardHash[:SHARD_HASH_LENGTH] + ".json")
+            writer.WriteTextFile(shardFile,shardJson)
+            shards.append(os.path.relpath(shardFile,gOptions.prototypeDir).replace(os.sep,"/"))
+
+        newDatabase |= {"excerptCount":len(excerpts),"shardSize":shardSize,"shards":shards}
+        writer.WriteTextFile(gOptions.randomExcerptDatabase,json.dumps(newDatabase,ensure_ascii=False,separators=(",",":")))
+
+        for shard in set(previousShards) - set(shards):
+            writer.SetStatus(Utils.PosixJoin(gOptions.prototypeDir,shard),FileRegister.Status.UNCHANGED)
+        writer.DeleteUnregisteredFiles(shardDir,filterRegex=r".*\.json$")
+    
+    Alert.extra(f"Wrote {len(excerpts)} random excerpts in {len(shards)} shard(s).")
 
 def AddArguments(parser) -> None:
     "Add command-line arguments used by this module"
     parser.add_argument('--randomExcerptDatabase',type=str,default="pages/assets/RandomExcerpts.json",help="Random excerpt database filename.")
+    parser.add_argument('--randomShardSize',type=int,default=25,help="Store this many random excerpts in each shard of the random excerpt database.")
     parser.add_argument('--randomExcerptCount',type=int,default=0,help="Include only this many random excerpts in the database.")
     parser.add_argument('--homepageDefaultExcerpt',type=str,default="WR2018-2_S03_F01",help="Item code of exerpt to embed in homepage.html.")
     # parser.add_argument('--option',**Utils.STORE_TRUE,help='This is an option.')
@@ -95,4 +187,5 @@ def main() -> None:
     random.seed(42)
     database = RemakeRandomExcerpts(maxLength=gOptions.randomExcerptCount)
     WriteDatabase(database)
+    Prototype.UpdateIndexPage()
     
@@ -1,11 +1,13 @@
-"""Create assets/SearchDatabase.json for easily searching the excerpts.
+"""Create assets/SearchDatabase.json for easily searching the excerpts
+and assets/SearchIndex.json, a trigram index of the search blobs which narrows the search; see SearchIndex.py.
+Repeated html fragments in SearchDatabase.json are stored in a string table; see StringTable.py.
 """
 
 from __future__ import annotations
 
 import os, json, re
 import Database, SetupRandom
-import Utils, Alert, ParseCSV, Prototype, Filter
+import Utils, Alert, ParseCSV, Prototype, Filter, SearchIndex, StringTable
 import Html2 as Html
 from typing import Iterable, Iterator, Callable
 import itertools
@@ -310,6 +312,12 @@ gOptions = None
 gDatabase:dict[str] = {} # These globals are overwritten by QSArchive.py, but we define them to keep Pylance happy
 
 def main() -> None:
+    global gNonSearchableTeacherRegex
+    gNonSearchableTeacherRegex = None
+    gBlobDict.clear()
+    gInputChars.clear()
+    gOutputChars.clear()
+
     optimizedDB = {"searches": {}}
 
     AddSearch(optimizedDB["searches"],"k","key topic",KeyTopicBlobs())
@@ -326,5 +334,14 @@ def main() -> None:
     Alert.debug("Removed these chars:","".join(sorted(gInputChars - gOutputChars)))
     Alert.debug("Characters remaining in blobs:","".join(sorted(gOutputChars)))
 
-    with open(Utils.PosixJoin(gOptions.prototypeDir,"assets","SearchDatabase.json"), 'w', encoding='utf-8') as file:
-        json.dump(optimizedDB, file, ensure_ascii=False, indent=2)
\ No newline at end of file
+    searchIndex = {"version": SearchIndex.FORMAT_VERSION,"searches": {}}
+    for code,search in optimizedDB["searches"].items():
+        if code != "random":
+            searchIndex["searches"][code] = SearchIndex.BuildIndex(search["items"])
+            search["blobHash"] = searchIndex["searches"][code]["blobHash"]
+
+    StringTable.Encode(optimizedDB)
+    with Prototype.AssetWriter() as writer:
+        writer.WriteTextFile(Utils.PosixJoin(gOptions.prototypeDir,"assets","SearchDatabase.json"),json.dumps(optimizedDB,ensure_ascii=False,separators=(",",":")))
+        writer.WriteTextFile(Utils.PosixJoin(gOptions.prototypeDir,"assets","SearchIndex.json"),json.dumps(searchIndex,ensure_ascii=False,separators=(",",":")))
+    Prototype.UpdateIndexPage()
@@ -1,13 +1,15 @@
-"""Use Mp3DirectCut.exe to split the session audio files into individual excerpts based on start and end times from Database.json"""
+"""Split the session audio files into individual excerpts based on start and end times from Database.json.
+Use Mp3DirectCut.exe on Windows or Mp3DirectCut's native Python engine on any operating system."""
 
 from __future__ import annotations
 
-import os, json, platform
+import os, json, platform, contextlib, posixpath, multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 import Database
-import Utils, Alert, Link, TagMp3, PrepareUpload
+import Utils, Alert, Link, TagMp3, PrepareUpload, FileRegister, LocalMp3, Mp3Frames
 import Mp3DirectCut
 from Mp3DirectCut import Clip, ClipTD
-from typing import List, Union, NamedTuple
+from typing import List, Union, NamedTuple, Iterable
 from datetime import timedelta
 
 Mp3DirectCut.SetExecutable(Utils.PosixToWindows(Utils.PosixJoin('tools','Mp3DirectCut')))
@@ -16,7 +18,9 @@ def AddArguments(parser):
     "Add command-line arguments used by this module"
     parser.add_argument('--overwriteMp3',**Utils.STORE_TRUE,help="Overwrite existing excerpt mp3 files; otherwise leave existing files untouched")
     parser.add_argument('--redoJoinMp3',**Utils.STORE_TRUE,help="Overwrite mp3 files for excerpts that join clips together")
-    parser.add_argument('--joinUsingPydub',**Utils.STORE_TRUE,help="Use pydub to smoothly join audio clips (requires pydub and ffmpeg)")
+    parser.add_argument('--joinUsingPydub',**Utils.STORE_TRUE,help="Use pydub to smoothly join audio clips (requires pydub and ffmpeg); ignored by the native split engine")
+    parser.add_argument('--splitWorkers',type=int,default=4,help="Split this many groups of source files at once when --multithread is given; default: 4")
+    parser.add_argument('--splitEngine',type=str,default="auto",choices=["auto","native","mp3DirectCut"],help="Split mp3 files using mp3DirectCut.exe (Windows only) or natively in Python; auto: mp3DirectCut.exe if available; default: auto")
 
 def ParseArguments() -> None:
     pass
@@ -27,15 +31,51 @@ def Initialize() -> None:
 gOptions = None
 gDatabase:dict[str] = {} # These globals are overwritten by QSArchive.py, but we define them to keep Pylance happy
 
-def main():
-    """ Split the Q&A session mp3 files into individual excerpts.
-    Read the beginning and end points from Database.json."""
-    
-    if platform.system() != "Windows":
-        Alert.error(f"SplitMp3 requires Windows to run mp3DirectCut.exe. mp3 files cannot be split on {platform.system()}.")
-        return
+def OSPath(path: str) -> str:
+    "Convert a posix path to the format used by this operating system."
+    return Utils.PosixToWindows(path) if platform.system() == "Windows" else path
+
+class GroupResult(NamedTuple):
+    error: str              # The error message if the group couldn't be split; otherwise ""
+    fatal: bool             # Is the error fatal to all groups, e.g. mp3DirectCut.exe isn't found?
+    frameIndexRecords: dict # The frame index records of the source files if SplitGroup ran in a worker process
+
+def SplitGroup(sources: Iterable[str],clipsDict: dict[str,list[Clip]],clipsTags: dict[str,list[Clip]],outputDir: str) -> GroupResult:
+    """Split a group of source files into the excerpt files in clipsDict and tag them with their clips in clipsTags.
+    This function runs in a worker process or thread, so it returns errors rather than reporting them."""
+
+    try:
+        Mp3DirectCut.MultiFileSplitJoin(clipsDict,outputDir=OSPath(outputDir))
+        for filename in clipsDict:
+            TagMp3.TagMp3WithClips(Utils.PosixJoin(outputDir,filename),clipsTags[filename])
+        result = GroupResult("",False,{})
+    except Mp3DirectCut.ExecutableNotFound as err:
+        result = GroupResult(str(err),True,{})
+    except (Mp3DirectCut.Mp3CutError,ValueError,OSError) as err:
+        result = GroupResult(str(err),False,{})
     
-    Mp3DirectCut.joinUsingPydub = gOptions.joinUsingPydub
+    frameIndexCache = Mp3DirectCut.frameIndexCache
+    if frameIndexCache is not None and multiprocessing.parent_process() is not None:
+        # Our copy of the register will be discarded, so return the records of our source files to the main process.
+        for source in sources:
+            record = frameIndexCache.record.get(posixpath.normpath(source))
+            if record:
+                result.frameIndexRecords[posixpath.normpath(source)] = {k:v for k,v in record.items() if not k.startswith("_")}
+    return result
+
+def SplitPool() -> Executor:
+    """Return an executor which splits at most --splitWorkers groups of source files at once.
+    Use worker processes if they can be forked. Spawned processes would have to rerun QSarchive.py, so
+    on Windows use threads, which still run several copies of mp3DirectCut.exe at once."""
+    if not gOptions.multithread or gOptions.splitWorkers <= 1:
+        return Utils.MockThreadPoolExecutor()
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(gOptions.splitWorkers,mp_context=multiprocessing.get_context("fork"))
+    return ThreadPoolExecutor(gOptions.splitWorkers)
+
+def SplitExcerpts(mp3Cache: FileRegister.Mp3InfoCache) -> None:
+    """Split the excerpts that need splitting. Link.LocalItemNeeded checks existing excerpt files using mp3Cache,
+    so only files that have changed since the last run are opened."""
 
     # Step 1: Determine which excerpt mp3 files need to be created
     eventExcerptClipsDict:dict[str,dict[str,list[Mp3DirectCut.Clip]]] = {}
@@ -71,7 +111,7 @@ def main():
                     sourceFile = session["filename"]
                 source = gDatabase["audioSource"].get(sourceFile,None)
                 if source:
-                    clips[index] = clips[index]._replace(file=Utils.PosixToWindows(Link.URL(source,"local")))
+                    clips[index] = clips[index]._replace(file=OSPath(Link.URL(source,"local")))
                 else:
                     Alert.error(f"Cannot find source file '{sourceFile}' for",excerpt,". Will not split this excerpt.")
                     allFilesFound = False
@@ -94,39 +134,61 @@ def main():
     def DownloadItem(item: dict) -> None:
         Link.DownloadItem(item,scanRemoteMirrors=False)
 
-    with Utils.ConditionalThreader() as pool:
+    with Link.OpenHttpClient(), Utils.ConditionalThreader() as pool:
         for sourceFile in allSources:
             pool.submit(DownloadItem,sourceFile)
 
+    # Step 3: Split each group of source files in parallel
+    # Group clips by sources so that an error in one group lets us continue to split the remaining groups.
+    groups = [(eventName,sources,clipsDict) for eventName,excerptClipsDict in eventExcerptClipsDict.items()
+                for sources,clipsDict in Mp3DirectCut.GroupBySourceFiles(excerptClipsDict)]
     splitCount = 0
     errorCount = 0
-    # Step 3: Loop over all events and split mp3 files
-    for eventName,excerptClipsDict in eventExcerptClipsDict.items():
-        outputDir = Utils.PosixJoin(gOptions.excerptMp3Dir,eventName)
-        os.makedirs(outputDir,exist_ok=True)
-
-        # Group clips by sources and call MultiFileSplitJoin multiple times.
-        # If there is an error, this lets us continue to split the remaining files.
-        for sources,clipsDict in Mp3DirectCut.GroupBySourceFiles(excerptClipsDict):
-            # Invoke Mp3DirectCut on each group of clips:
-            try:
-                Mp3DirectCut.MultiFileSplitJoin(clipsDict,outputDir=Utils.PosixToWindows(outputDir))
-            except Mp3DirectCut.ExecutableNotFound as err:
-                Alert.error(err)
+    with SplitPool() as pool:
+        futures = []
+        for eventName,sources,clipsDict in groups:
+            outputDir = Utils.PosixJoin(gOptions.excerptMp3Dir,eventName)
+            os.makedirs(outputDir,exist_ok=True)
+            clipsTags = {filename:excerptsByFilename[filename]["clips"] for filename in clipsDict}
+            futures.append(pool.submit(SplitGroup,sources,clipsDict,clipsTags,outputDir))
+        
+        for groupNumber,((eventName,sources,clipsDict),future) in enumerate(zip(groups,futures),start=1):
+            result = future.result()
+            if Mp3DirectCut.frameIndexCache is not None:
+                Mp3DirectCut.frameIndexCache.Merge(result.frameIndexRecords)
+            if result.fatal:
+                Alert.error(result.error)
                 Alert.status("Continuing to next module.")
+                for future in futures:
+                    future.cancel()
                 return
-            except (Mp3DirectCut.Mp3CutError,ValueError,OSError) as err:
-                Alert.error(f"{eventName}: {err} occured when splitting source files {sources}.")
+            if result.error:
+                Alert.error(f"{eventName}: {result.error} occured when splitting source files {sources}.")
                 Alert.status("Continuing to next source file(s).")
                 errorCount += 1
                 continue
             
+            outputDir = Utils.PosixJoin(gOptions.excerptMp3Dir,eventName)
             for filename in clipsDict:
-                filePath = Utils.PosixJoin(outputDir,filename)
-                TagMp3.TagMp3WithClips(filePath,excerptsByFilename[filename]["clips"])
+                with contextlib.suppress(OSError,Mp3Frames.Mp3FormatError):
+                    LocalMp3.Read(Utils.PosixJoin(outputDir,filename),mp3Cache)
             
             splitCount += 1
             sources = set(os.path.split(source)[1] for source in sources)
-            Alert.info(f"{eventName}: Split {sources} into {len(clipsDict)} files.")
+            Alert.info(f"{eventName}: Split {sources} into {len(clipsDict)} files. ({groupNumber}/{len(groups)} source file groups)")
     
-    Alert.status(f"   {splitCount} source file groups split; {errorCount} source file groups had errors.")
\ No newline at end of file
+    Alert.status(f"   {splitCount} source file groups split; {errorCount} source file groups had errors.")
+
+def main():
+    """ Split the Q&A session mp3 files into individual excerpts.
+    Read the beginning and end points from Database.json."""
+    
+    Mp3DirectCut.joinUsingPydub = gOptions.joinUsingPydub
+    Mp3DirectCut.engine = gOptions.splitEngine
+    with Link.OpenLocalMp3Cache() as mp3Cache, Link.OpenFrameIndexCache(pruneUnused=True) as frameIndexCache:
+        Mp3DirectCut.frameIndexCache = frameIndexCache
+        try:
+            SplitExcerpts(mp3Cache)
+        finally:
+            Mp3DirectCut.frameIndexCache = None
+        Alert.extra("Frame index cache:",frameIndexCache.StatusSummary())
@@ -3,9 +3,11 @@ We leave the session file tags untouched."""
 
 from __future__ import annotations
 
-import json, re, os
+import json, re, os, contextlib, hashlib
+from concurrent.futures import Future
+from enum import Enum, auto
 import Database
-import Utils, Alert, Filter, Link
+import Utils, Alert, Filter, Link, FileRegister, LocalMp3, Mp3Frames
 from typing import Tuple, Type, Callable
 from Mp3DirectCut import Clip
 import mutagen
@@ -128,11 +130,13 @@ def ExcerptTags(excerpt: dict) -> dict:
     
     return returnValue
 
+PLURAL_KEYS = ["artist","albumartist"] # CompareTags sorts these before writing them
+
 def CompareTags(tagsToWrite:dict, existingTags:EasyID3) -> bool:
     "Compare tags to be written to existingTags. Return True if tags should be written to disk."
 
     existingTags = dict(existingTags)
-    pluralKeys = ["artist","albumartist"]
+    pluralKeys = PLURAL_KEYS
     if gOptions.ID3version == 3:
         tagsToWrite.pop("discsubtitle",None) # ID3 v2.3 doesn't implement the discsubtitle tag
         for key in pluralKeys:
@@ -148,6 +152,13 @@ def CompareTags(tagsToWrite:dict, existingTags:EasyID3) -> bool:
 
     return tagsToWriteCompare != existingTags
 
+def TagsAsWritten(tags: dict) -> dict:
+    """Return the tags that EasyID3 will read back after we write tags to a file.
+    ID3 v2.3 joins multiple values with '/' and doesn't implement discsubtitle."""
+    if gOptions.ID3version == 3:
+        return {key:(["/".join(sorted(value))] if key in PLURAL_KEYS else value) for key,value in tags.items() if key != "discsubtitle"}
+    return tags
+
 def TagMp3WithClips(mp3File: str,clips: list[Clip]):
     """Add an ID3 clips tag containing the contents of clips to mp3File."""
     try:
@@ -159,6 +170,113 @@ def TagMp3WithClips(mp3File: str,clips: list[Clip]):
     fileTags["clips"] = json.dumps(clips)
     fileTags.save(v1=2,v2_version=gOptions.ID3version)
 
+def TagFingerprint(tags: dict) -> str:
+    "Return a digest of the tags we want to write and the options that affect how they are written."
+    options = (gOptions.ID3version,gOptions.writeMp3Tags)
+    return hashlib.md5(json.dumps([tags,options],sort_keys=True,ensure_ascii=False).encode("utf-8"),usedforsecurity=False).hexdigest()
+
+class TagResult(Enum):
+    UNCHANGED = auto()
+    UPDATED = auto()
+    WOULD_UPDATE = auto() # --writeMp3Tags never and the tags differ
+
+def UpdateFileTags(path: str,tags: dict) -> tuple[TagResult,bool]:
+    """Compare tags with the tags in the mp3 file at path and write them if --writeMp3Tags says to.
+    This runs in a worker thread, so it returns its results rather than printing them.
+    Returns the result and whether the file had no tags."""
+
+    addedTags = False
+    try:
+        fileTags = EasyID3(path)
+    except mutagen.id3.ID3NoHeaderError:
+        fileTags = mutagen.File(path,easy=True)
+        fileTags.add_tags()
+        addedTags = True
+
+    if "clips" in fileTags: 
+        tags["clips"] = fileTags["clips"]
+        # The clips tag describes the audio source and is created by TagMp3.py; just let it pass through
+    writeTags = CompareTags(tags,fileTags)
+
+    if gOptions.writeMp3Tags == "never":
+        return (TagResult.WOULD_UPDATE if writeTags else TagResult.UNCHANGED),addedTags
+    elif gOptions.writeMp3Tags == "always":
+        writeTags = True
+    
+    if writeTags:
+        fileTags.delete()
+        for t in tags:
+            fileTags[t] = tags[t]
+        fileTags.save(v1=2,v2_version=gOptions.ID3version)
+        return TagResult.UPDATED,addedTags
+    return TagResult.UNCHANGED,addedTags
+
+def TagFiles(mp3Cache: FileRegister.Mp3InfoCache,tagCache: FileRegister.Mp3TagCache) -> None:
+    """Write tags to the excerpt mp3 files.
+    tagCache records the fingerprint of the tags last written to or verified in each file along with the
+    file's size and modification time. Files whose fingerprint and version match aren't opened.
+    Nor are files whose tag digest in mp3Cache matches the tags we would write.
+    The remaining files are read and written by a pool of worker threads. Results are reported in
+    database order so that the output doesn't depend on thread scheduling."""
+    
+    changeCount = sameCount = 0
+    changedOnDisk = 0 # Files we checked because they changed on disk although their tags didn't
+    localMirrors = {"local",gOptions.uploadMirror}
+    jobs:list[tuple[str,str,list[str],Future]] = []
+    with Utils.ConditionalThreader() as pool:
+        for x in gDatabase["excerpts"]:
+            if gOptions.events != "All" and x["event"] not in gOptions.events:
+                continue # Only tag mp3 files for the specifed events
+            if not x["fileNumber"] or x["mirror"] not in localMirrors:
+                continue # Ignore session excerpts and remote excerpts
+            
+            tags = ExcerptTags(x)
+            fingerprint = TagFingerprint(tags)
+
+            path = Link.LocalFile(x)
+            changes = ["fingerprint","version"]
+            if gOptions.writeMp3Tags != "always":
+                try:
+                    changes = tagCache.Changes(path,fingerprint,LocalMp3.Version(os.stat(path)))
+                    if not changes:
+                        sameCount += 1
+                        continue
+                    if changes == ["version"]:
+                        changedOnDisk += 1
+                    if LocalMp3.Read(path,mp3Cache).tagDigest == LocalMp3.TagDigest(TagsAsWritten(tags)):
+                        tagCache.Store(path,fingerprint,LocalMp3.Version(os.stat(path)))
+                        sameCount += 1
+                        continue
+                except (OSError,Mp3Frames.Mp3FormatError):
+                    pass # Let EasyID3 report the error
+
+            jobs.append((path,fingerprint,changes,pool.submit(UpdateFileTags,path,tags)))
+
+    for path,fingerprint,changes,job in jobs:
+        result,addedTags = job.result()
+        reason = ["(file changed on disk)"] if changes == ["version"] else []
+        if addedTags:
+            Alert.extra("Added tags to",path)
+        if result == TagResult.WOULD_UPDATE:
+            Alert.extra("Would update tags in",path,*reason)
+            changeCount += 1
+            continue
+        
+        if result == TagResult.UPDATED:
+            Alert.extra("Updated tags in",path,*reason)
+            changeCount += 1
+            with contextlib.suppress(OSError,Mp3Frames.Mp3FormatError):
+                LocalMp3.Read(path,mp3Cache) # Record the new tags so we needn't open the file next time
+        else:
+            sameCount += 1
+        with contextlib.suppress(OSError):
+            tagCache.Store(path,fingerprint,LocalMp3.Version(os.stat(path)))
+    
+    updateMessage = "Would update" if gOptions.writeMp3Tags == "never" else "Updated"
+    Alert.info(updateMessage,"tags in",changeCount,"mp3 files;",sameCount,"files unchanged.")
+    if changedOnDisk:
+        Alert.extra(changedOnDisk,"mp3 file(s) changed on disk since their tags were last checked.")
+
 def AddArguments(parser) -> None:
     "Add command-line arguments used by this module"
     parser.add_argument("--writeMp3Tags",type=str,default="Changed",choices=["never","changed","always"],help="Write mp3 tags under these conditions; Default: Changed.")
@@ -181,49 +299,6 @@ mutagen.id3.Frames["CLIP"] = CLIP
 EasyID3.RegisterTextKey("clips","CLIP")
 
 def main() -> None:
-    changeCount = sameCount = 0
-    localMirrors = {"local",gOptions.uploadMirror}
-    for x in gDatabase["excerpts"]:
-        if gOptions.events != "All" and x["event"] not in gOptions.events:
-            continue # Only tag mp3 files for the specifed events
-        if not x["fileNumber"] or x["mirror"] not in localMirrors:
-            continue # Ignore session excerpts and remote excerpts
-        
-        tags = ExcerptTags(x)
-
-        path = Link.LocalFile(x)
-        try:
-            fileTags = EasyID3(path)
-        except mutagen.id3.ID3NoHeaderError:
-            fileTags = mutagen.File(path,easy=True)
-            fileTags.add_tags()
-            Alert.extra("Added tags to",path)
-
-        if "clips" in fileTags: 
-            tags["clips"] = fileTags["clips"]
-            # The clips tag describes the audio source and is created by TagMp3.py; just let it pass through
-        writeTags = CompareTags(tags,fileTags)
-
-        if gOptions.writeMp3Tags == "never":
-            if writeTags:
-                Alert.extra("Would update tags in",path)
-                changeCount += 1
-                writeTags = False
-            else:
-                sameCount += 1
-        elif gOptions.writeMp3Tags == "always":
-            writeTags = True
-        
-        if writeTags:
-            fileTags.delete()
-            for t in tags:
-                fileTags[t] = tags[t]
-            fileTags.save(v1=2,v2_version=gOptions.ID3version)
-            changeCount += 1
-            Alert.extra("Updated tags in",path)
-        else:
-            sameCount += 1
-    
-    updateMessage = "Would update" if gOptions.writeMp3Tags == "never" else "Updated"
-    Alert.info(updateMessage,"tags in",changeCount,"mp3 files;",sameCount,"files unchanged.")
-
+    with (Link.OpenLocalMp3Cache() as mp3Cache,
+          FileRegister.Mp3TagCache(".",Utils.PosixJoin(gOptions.prototypeDir,"assets/Mp3TagCache.json")) as tagCache):
+        TagFiles(mp3Cache,tagCache)
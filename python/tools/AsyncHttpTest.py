@@ -0,0 +1,237 @@
+"""Test AsyncHttp.AsyncHttpClient and the code that calls it against a local http.server running in a thread.
+Check keep-alive connection reuse, truncating bodies with maxBody, chunked bodies and bodies without Content-Length,
+redirects, retries after 5xx responses, timeouts, and the HEAD => GET fallback in Link.RemoteURLChecker and RemoteMp3.Inspect.
+Usage: python python/tools/AsyncHttpTest.py
+Run from the directory containing QSarchive.py."""
+
+import os, sys, asyncio, threading, tempfile, time, argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import Counter
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(scriptDir,'..','utils'))
+sys.path.append(os.path.join(scriptDir,'..','modules'))
+
+import AsyncHttp, RemoteMp3, FileRegister
+
+BODY = bytes(range(256)) * 16 # 4 kB
+
+class TestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1",0),TestHandler)
+        self.connections = 0                # The number of connections accepted
+        self.requests = Counter()           # (method,path) => number of requests received
+        self.lock = threading.Lock()
+
+    def handle_error(self,request,client_address) -> None:
+        if not isinstance(sys.exc_info()[1],ConnectionError): # The client gave up on /slow
+            super().handle_error(request,client_address)
+
+    def Url(self,path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+class TestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep connections alive
+    server: TestServer
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self,format,*args) -> None:
+        pass
+
+    def Count(self) -> int:
+        "Record this request and return the number of times it has been received."
+        with self.server.lock:
+            self.server.requests[self.command,self.path] += 1
+            return self.server.requests[self.command,self.path]
+
+    def SendBody(self,status: int,body: bytes,headers: dict[str,str] = {}) -> None:
+        self.send_response(status)
+        for name,value in headers.items():
+            self.send_header(name,value)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        count = self.Count()
+        if self.path == "/noHead405":
+            self.SendBody(405,b"")
+        elif self.path == "/noHead501":
+            self.SendBody(501,b"")
+        else:
+            self.Respond(count)
+
+    def do_GET(self) -> None:
+        self.Respond(self.Count())
+
+    def Respond(self,count: int) -> None:
+        path = self.path
+        if path in ("/body","/noHead405","/noHead501"):
+            self.SendBody(200,BODY,{"ETag":'"body"'})
+        elif path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding","chunked")
+            self.end_headers()
+            for start in range(0,len(BODY),1000):
+                chunk = BODY[start:start + 1000]
+                self.wfile.write(f"{len(chunk):x};ext=1\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\nX-Trailer: yes\r\n\r\n")
+        elif path == "/noLength":
+            self.send_response(200)
+            self.send_header("Connection","close")
+            self.end_headers()
+            self.wfile.write(BODY)
+            self.close_connection = True
+        elif path == "/redirect":
+            self.SendBody(302,b"",{"Location":"/redirect2"})
+        elif path == "/redirect2":
+            self.SendBody(303,b"",{"Location":self.server.Url("/body")})
+        elif path == "/redirectLoop":
+            self.SendBody(301,b"",{"Location":"/redirectLoop"})
+        elif path == "/flaky":
+            if count == 1:
+                self.SendBody(503,b"Try again")
+            else:
+                self.SendBody(200,b"OK")
+        elif path == "/alwaysDown":
+            self.SendBody(503,b"Down")
+        elif path == "/slow":
+            time.sleep(1.0)
+            self.SendBody(200,b"Late")
+        else:
+            self.SendBody(404,b"Not found")
+
+class Checker:
+    "Count and report failed checks."
+    def __init__(self) -> None:
+        self.checks = self.failures = 0
+
+    def __call__(self,condition: bool,description: str) -> None:
+        self.checks += 1
+        if not condition:
+            self.failures += 1
+            print("FAILED:",description)
+
+async def TestClient(server: TestServer,check: Checker) -> None:
+    "Test AsyncHttpClient on its own."
+
+    async with AsyncHttp.AsyncHttpClient(connectionsPerHost=1,timeout=5.0,retries=2) as client:
+        connectionsBefore = server.connections
+        for _ in range(3):
+            response = await client.Request("GET",server.Url("/body"))
+            check(response.Ok() and response.body == BODY,"Read the body using Content-Length")
+        response = await client.Request("HEAD",server.Url("/body"))
+        check(response.status == 200 and response.body == b"" and response.headers.get("content-length") == str(len(BODY)),
+              "HEAD returns headers only")
+        check(server.connections - connectionsBefore == 1,
+              f"Keep-alive: 4 requests used {server.connections - connectionsBefore} connections rather than 1")
+
+        connectionsBefore = server.connections
+        response = await client.Request("GET",server.Url("/body"),{"Range":"bytes=0-99"},maxBody=100)
+        check(response.body == BODY[:100],"maxBody truncates a longer body")
+        response = await client.Request("GET",server.Url("/body"))
+        check(response.body == BODY and server.connections - connectionsBefore == 1,
+              "A new connection replaces one whose body was truncated")
+
+        response = await client.Request("GET",server.Url("/chunked"))
+        check(response.body == BODY,"Read a chunked body with extensions and trailers")
+        connectionsBefore = server.connections
+        response = await client.Request("GET",server.Url("/chunked"),maxBody=1500)
+        check(response.body == BODY[:1500],"maxBody truncates a chunked body")
+        response = await client.Request("GET",server.Url("/body"))
+        check(response.body == BODY and server.connections - connectionsBefore == 1,
+              "The connection is reused after a chunked body and not after a truncated one")
+
+        response = await client.Request("GET",server.Url("/noLength"))
+        check(response.body == BODY,"Read a body without Content-Length until the connection closes")
+        response = await client.Request("GET",server.Url("/noLength"),maxBody=10)
+        check(response.body == BODY[:10],"maxBody truncates a body without Content-Length")
+        response = await client.Request("GET",server.Url("/body"))
+        check(response.body == BODY,"A request after a connection closed by the server succeeds")
+
+        getsBefore = server.requests["GET","/body"]
+        response = await client.Request("HEAD",server.Url("/redirect"))
+        check(response.status == 200 and response.url == server.Url("/body"),"Follow relative and absolute redirects")
+        check(server.requests["HEAD","/redirect2"] == 1 and server.requests["GET","/body"] == getsBefore + 1 and response.body == BODY,
+              "HEAD is kept after 302 and changed to GET after 303")
+        try:
+            await client.Request("GET",server.Url("/redirectLoop"))
+            check(False,"Too many redirects raises HttpError")
+        except AsyncHttp.HttpError:
+            check(server.requests["GET","/redirectLoop"] == client.maxRedirects + 1,"Stop after maxRedirects redirects")
+
+        start = time.perf_counter()
+        response = await client.Request("GET",server.Url("/flaky"))
+        check(response.status == 200 and server.requests["GET","/flaky"] == 2,"Retry after a 503 response")
+        check(time.perf_counter() - start >= 0.5,"Wait before retrying")
+        response = await client.Request("GET",server.Url("/alwaysDown"))
+        check(response.status == 503 and server.requests["GET","/alwaysDown"] == client.retries + 1,
+              "Return the last 5xx response after all retries fail")
+        response = await client.Request("GET",server.Url("/missing"))
+        check(response.status == 404 and server.requests["GET","/missing"] == 1,"Don't retry 4xx responses")
+
+    async with AsyncHttp.AsyncHttpClient(timeout=0.2,retries=1) as client:
+        start = time.perf_counter()
+        try:
+            await client.Request("GET",server.Url("/slow"))
+            check(False,"A slow server raises TimeoutError")
+        except TimeoutError:
+            check(server.requests["GET","/slow"] == 2,"Retry after a timeout")
+            check(time.perf_counter() - start < 1.5,"Give up after timeout and retries")
+
+    async with AsyncHttp.AsyncHttpClient(timeout=5.0,retries=0) as client:
+        try:
+            await client.Request("GET",server.Url("/body").replace("http:","ftp:"))
+            check(False,"Unsupported URL schemes raise HttpError")
+        except AsyncHttp.HttpError:
+            pass
+
+async def TestHeadFallback(server: TestServer,check: Checker) -> None:
+    "Test the HEAD => GET fallback used by the link checker and RemoteMp3.Inspect."
+
+    import Link
+
+    async with AsyncHttp.AsyncHttpClient(timeout=5.0,retries=0) as client:
+        checker = Link.RemoteURLChecker()
+        for path in ("/body","/noHead405","/noHead501","/missing"):
+            valid = await checker.ValidLinkAsync(server.Url(path),{},client)
+            check(valid == (path != "/missing"),f"Link.RemoteURLChecker validates {path}")
+        check(server.requests["GET","/noHead405"] == 1 and server.requests["GET","/noHead501"] == 1,
+              "Link.RemoteURLChecker sends GET when the server doesn't implement HEAD")
+
+        with tempfile.TemporaryDirectory() as cacheDir:
+            cache = FileRegister.Mp3InfoCache(cacheDir)
+            for path in ("/noHead405","/noHead501"):
+                cache.Store(server.Url(path),'"body"',len(BODY),12.5,"Xing",None)
+                getsBefore = server.requests["GET",path]
+                inspection = await RemoteMp3.Inspect(server.Url(path),client,cache)
+                check(inspection.Ok() and inspection.duration == 12.5 and server.requests["GET",path] == getsBefore + 1,
+                      f"RemoteMp3.Inspect falls back to GET for {path} and uses the cached record")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Test AsyncHttp against a local http.server.")
+    parser.parse_args()
+
+    server = TestServer()
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    check = Checker()
+    try:
+        asyncio.run(TestClient(server,check))
+        asyncio.run(TestHeadFallback(server,check))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"{check.checks - check.failures} of {check.checks} checks passed.")
+    sys.exit(1 if check.failures else 0)
+
+if __name__ == "__main__":
+    main()
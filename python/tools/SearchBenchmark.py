@@ -0,0 +1,168 @@
+"""Check and time the Python search engine and the search index written by SetupSearch.
+1. For each query in the corpus (tools/unitTest/searchCorpus.json), search SearchDatabase.json with
+   SearchQuery.Search, compare the results with those recorded from search.js, and report the latency
+   of searching with and without SearchIndex.json.
+2. For each corpus query and a number of random queries, evaluate the query exactly on every item of every search
+   and then only on the candidates found in SearchIndex.json. Report failures if any exact match is missing from the candidates.
+Usage: python python/tools/SearchBenchmark.py [--corpus FILE] [--queries FILE] [--random N]
+Run from the directory containing QSarchive.py."""
+
+import os, sys, json, re, random, time, argparse, statistics
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(scriptDir,'..','utils'))
+
+import SearchQuery, SearchIndex, StringTable
+
+def RandomQueries(database: dict,count: int) -> list[str]:
+    "Return count queries made of one to three word fragments taken from the excerpt blobs."
+    words = set()
+    for item in database["searches"]["x"]["items"]:
+        for blob in item["blobs"]:
+            words.update(re.findall(r"[a-z']{2,}",blob.split(SearchQuery.METADATA_SEPARATOR)[0]))
+    words = sorted(words)
+
+    rng = random.Random(42)
+    return [" ".join(rng.choice(words)[:rng.randint(2,8)] for _ in range(rng.randint(1,3))) for _ in range(count)]
+
+def IndexedSearch(database: dict,index: dict,queryText: str,kind: str) -> dict[str,list[int]]:
+    "Return the same results as SearchQuery.Search, but check only the candidates found in index."
+    query = SearchQuery.SearchQuery(queryText)
+    results = {}
+    for code in SearchQuery.SEARCH_KINDS[kind]:
+        candidates = SearchIndex.Candidates(index["searches"][code],query)
+        results[code] = query.Matches(database["searches"][code]["items"],candidates)
+    return results
+
+def BestTime(function,repeat: int) -> float:
+    "Return the shortest time in ms taken by function() in repeat trials."
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+    return 1000 * best
+
+def LatencySummary(times: list[float]) -> str:
+    "Describe a list of latencies in ms."
+    times = sorted(times)
+    p95 = times[min(len(times) - 1,int(0.95 * len(times)))]
+    return f"median {statistics.median(times):.2f} ms, 95th percentile {p95:.2f} ms, max {times[-1]:.2f} ms"
+
+def CheckCorpus(database: dict,index: dict,corpus: dict,repeat: int) -> int:
+    "Check parity with search.js and time each corpus query. Return the number of failures."
+    failures = 0
+    exactTimes = []
+    indexedTimes = []
+    unrecorded = 0
+    for entry in corpus["queries"]:
+        queryText,kind = entry["query"],entry["kind"]
+        results = SearchQuery.Search(database,queryText,kind)
+        if "digest" not in entry:
+            unrecorded += 1
+        elif SearchQuery.ResultDigest(results) != entry["digest"]:
+            counts = {code:len(numbers) for code,numbers in results.items()}
+            print(f"PARITY FAILURE: {kind} search {queryText!r} found {counts}; search.js found {entry['counts']}")
+            failures += 1
+
+        exactTimes.append(BestTime(lambda: SearchQuery.Search(database,queryText,kind),repeat))
+        if index:
+            indexedTimes.append(BestTime(lambda: IndexedSearch(database,index,queryText,kind),repeat))
+
+    checked = len(corpus["queries"]) - unrecorded
+    print(f"Parity with search.js: {checked - failures}/{checked} corpus queries match the results recorded {corpus.get('recorded','')}.")
+    if unrecorded:
+        print(f"{unrecorded} queries have no recorded results; run node tools/unitTest/recordSearchCorpus.mjs.")
+    print(f"Latency without index: {LatencySummary(exactTimes)}.")
+    if index:
+        print(f"Latency with index:    {LatencySummary(indexedTimes)}.")
+
+    slowest = sorted(zip(exactTimes,corpus["queries"]),key=lambda pair: pair[0],reverse=True)[:5]
+    print("Slowest queries:",", ".join(f"{entry['query']!r} ({ms:.1f} ms)" for ms,entry in slowest))
+    return failures
+
+def CheckIndex(database: dict,index: dict,queries: list[str]) -> int:
+    "Check that the index candidates include all exact matches and compare search times. Return the number of failures."
+    failures = 0
+    for code,searchIndex in index["searches"].items():
+        items = database["searches"][code]["items"]
+        if searchIndex["itemCount"] != len(items):
+            print(f"Search {code}: index has {searchIndex['itemCount']} items but the database has {len(items)}.")
+            failures += 1
+            continue
+        if searchIndex.get("blobHash") != database["searches"][code].get("blobHash"):
+            print(f"Search {code}: the index blob hash doesn't match the database; search.js will ignore the index.")
+            failures += 1
+            continue
+
+        fullTime = indexTime = 0.0
+        found = candidateCount = narrowed = 0
+        for queryText in queries:
+            query = SearchQuery.SearchQuery(queryText)
+
+            start = time.perf_counter()
+            exact = query.Matches(items)
+            fullTime += time.perf_counter() - start
+
+            start = time.perf_counter()
+            candidates = SearchIndex.Candidates(searchIndex,query)
+            indexed = query.Matches(items,candidates)
+            indexTime += time.perf_counter() - start
+
+            found += len(exact)
+            if candidates is None:
+                candidateCount += len(items)
+            else:
+                candidateCount += len(candidates)
+                narrowed += 1
+            if indexed != exact:
+                missing = sorted(set(exact) - set(indexed))
+                print(f"FAILURE: search {code}, query {queryText!r}: candidates omit items {missing[:10]}")
+                failures += 1
+
+        print(f"Search {code}: {len(items)} items; index narrowed {narrowed}/{len(queries)} queries;",
+              f"{candidateCount / len(queries):.1f} candidates and {found / len(queries):.1f} matches per query;",
+              f"full scan {1000 * fullTime / len(queries):.2f} ms, indexed {1000 * indexTime / len(queries):.2f} ms per query.")
+
+    print(f"{len(queries)} queries checked against the index; {failures} failures.")
+    return failures
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the Python search engine against search.js, check the search index, and time searches.")
+    parser.add_argument('--database',type=str,default="pages/assets/SearchDatabase.json",help="Search database filename.")
+    parser.add_argument('--index',type=str,default="pages/assets/SearchIndex.json",help="Search index filename.")
+    parser.add_argument('--corpus',type=str,default="tools/unitTest/searchCorpus.json",help="Query corpus with results recorded from search.js.")
+    parser.add_argument('--queries',type=str,default="",help="A file containing additional queries to check against the index, one per line.")
+    parser.add_argument('--random',type=int,default=200,help="Also check this many queries built from random words in the excerpts.")
+    parser.add_argument('--repeat',type=int,default=3,help="Time each corpus query this many times and report the fastest.")
+    options = parser.parse_args()
+
+    with open(options.database,encoding='utf-8') as file:
+        database = StringTable.Decode(json.load(file))
+    try:
+        with open(options.index,encoding='utf-8') as file:
+            index = json.load(file)
+    except FileNotFoundError:
+        print(f"{options.index} not found; skipping index checks.")
+        index = None
+
+    failures = 0
+    corpus = {"queries": []}
+    if options.corpus:
+        with open(options.corpus,encoding='utf-8') as file:
+            corpus = json.load(file)
+        failures += CheckCorpus(database,index,corpus,options.repeat)
+        print()
+
+    if index:
+        queries = [entry["query"] for entry in corpus["queries"]]
+        if options.queries:
+            with open(options.queries,encoding='utf-8') as file:
+                queries += [line.strip() for line in file if line.strip()]
+        queries += RandomQueries(database,options.random)
+        failures += CheckIndex(database,index,queries)
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
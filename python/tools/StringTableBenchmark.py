@@ -0,0 +1,85 @@
+"""Compare the size and load time of json databases with and without string tables; see python/utils/StringTable.py.
+For each file, decode it (if necessary) to recreate the format written before string tables were introduced
+(no string table, indent=2), check that encoding and decoding reproduces it exactly, and report the raw and gzipped
+sizes and the time taken to parse and decode each format. For sharded databases such as RandomExcerpts.json, whose
+index lists the files containing the excerpts, check each shard and report their total size.
+Usage: python python/tools/StringTableBenchmark.py [FILE ...]
+Run from the directory containing QSarchive.py."""
+
+import os, sys, json, gzip, time, copy, argparse
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(scriptDir,'..','utils'))
+
+import StringTable
+
+def BestTime(function,repeat: int) -> float:
+    "Return the shortest time in ms taken by function() in repeat trials."
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best,time.perf_counter() - start)
+    return 1000 * best
+
+def Describe(name: str,text: str,parseTime: float) -> str:
+    data = text.encode("utf-8")
+    return f"  {name:<14} {len(data) / 1024:9.1f} KiB  gzip {len(gzip.compress(data)) / 1024:8.1f} KiB  parse {parseTime:7.1f} ms"
+
+def ShardFiles(fileName: str,prototypeDir: str) -> list[str]:
+    """If fileName is a sharded database index (see SetupRandom.WriteDatabase), return the shard files it lists.
+    Otherwise return [fileName]."""
+    with open(fileName,encoding='utf-8') as file:
+        index = json.load(file)
+    if "shards" not in index:
+        return [fileName]
+    return [os.path.join(prototypeDir,shard) for shard in index["shards"]]
+
+def Benchmark(fileName: str,repeat: int) -> tuple[int,int,bool]:
+    "Benchmark a single file. Return its size in bytes without and with a string table and whether it passed."
+    with open(fileName,encoding='utf-8') as file:
+        database = StringTable.Decode(json.load(file))
+
+    legacy = json.dumps(database,ensure_ascii=False,indent=2)
+    encodeTime = BestTime(lambda: StringTable.Encode(copy.deepcopy(database)),1)
+    encodedDB = StringTable.Encode(copy.deepcopy(database))
+    encoded = json.dumps(encodedDB,ensure_ascii=False,separators=(",",":"))
+
+    passed = StringTable.Decode(json.loads(encoded)) == database
+    if not passed:
+        print(f"FAILURE: {fileName} doesn't survive encoding and decoding.")
+
+    legacyParse = BestTime(lambda: json.loads(legacy),repeat)
+    encodedParse = BestTime(lambda: json.loads(encoded),repeat)
+    decodeTime = BestTime(lambda: StringTable.Decode(json.loads(encoded)),repeat) - encodedParse
+
+    print(f"{fileName}: {len(encodedDB['stringTable']['strings'])} table entries; encoding took {encodeTime:.1f} ms.")
+    print(Describe("indent=2",legacy,legacyParse))
+    print(Describe("string table",encoded,encodedParse) + f" + decode {decodeTime:.1f} ms")
+    print(f"  Size reduced by {1 - len(encoded.encode()) / len(legacy.encode()):.0%}.")
+    return len(legacy.encode()),len(encoded.encode()),passed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark string table encoding of json databases.")
+    parser.add_argument('files',type=str,nargs='*',default=["pages/assets/SearchDatabase.json","pages/assets/RandomExcerpts.json"],help="Database files to check. Sharded databases are checked shard by shard.")
+    parser.add_argument('--prototypeDir',type=str,default="pages",help="The directory that shard paths are relative to.")
+    parser.add_argument('--repeat',type=int,default=5,help="Time each operation this many times and report the fastest.")
+    options = parser.parse_args()
+
+    failures = 0
+    for fileName in options.files:
+        shardFiles = ShardFiles(fileName,options.prototypeDir)
+        legacyTotal = encodedTotal = 0
+        for shardFile in shardFiles:
+            legacySize,encodedSize,passed = Benchmark(shardFile,options.repeat)
+            legacyTotal += legacySize
+            encodedTotal += encodedSize
+            failures += not passed
+        if shardFiles != [fileName]:
+            print(f"{fileName}: {len(shardFiles)} shards; {legacyTotal / 1024:.1f} KiB => {encodedTotal / 1024:.1f} KiB; "
+                  f"size reduced by {1 - encodedTotal / legacyTotal:.0%}.")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -18,38 +18,46 @@ class AlertClass:
             self.plural = self.name
         self.printAtVerbosity = printAtVerbosity
         self.logging = logging # log these alerts?
-        self.log = {} # A log of printed alerts
+        self.log:list[tuple[tuple,int|None]] = [] # The unformatted items and indent of each logged alert
         self.count = 0
         self.indent = indent # print this many spaces before the message
         self.lineSpacing = lineSpacing # print this many blank lines after the alert
 
+    def Format(self,items: tuple,indent:int|None = None) -> str:
+        "Convert items to strings using ObjectPrinter and join them into the alert message."
+        if indent is None:
+            indent = self.indent
+        strings = []
+        if indent:
+            strings.append(" " * (indent - 1))
+        if self.message:
+            strings.append(self.message)
+        for item in items:
+            if type(item) == str:
+                strings.append(item)
+            else:
+                strings.append(ObjectPrinter(item))
+        return " ".join(strings)
+
     def Show(self,*items,indent:int|None = None,lineSpacing:int|None = None) -> None:
         """Generate an alert from a list of items to print.
         Print it if verbosity is high enough.
-        Log it if we are logging."""
+        Log the unformatted items if we are logging; LoggedMessages() formats them later."""
         if items:
             self.count += 1
-        if verbosity >= self.printAtVerbosity or self.logging:
-            if indent is None:
-                indent = self.indent
-            strings = []
-            if indent:
-                strings.append(" " * (indent - 1))
-            if self.message:
-                strings.append(self.message)
-            for item in items:
-                if type(item) == str:
-                    strings.append(item)
-                else:
-                    strings.append(ObjectPrinter(item))
-            
-            if verbosity >= self.printAtVerbosity:
-                print(" ".join(strings))
-                if lineSpacing is None:
-                    lineSpacing = self.lineSpacing
-                for _ in range(lineSpacing):
-                    print()
+        if self.logging:
+            self.log.append((items,indent))
+        if verbosity >= self.printAtVerbosity:
+            print(self.Format(items,indent))
+            if lineSpacing is None:
+                lineSpacing = self.lineSpacing
+            for _ in range(lineSpacing):
+                print()
     
+    def LoggedMessages(self) -> list[str]:
+        "Format and return the messages of all logged alerts."
+        return [self.Format(items,indent) for items,indent in self.log]
+
     __call__ = Show
 
     def CountString(self) -> str:
@@ -89,4 +97,11 @@ def Debugging(flag: bool):
         debug.logging = True
     else:
         debug.printAtVerbosity = 999
-        debug.logging = False
\ No newline at end of file
+        debug.logging = False
+
+def ResetCounts() -> None:
+    "Reset the count and log of each alert type, e.g. before each build performed by a resident build server."
+    for alert in list(globals().values()):
+        if isinstance(alert,AlertClass):
+            alert.count = 0
+            alert.log.clear()
@@ -0,0 +1,193 @@
+"""A minimal asyncio HTTP/1.1 client for checking and fetching many files from a small number of hosts.
+Connections to each host are kept alive and reused. A semaphore limits the number of simultaneous
+requests to each host. Requests time out and are retried with exponential backoff."""
+
+from __future__ import annotations
+
+import asyncio, ssl
+from collections import defaultdict
+from typing import NamedTuple
+from urllib.parse import urlsplit, urljoin
+
+USER_AGENT = "QSarchive.py link checker"
+REDIRECT_STATUS = {301,302,303,307,308}
+
+class HttpError(OSError):
+    "The server sent a response we can't parse."
+    pass
+
+class HttpResponse(NamedTuple):
+    url: str                # The final URL after following redirects
+    status: int
+    reason: str
+    headers: dict[str,str]  # Header names are lowercase
+    body: bytes             # Possibly truncated if the request specified maxBody
+
+    def Ok(self) -> bool:
+        return 200 <= self.status < 300
+
+HostKey = tuple[str,str,int] # (scheme,host,port)
+Connection = tuple[asyncio.StreamReader,asyncio.StreamWriter]
+
+class AsyncHttpClient:
+    """Send HTTP requests over pooled keep-alive connections.
+    Use as an async context manager so that idle connections are closed when we are done."""
+
+    connectionsPerHost: int     # Maximum simultaneous requests to each host
+    timeout: float              # Seconds to wait for each request attempt
+    retries: int                # Retry this many times after connection errors, timeouts, and 5xx responses
+    maxRedirects: int
+    _idle: dict[HostKey,list[Connection]]
+    _hostLimit: dict[HostKey,asyncio.Semaphore]
+
+    def __init__(self,connectionsPerHost: int = 4,timeout: float = 30.0,retries: int = 2,maxRedirects: int = 5) -> None:
+        self.connectionsPerHost = max(connectionsPerHost,1)
+        self.timeout = timeout
+        self.retries = retries
+        self.maxRedirects = maxRedirects
+        self._idle = defaultdict(list)
+        self._hostLimit = {}
+        self._sslContext = None
+
+    async def __aenter__(self) -> AsyncHttpClient:
+        return self
+
+    async def __aexit__(self,exc_type,exc_val,exc_tb) -> None:
+        await self.Close()
+
+    async def Close(self) -> None:
+        "Close all idle connections."
+        for connections in self._idle.values():
+            for _,writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def Request(self,method: str,url: str,headers: dict[str,str]|None = None,maxBody: int|None = None) -> HttpResponse:
+        """Send a request and return the response, following redirects.
+        maxBody: read at most this many bytes of the body; None reads the entire body.
+        Raise OSError (including TimeoutError) if all attempts fail."""
+
+        for _ in range(self.maxRedirects + 1):
+            response = await self._RequestWithRetries(method,url,headers or {},maxBody)
+            if response.status in REDIRECT_STATUS and "location" in response.headers:
+                url = urljoin(url,response.headers["location"])
+                if response.status == 303:
+                    method = "GET"
+                continue
+            return response
+        raise HttpError(f"More than {self.maxRedirects} redirects when opening {url}")
+
+    async def _RequestWithRetries(self,method: str,url: str,headers: dict[str,str],maxBody: int|None) -> HttpResponse:
+        for attempt in range(self.retries + 1):
+            try:
+                response = await asyncio.wait_for(self._RequestOnce(method,url,headers,maxBody),self.timeout)
+                if response.status < 500 or attempt == self.retries:
+                    return response
+            except (OSError,asyncio.IncompleteReadError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def _HostLimit(self,key: HostKey) -> asyncio.Semaphore:
+        if key not in self._hostLimit:
+            self._hostLimit[key] = asyncio.Semaphore(self.connectionsPerHost)
+        return self._hostLimit[key]
+
+    async def _Connect(self,key: HostKey) -> Connection:
+        scheme,host,port = key
+        if scheme == "https":
+            if not self._sslContext:
+                self._sslContext = ssl.create_default_context()
+            return await asyncio.open_connection(host,port,ssl=self._sslContext)
+        return await asyncio.open_connection(host,port)
+
+    async def _RequestOnce(self,method: str,url: str,headers: dict[str,str],maxBody: int|None) -> HttpResponse:
+        parsed = urlsplit(url)
+        if parsed.scheme not in ("http","https"):
+            raise HttpError(f"Unsupported URL scheme in {url}")
+        key = (parsed.scheme,parsed.hostname,parsed.port or (443 if parsed.scheme == "https" else 80))
+        target = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+
+        requestLines = [f"{method} {target} HTTP/1.1",f"Host: {parsed.netloc}",f"User-Agent: {USER_AGENT}",
+                        "Accept-Encoding: identity","Connection: keep-alive"]
+        requestLines += [f"{name}: {value}" for name,value in headers.items()]
+        requestBytes = ("\r\n".join(requestLines) + "\r\n\r\n").encode("latin-1")
+
+        async with self._HostLimit(key):
+            while True:
+                reused = bool(self._idle[key])
+                reader,writer = self._idle[key].pop() if reused else await self._Connect(key)
+                reusable = False
+                try:
+                    writer.write(requestBytes)
+                    await writer.drain()
+                    status,reason,responseHeaders = await self._ReadHead(reader)
+                    body,reusable = await self._ReadBody(reader,method,status,responseHeaders,maxBody)
+                    break
+                except (ConnectionError,asyncio.IncompleteReadError,HttpError):
+                    if not reused:
+                        raise # Otherwise the server probably closed an idle connection; try a new one
+                finally:
+                    if reusable:
+                        self._idle[key].append((reader,writer))
+                    else:
+                        writer.close()
+
+        return HttpResponse(url,status,reason,responseHeaders,body)
+
+    async def _ReadHead(self,reader: asyncio.StreamReader) -> tuple[int,str,dict[str,str]]:
+        "Read the status line and headers, skipping any 1xx informational responses."
+        while True:
+            statusLine = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+            parts = statusLine.split(" ",2)
+            if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+                raise HttpError(f"Invalid HTTP status line {statusLine!r}")
+
+            headers = {}
+            while line := (await reader.readline()).decode("latin-1").rstrip("\r\n"):
+                name,_,value = line.partition(":")
+                name = name.strip().lower()
+                if name in headers:
+                    headers[name] += ", " + value.strip()
+                else:
+                    headers[name] = value.strip()
+
+            status = int(parts[1])
+            if status >= 200 or status == 101:
+                return status,(parts[2] if len(parts) > 2 else ""),headers
+
+    async def _ReadBody(self,reader: asyncio.StreamReader,method: str,status: int,headers: dict[str,str],maxBody: int|None) -> tuple[bytes,bool]:
+        """Read the response body. Return the body and whether the connection can be reused."""
+
+        reusable = headers.get("connection","").lower() != "close"
+        if method == "HEAD" or status in (204,304):
+            return b"",reusable
+
+        if "chunked" in headers.get("transfer-encoding","").lower():
+            chunks = []
+            received = 0
+            while True:
+                sizeLine = (await reader.readline()).split(b";")[0].strip()
+                try:
+                    size = int(sizeLine,16)
+                except ValueError:
+                    raise HttpError(f"Invalid chunk size {sizeLine!r}")
+                if size == 0:
+                    while (await reader.readline()).strip(): # Skip any trailers
+                        pass
+                    return b"".join(chunks),reusable
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2) # CRLF after each chunk
+                received += size
+                if maxBody is not None and received >= maxBody:
+                    return b"".join(chunks)[:maxBody],False
+
+        if "content-length" in headers:
+            length = int(headers["content-length"])
+            if maxBody is not None and length > maxBody:
+                return await reader.readexactly(maxBody),False
+            return await reader.readexactly(length),reusable
+
+        # No length given, so the body continues until the server closes the connection
+        body = await reader.read(-1) if maxBody is None else await reader.read(maxBody)
+        return body,False
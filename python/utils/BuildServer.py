@@ -0,0 +1,136 @@
+"""A local HTTP server which keeps QSarchive.py and its database resident in memory between builds.
+Each POST request contains a QSarchive.py command line such as 'Render,Prototype --buildOnly tags'.
+The server runs the command and streams everything it prints back to the client.
+Start the server with 'python QSarchive.py Render --serve 8765' and send it commands with
+'python QSarchive.py Prototype --buildOnly tags --sendToServer 8765' or any HTTP client, e.g.
+curl --data 'Prototype --buildOnly tags' http://localhost:8765
+Watch() instead polls a set of directories and runs a build whenever files in them change."""
+
+from __future__ import annotations
+
+from typing import Callable
+import http.server
+import contextlib, io, os, shlex, sys, time, traceback
+from collections.abc import Iterable
+import urllib.request, urllib.error
+import Alert
+
+class ResponseStream(io.TextIOBase):
+    "Write text to the client as it is printed; ignore the output if the client has disconnected."
+
+    def __init__(self,wfile) -> None:
+        self.wfile = wfile
+        self.connected = True
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self,text: str) -> int:
+        if self.connected:
+            try:
+                self.wfile.write(text.encode("utf-8"))
+                self.wfile.flush()
+            except OSError:
+                self.connected = False
+        return len(text)
+
+class BuildRequestHandler(http.server.BaseHTTPRequestHandler):
+    "Run the command line in the body of each POST request."
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length",0))
+        commandLine = self.rfile.read(length).decode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type","text/plain; charset=utf-8")
+        self.end_headers()
+            # Send no Content-Length header; the client reads until we close the connection.
+
+        output = ResponseStream(self.wfile)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                self.server.runCommand(shlex.split(commandLine))
+            except SystemExit:
+                pass # Argument errors and aborted builds call sys.exit(); keep serving
+            except Exception:
+                traceback.print_exc()
+        self.close_connection = True
+
+    def log_message(self,format: str,*args) -> None:
+        Alert.extra("Build server:",format % args)
+
+def Serve(port: int,runCommand: Callable[[list[str]],None]) -> None:
+    """Run commands sent to localhost:port by calling runCommand(argList) until interrupted."""
+
+    with http.server.HTTPServer(("localhost",port),BuildRequestHandler) as server:
+        server.runCommand = runCommand
+        Alert.structure(f"Build server listening on http://localhost:{port}. Press Ctrl-C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            Alert.structure("Build server stopped.")
+
+def SendCommand(port: int,argList: list[str]) -> int:
+    """Send a command line to the build server at localhost:port and print its output as it arrives.
+    Returns 0 on success or 1 if the server can't be reached."""
+
+    request = urllib.request.Request(f"http://localhost:{port}",data=shlex.join(argList).encode("utf-8"),method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            for line in response:
+                sys.stdout.write(line.decode("utf-8"))
+                sys.stdout.flush()
+    except urllib.error.URLError as error:
+        print(f"Could not connect to the build server on port {port}: {error.reason}")
+        return 1
+    return 0
+
+def DirectorySnapshot(directories: Iterable[str]) -> dict[str,tuple[int,int]]:
+    "Return a dict mapping the paths of all files in directories and their subdirectories to (modification time in ns, size)."
+
+    snapshot = {}
+    for directory in directories:
+        for dirPath,_,fileNames in os.walk(directory):
+            for fileName in fileNames:
+                path = os.path.join(dirPath,fileName).replace(os.sep,"/")
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns,stat.st_size)
+    return snapshot
+
+def Watch(directories: Iterable[str],commandsForChanges: Callable[[set[str]],list[list[str]]],runCommand: Callable[[list[str]],None],interval: float = 1.0) -> None:
+    """Poll directories every interval seconds until interrupted.
+    When files change, wait until they have stopped changing, then call runCommand(argList) for each
+    command line returned by commandsForChanges(changedFiles). Deleted files count as changed."""
+
+    directories = list(directories)
+    Alert.structure(f"Watching {', '.join(directories)} for changes. Press Ctrl-C to stop.")
+    snapshot = DirectorySnapshot(directories)
+    try:
+        while True:
+            time.sleep(interval)
+            newSnapshot = DirectorySnapshot(directories)
+            if newSnapshot == snapshot:
+                continue
+
+            while True: # Editors and spreadsheet downloads often write files in several steps
+                time.sleep(interval)
+                settledSnapshot = DirectorySnapshot(directories)
+                if settledSnapshot == newSnapshot:
+                    break
+                newSnapshot = settledSnapshot
+            
+            changedFiles = set(path for path in snapshot.keys() | newSnapshot.keys() if snapshot.get(path) != newSnapshot.get(path))
+            snapshot = newSnapshot
+            Alert.structure("Changed:",", ".join(sorted(changedFiles)))
+            for argList in commandsForChanges(changedFiles):
+                try:
+                    runCommand(argList)
+                except SystemExit:
+                    pass
+                except Exception:
+                    traceback.print_exc()
+    except KeyboardInterrupt:
+        Alert.structure("Stopped watching.")
@@ -17,6 +17,7 @@ from functools import lru_cache
 
 gOptions = None
 gDatabase:dict[str] = {} # These will be set later by QSarchive.py
+gAnnotationOwners:dict[int,dict] = {} # id(annotation) => the excerpt which owns it; see AttachAnnotation
 
 def LoadDatabase(filename: str) -> dict:
     """Read the database indicated by filename"""
@@ -225,15 +226,27 @@ def FindExcerpt(event: str, session: int|None, fileNumber: int|None) -> dict|Non
         return None
 
 
-def FindOwningExcerpt(annotation: dict) -> dict:
-    """Search the global database of excerpts to find which one owns this annotation.
-    This is a slow function and should be called infrequently."""
-    if not gDatabase:
-        return None
-    for x in gDatabase["excerpts"]:
+def AttachAnnotation(excerpt: dict,annotation: dict,index: int|None = None) -> None:
+    """Insert annotation into excerpt["annotations"] at index (default: append it) and record excerpt as its owner."""
+    if index is None:
+        excerpt["annotations"].append(annotation)
+    else:
+        excerpt["annotations"].insert(index,annotation)
+    gAnnotationOwners[id(annotation)] = excerpt
+
+def RegisterAnnotationOwners(excerpts: Iterable[dict]) -> None:
+    """Record the owners of the annotations in a newly-loaded list of excerpts, forgetting those of any earlier database."""
+    gAnnotationOwners.clear()
+    for x in excerpts:
         for a in x["annotations"]:
-            if annotation is a:
-                return x
+            gAnnotationOwners[id(a)] = x
+
+def FindOwningExcerpt(annotation: dict) -> dict:
+    """Return the excerpt which owns this annotation or None if it wasn't attached by AttachAnnotation or RegisterAnnotationOwners.
+    Owners are looked up by id, so check that the annotation is still in its excerpt's annotation list."""
+    x = gAnnotationOwners.get(id(annotation))
+    if x and any(a is annotation for a in x["annotations"]):
+        return x
     return None
 
 
@@ -0,0 +1,160 @@
+"""Stream remote files to disk in blocks so that memory use doesn't depend on the size of the file.
+Each file is written to a temporary file while its md5 hash is calculated. If the download is interrupted,
+the partial file, its URL, and the server's validator (ETag or Last-Modified) are kept so that the next attempt
+can resume with an HTTP Range request. A global semaphore limits the number of simultaneous downloads
+and a token bucket shared by all downloads limits their total bandwidth."""
+
+from __future__ import annotations
+
+import os, time, threading, hashlib, contextlib
+import urllib.request, urllib.error
+from http.client import HTTPResponse, HTTPException
+
+BLOCK_SIZE = 1 << 16
+USER_AGENT = "QSarchive.py downloader"
+
+class IncompleteDownload(OSError):
+    "The server closed the connection before sending the entire file."
+    pass
+
+class RateLimiter:
+    """A token bucket shared by all threads: Consume(n) waits until n more bytes may be transferred."""
+    bytesPerSecond: float   # 0 means no limit
+    _available: float       # The number of bytes that may be transferred immediately
+    _lastUpdate: float
+
+    def __init__(self,bytesPerSecond: float = 0) -> None:
+        self.bytesPerSecond = bytesPerSecond
+        self._available = bytesPerSecond
+        self._lastUpdate = time.monotonic()
+        self._lock = threading.Lock()
+
+    def Consume(self,byteCount: int) -> None:
+        if self.bytesPerSecond <= 0:
+            return
+        with self._lock: # Threads wait in line, so the total rate stays within the limit
+            now = time.monotonic()
+            self._available = min(self._available + (now - self._lastUpdate) * self.bytesPerSecond,self.bytesPerSecond)
+            self._lastUpdate = now
+            self._available -= byteCount
+            if self._available < 0:
+                time.sleep(-self._available / self.bytesPerSecond)
+
+gConnections = threading.BoundedSemaphore(4)
+gRateLimiter = RateLimiter()
+
+def Configure(maxConnections: int,bytesPerSecond: float = 0) -> None:
+    """Allow at most maxConnections simultaneous downloads with a total bandwidth of bytesPerSecond (0 = unlimited)."""
+    global gConnections, gRateLimiter
+    gConnections = threading.BoundedSemaphore(max(maxConnections,1))
+    gRateLimiter = RateLimiter(bytesPerSecond)
+
+def ValidatorFile(path: str) -> str:
+    "Return the file which stores the URL and validator of the partial download at path."
+    return path + ".validator"
+
+def Discard(path: str) -> None:
+    "Remove the partial download at path and its validator."
+    for file in (path,ValidatorFile(path)):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(file)
+
+def _HashFile(path: str) -> tuple[hashlib._Hash,int]:
+    "Return an md5 hasher updated with the contents of path and its length."
+    hasher = hashlib.md5(usedforsecurity=False)
+    size = 0
+    with open(path,"rb") as file:
+        while block := file.read(BLOCK_SIZE):
+            hasher.update(block)
+            size += len(block)
+    return hasher,size
+
+def _Validator(response: HTTPResponse) -> str:
+    "Return the header which identifies this version of the remote file for If-Range or '' if there is none."
+    etag = response.headers.get("ETag","")
+    if etag and not etag.startswith("W/"): # If-Range requires a strong validator
+        return etag
+    return response.headers.get("Last-Modified","")
+
+def _Attempt(url: str,path: str,timeout: float) -> str:
+    """Download url to path once, resuming a previous partial download if possible. Return the md5 hash of the file."""
+
+    hasher = hashlib.md5(usedforsecurity=False)
+    received = 0
+    headers = {"User-Agent":USER_AGENT,"Accept-Encoding":"identity"}
+    try:
+        with open(ValidatorFile(path),encoding="utf-8") as file:
+            validatorUrl,_,validator = file.read().partition("\n")
+        if validatorUrl == url and validator and os.path.isfile(path):
+            hasher,received = _HashFile(path)
+            if received:
+                headers["Range"] = f"bytes={received}-"
+                headers["If-Range"] = validator
+    except FileNotFoundError:
+        pass
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url,headers=headers),timeout=timeout)
+    except urllib.error.HTTPError as error:
+        if error.code != 416 or not received:
+            raise
+        Discard(path) # We can't resume, probably because the file has changed; start over
+        return _Attempt(url,path,timeout)
+
+    with response:
+        if response.status == 206:
+            contentRange = response.headers.get("Content-Range","")
+            if not contentRange.startswith(f"bytes {received}-"):
+                Discard(path)
+                raise IncompleteDownload(f"Unexpected Content-Range {contentRange!r} from {url}")
+        elif received: # The server ignored the Range header or the file has changed, so it sent the entire file
+            hasher = hashlib.md5(usedforsecurity=False)
+            received = 0
+
+        validator = _Validator(response)
+        if validator:
+            with open(ValidatorFile(path),"w",encoding="utf-8") as file:
+                file.write(f"{url}\n{validator}")
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(ValidatorFile(path)) # We can't resume without a validator
+
+        length = response.headers.get("Content-Length","")
+        expected = received + int(length) if length.isdigit() else None
+        with open(path,"r+b" if received else "wb") as file:
+            file.seek(received)
+            file.truncate()
+            try:
+                while block := response.read(BLOCK_SIZE):
+                    gRateLimiter.Consume(len(block))
+                    hasher.update(block)
+                    file.write(block)
+                    received += len(block)
+            except HTTPException as error: # e.g. http.client.IncompleteRead, which isn't an OSError
+                raise IncompleteDownload(f"{error!r} after {received} bytes from {url}") from error
+
+    if expected is not None and received < expected:
+        raise IncompleteDownload(f"Received {received} of {expected} bytes from {url}")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(ValidatorFile(path))
+    return hasher.hexdigest()
+
+def DownloadToFile(url: str,path: str,retries: int = 2,timeout: float = 60.0) -> str:
+    """Stream the file at url to path and return its md5 hash. Resume any previous partial download at path.
+    Retry after network errors and 5xx responses, resuming where the last attempt stopped.
+    Raise OSError (including urllib.error.HTTPError) if all attempts fail; the partial file is kept."""
+
+    dirName = os.path.dirname(path)
+    if dirName:
+        os.makedirs(dirName,exist_ok=True)
+    with gConnections:
+        for attempt in range(retries + 1):
+            try:
+                return _Attempt(url,path,timeout)
+            except urllib.error.HTTPError as error:
+                if error.code < 500 or attempt == retries:
+                    raise
+            except OSError:
+                if attempt == retries:
+                    raise
+            time.sleep(0.5 * 2 ** attempt)
@@ -2,18 +2,31 @@
 are typically updated every time the program runs.
 Subclasses specify what information to store and how to use it.
 The HashWriter subclass stores md5 hashes of utf-8 files. When requested to write a file, it touches the
-disk only if the hash has changed."""
+disk only if the hash has changed. It can also write gzip and brotli compressed copies of the files it writes
+and transform text files (e.g. minify html) before writing them.
+The StageCache subclass records a key describing the inputs of each build stage so that stages with
+unchanged inputs can be skipped.
+The LinkCache subclass records which remote URLs have been validated and the headers needed to revalidate them.
+The Mp3InfoCache subclass records the duration and ID3 tags of mp3 files keyed by their ETag or size and modification time.
+The FrameIndexCache subclass records the md5 hash of local mp3 files, which names the file holding their frame index.
+The RenderCache subclass stores html rendered from database items so that unchanged items needn't be rendered again."""
 
 from __future__ import annotations
 
 from typing import TypedDict, Callable
+from collections.abc import Iterable, Container
 from enum import Enum, auto
 from datetime import datetime
-import json, contextlib, copy, os, re
+import json, contextlib, copy, os, re, itertools, gzip
 import posixpath
 import hashlib
-import urllib.request, urllib.error
-import Alert, Utils
+from concurrent.futures import Future
+import Alert, Utils, Download
+
+try:
+    import brotli
+except ImportError: # Optional; we write only .gz files without it
+    brotli = None
 
 class Status(Enum):
     STALE = auto()          # File loaded from disk cache but not registered
@@ -30,6 +43,17 @@ _modified: the date/time the file was last modified or registered
 """
 
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+HASH_BLOCK_SIZE = 1 << 20
+
+def FileHash(path: str) -> str:
+    """Return the md5 hash of the file at path. Read the file in blocks to limit memory use.
+    Raise FileNotFoundError if the file does not exist."""
+
+    hasher = hashlib.md5(usedforsecurity=False)
+    with open(path,"rb") as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
 
 class FileRegister():
     """The FileRegister base class maintains a cache of information about a group of semi-persistent files that
@@ -172,6 +196,14 @@ class FileRegister():
         "Return a list of filenames with the given status."
         return [filename for filename,record in self.record.items() if record["_status"] == status]
 
+    def RemoveStaleRecords(self,keep: Container[str] = frozenset()) -> int:
+        """Remove the records which haven't been registered or looked up since the register was read,
+        except those whose keys are in keep. Return the number removed."""
+        stale = [key for key in self.FilesWithStatus(Status.STALE) if key not in keep]
+        for key in stale:
+            del self.record[key]
+        return len(stale)
+
     def ReadRecordFromDisk(self,fileName) -> Record:
         """Reconstruct a record from the information on disk.
         Raise FileNotFoundError if the file does not exist.
@@ -211,26 +243,119 @@ class Write(Enum):
     DESTINATION_CHANGED = auto()    # the hash differs or the destination file has changed (default).
                                     # (UpdatedOnDisk returns True)
 
+COMPRESSORS:dict[str,Callable[[bytes,int],bytes]] = { # Compressed copy suffix -> function(data,level)
+    "gz": lambda data,level: gzip.compress(data,compresslevel=level,mtime=0) # mtime=0 makes the output reproducible
+}
+if brotli:
+    COMPRESSORS["br"] = lambda data,level: brotli.compress(data,quality=level)
+
+COMPRESSIBLE_FILES = r".*\.(html|json|js|css|xml|svg|txt)$"
+MAX_PENDING_COMPRESSIONS = 64 # Limit the memory used by file contents waiting to be compressed
+
+def CompressionSettings(gzipLevel: int = 9,brotliQuality: int = 11) -> dict[str,int]:
+    """Return the compression argument of HashWriter which writes .gz copies and also .br copies
+    if the brotli module is installed."""
+    settings = {"gz":gzipLevel}
+    if "br" in COMPRESSORS:
+        settings["br"] = brotliQuality
+    return settings
+
+def WriteCompressedCopies(path: str,contents: bytes,compression: dict[str,int]) -> OSError|None:
+    """Write compressed copies of contents to path.gz, path.br, etc.
+    Return rather than raise any OSError so that threaded and unthreaded executors behave alike."""
+    try:
+        for suffix,level in compression.items():
+            with open(f"{path}.{suffix}","wb") as file:
+                file.write(COMPRESSORS[suffix](contents,level))
+    except OSError as error:
+        return error
+    return None
+
+def RemoveCompressedCopies(path: str) -> None:
+    "Remove any compressed copies of the file at path."
+    for suffix in ("gz","br"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{path}.{suffix}")
+
 class HashWriter(FileRegister):
     """Stores md5 hashes of utf-8 files. When requested to write a file, it touches the
-    disk only if the md5 hash has changed."""
+    disk only if the md5 hash has changed.
+    If compression is specified, files matching COMPRESSIBLE_FILES are accompanied by compressed copies
+    (e.g. page.html.gz) so that static file servers can send them without compressing them.
+    Compressed copies are written in parallel when the file is written and recorded in key "compressed"
+    so that changing the compression settings rewrites them."""
     defaultMode: Write              # Default writing mode
+    compression: dict[str,int]      # Compressed copy suffix -> compression level; see CompressionSettings
+    _compressor: Utils.ThreadPoolExecutor|Utils.MockThreadPoolExecutor|None
+    _pendingCompressions: list[tuple[str,Future]] # (fileName,future) for compressed copies being written
 
-    def __init__(self,basePath: str,cacheFile: str = "HashCache.json",exactDates = False,defaultMode = Write.DESTINATION_CHANGED):
+    def __init__(self,basePath: str,cacheFile: str = "HashCache.json",exactDates = False,defaultMode = Write.DESTINATION_CHANGED,compression: dict[str,int]|None = None):
         super().__init__(basePath,cacheFile,exactDates)
         self.defaultMode = defaultMode
+        self.compression = compression or {}
+        self._compressor = None
+        self._pendingCompressions = []
     
     def __enter__(self) -> HashWriter:
         return self
 
-    def _UpdateFile(self,fileName: str,newHash: str,writeFunction: Callable[[],None],mode:Write|None = None) -> Status:
+    def _CompressionKey(self,fileName: str,contents: bytes|None) -> str:
+        "Return the value of key 'compressed' describing the compressed copies of fileName or '' if there are none."
+        if contents is None or not self.compression or not re.match(COMPRESSIBLE_FILES,fileName):
+            return ""
+        return ",".join(f"{suffix}{level}" for suffix,level in self.compression.items())
+
+    def _CompressedCopiesMissing(self,fileName: str) -> bool:
+        "Return True if any compressed copy of fileName listed in its record is missing."
+        fullPath = posixpath.join(self.basePath,fileName)
+        compressed = self.record.get(fileName,{}).get("compressed","")
+        return any(not os.path.isfile(f"{fullPath}.{key.rstrip('0123456789')}") for key in compressed.split(",") if key)
+
+    def _QueueCompression(self,fileName: str,contents: bytes|None) -> None:
+        "Write or remove the compressed copies of fileName."
+        fullPath = posixpath.join(self.basePath,fileName)
+        if not self._CompressionKey(fileName,contents):
+            RemoveCompressedCopies(fullPath)
+            return
+
+        if self._compressor is None:
+            self._compressor = Utils.ConditionalThreader()
+        while len(self._pendingCompressions) >= MAX_PENDING_COMPRESSIONS:
+            self._FinishCompression(*self._pendingCompressions.pop(0))
+        self._pendingCompressions.append((fileName,self._compressor.submit(WriteCompressedCopies,fullPath,contents,self.compression)))
+
+    def _FinishCompression(self,fileName: str,future: Future) -> None:
+        "Wait for future to write the compressed copies of fileName and report errors."
+        error = future.result()
+        if error:
+            Alert.error(f"{error} when writing compressed copies of {fileName}.")
+            RemoveCompressedCopies(posixpath.join(self.basePath,fileName))
+            if fileName in self.record:
+                self.record[fileName]["_status"] = Status.BLOCKED
+                self.record[fileName]["compressed"] = "" # Try again next time
+
+    def WaitForCompression(self) -> None:
+        "Wait until all compressed copies have been written."
+        while self._pendingCompressions:
+            self._FinishCompression(*self._pendingCompressions.pop(0))
+        if self._compressor is not None:
+            self._compressor.shutdown()
+            self._compressor = None
+
+    def Flush(self,markAsStale:bool = False,disposingObject:bool = False) -> None:
+        self.WaitForCompression()
+        super().Flush(markAsStale,disposingObject)
+
+    def _UpdateFile(self,fileName: str,newHash: str,writeFunction: Callable[[],None],mode:Write|None = None,contents:bytes|None = None,source:str = "") -> Status:
         """Abstract function which implements the file update logic.
         Determine whether fileName needs to be updated, given newHash and mode.
-        If so, call writeFunction to update the file on disk.
+        If so, call writeFunction to update the file on disk and write its compressed copies.
         fileName:       the file in question
         newHash:        md5 hash of the new data that might be written
         writeFunction:  callback function to call if the file needs updated
-        mode:           write mode (see above)"""
+        mode:           write mode (see above)
+        contents:       the new data; needed to write compressed copies
+        source:         hash of the data the new data was made from; see WriteTextFile"""
 
         if mode is None:
             mode = self.defaultMode
@@ -239,6 +364,9 @@ class HashWriter(FileRegister):
             updatedOnDisk = self.UpdatedOnDisk(fileName,checkDetailedContents=False)
         else:
             updatedOnDisk = False
+        compressedCopiesMissing = mode == Write.DESTINATION_CHANGED and not updatedOnDisk and self._CompressedCopiesMissing(fileName)
+        contentsUnchanged = not updatedOnDisk and mode != Write.ALWAYS and self.record.get(fileName,{}).get("md5") == newHash
+            # If so, we need only update the compressed copies
         
         if mode == Write.DESTINATION_UNCHANGED:
             if updatedOnDisk:
@@ -247,16 +375,26 @@ class HashWriter(FileRegister):
                     return Status.BLOCKED
 
         newRecord = {"md5":newHash}
+        compressionKey = self._CompressionKey(fileName,contents)
+        if compressionKey:
+            newRecord["compressed"] = compressionKey
+        if source:
+            newRecord["source"] = source
+        previousModified = self.record.get(fileName,{}).get("_modified")
         status = self.Register(fileName,newRecord)
-        if mode == Write.DESTINATION_CHANGED and updatedOnDisk:
+        if contentsUnchanged and previousModified:
+            self.record[fileName]["_modified"] = previousModified # A change to "compressed" or "source" doesn't change the file
+        if mode == Write.DESTINATION_CHANGED and (updatedOnDisk or compressedCopiesMissing):
             status = Status.UPDATED
         if mode == Write.ALWAYS:
             status = Status.UPDATED
         
         if status != Status.UNCHANGED:
             try:
-                writeFunction()
-                self.UpdateModifiedDate(fileName)
+                if not contentsUnchanged:
+                    writeFunction()
+                    self.UpdateModifiedDate(fileName)
+                self._QueueCompression(fileName,contents)
             except OSError as error:
                 self.record[fileName]["_status"] = Status.BLOCKED
                     # Something stopped us from writing the file, so set status BLOCKED
@@ -265,7 +403,7 @@ class HashWriter(FileRegister):
         
         return status
 
-    def WriteBinaryFile(self,fileName: str,fileContents: bytes,mode:Write|None = None) -> Status:
+    def WriteBinaryFile(self,fileName: str,fileContents: bytes,mode:Write|None = None,source:str = "") -> Status:
         """Write binary data to fileName if the stored hash differs from fileContents."""
         
         fullPath = posixpath.join(self.basePath,fileName)
@@ -276,40 +414,59 @@ class HashWriter(FileRegister):
                 file.write(fileContents)
 
         newHash = hashlib.md5(fileContents,usedforsecurity=False).hexdigest()
-        return self._UpdateFile(fileName,newHash,WriteBinary,mode)
+        return self._UpdateFile(fileName,newHash,WriteBinary,mode,fileContents,source)
 
-    def WriteTextFile(self,fileName: str,fileContents: str,mode:Write|None = None) -> Status:
-        """Write text fileContents to fileName in utf-8 encoding if the stored hash differs."""
+    def _SourceUnchanged(self,fileName: str,source: str,mode:Write|None) -> bool:
+        "Can we skip writing fileName because it was made from the same source and is unchanged on disk?"
+        record = self.record.get(fileName)
+        if not record or record.get("source") != source or (mode or self.defaultMode) != Write.DESTINATION_CHANGED:
+            return False
+        return (record.get("compressed","") == self._CompressionKey(fileName,b"")
+                and not self.UpdatedOnDisk(fileName) and not self._CompressedCopiesMissing(fileName))
+
+    def WriteTextFile(self,fileName: str,fileContents: str,mode:Write|None = None,transform:Callable[[str],str]|None = None,transformName:str = "") -> Status:
+        """Write text fileContents to fileName in utf-8 encoding if the stored hash differs.
+        If transform is given, write transform(fileContents) instead. The record stores a hash of the untransformed
+        contents and transformName in key "source", so transform isn't called again unless one of these changes."""
+
+        source = ""
+        if transform:
+            source = hashlib.md5(f"{transformName}\n{fileContents}".encode("utf-8"),usedforsecurity=False).hexdigest()
+            if self._SourceUnchanged(fileName,source,mode):
+                self.record[fileName]["_status"] = Status.UNCHANGED
+                return Status.UNCHANGED
+            fileContents = transform(fileContents)
 
         fileContents += "\n" # Append a newline to mimic printing the string.
         utf8Encoded = fileContents.encode("utf-8")
-        return self.WriteBinaryFile(fileName,utf8Encoded,mode)
+        return self.WriteBinaryFile(fileName,utf8Encoded,mode,source)
     
     def DownloadFile(self,fileName: str,url: str,mode:Write|None = None,retries: int = 2) -> Status:
         """Download file contents from url; update the file on disk only if the md5 checksum differs.
-        The current algorithm is memory-inefficient."""
+        The file is streamed to fileName.download while its hash is calculated, so memory use is constant.
+        An interrupted download is resumed the next time it is requested."""
 
-        for attempt in range(retries + 1):
-            try:
-                with urllib.request.urlopen(url) as remoteFile:
-                    remoteData = remoteFile.read()
-                break
-            except urllib.error.HTTPError:
-                if attempt < retries:
-                    Alert.caution(f"HTTP error when attempting to download {fileName}. Retrying.")
-                else:
-                    Alert.error(f"HTTP error when attempting to download {fileName}. Giving up after {retries + 1} attempts.")
-                    return Status.BLOCKED
+        fullPath = posixpath.join(self.basePath,fileName)
+        downloadPath = fullPath + ".download"
+        try:
+            newHash = Download.DownloadToFile(url,downloadPath,retries=retries)
+        except OSError as error:
+            Alert.error(f"{error} when attempting to download {fileName}. Giving up after {retries + 1} attempts.")
+            if fileName in self.record:
+                self.record[fileName]["_status"] = Status.BLOCKED
+            return Status.BLOCKED
+
+        def ReplaceFile() -> None:
+            os.replace(downloadPath,fullPath)
 
-        return self.WriteBinaryFile(fileName,remoteData,mode)
+        try:
+            return self._UpdateFile(fileName,newHash,ReplaceFile,mode)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(downloadPath) # The file hasn't changed
 
     def ReadRecordFromDisk(self, fileName) -> Record:
-        fullPath = posixpath.join(self.basePath,fileName)
-        with open(fullPath, 'rb') as file:
-            contents = file.read()
-        
-        hash = hashlib.md5(contents,usedforsecurity=False).hexdigest()
-        return {"md5":hash}
+        return {"md5":FileHash(posixpath.join(self.basePath,fileName))}
 
     def DeleteStaleFiles(self,filterRegex = ".*") -> int:
         """Delete stale files appearing in the register if their full path matches filterRegex."""
@@ -323,12 +480,13 @@ class HashWriter(FileRegister):
                      deleteCount += 1
                 except FileNotFoundError:
                     pass
+                RemoveCompressedCopies(posixpath.join(self.basePath,r))
                 del self.record[r]
         return deleteCount
     
     def DeleteUnregisteredFiles(self,directory = "",filterRegex = ".*") -> int:
         """Delete files in directory (relative to baseDir) that are either stale or unregistered and
-        that match filterRegex."""
+        that match filterRegex. Keep the compressed copies of files that are registered and not stale."""
 
         deleteCount = 0
         matcher = re.compile(filterRegex)
@@ -340,12 +498,239 @@ class HashWriter(FileRegister):
             fullPath = posixpath.join(baseDir,fileName)
             relativePath = posixpath.join(directory,fileName)
             if matcher.match(fullPath) and self.record.get(relativePath,stale)["_status"] == Status.STALE:
+                uncompressed,suffix = posixpath.splitext(relativePath)
+                if suffix in (".gz",".br") and self.record.get(uncompressed,stale)["_status"] != Status.STALE:
+                    continue
                 try:
                      os.remove(fullPath)
                      deleteCount += 1
                 except FileNotFoundError:
                     pass
+                RemoveCompressedCopies(fullPath)
                 self.record.pop(relativePath,None)
 
         return deleteCount
-                     
+
+def StageKey(inputFiles: Iterable[str],options: dict,codeFiles: Iterable[str] = ()) -> str:
+    """Return a hash which changes whenever the contents of inputFiles or codeFiles or the values in options change.
+    File modification dates are ignored, so operations like git checkout that only touch files don't change the key.
+    A missing file contributes a marker rather than raising FileNotFoundError."""
+
+    hasher = hashlib.md5(usedforsecurity=False)
+    hasher.update(json.dumps(options,sort_keys=True,default=str).encode("utf-8"))
+    for path in itertools.chain(inputFiles,codeFiles):
+        try:
+            fileHash = FileHash(path)
+        except FileNotFoundError:
+            fileHash = "missing"
+        hasher.update(f"{path}:{fileHash};".encode("utf-8"))
+    return hasher.hexdigest()
+
+def FileListing(directory: str,filterRegex: str = ".*") -> list[tuple[str,int,int]]:
+    """Return (path,size,mtime_ns) for each file below directory whose path matches filterRegex, sorted by path.
+    Include the result in the options passed to StageKey for stages which read many large files, such as mp3s,
+    that would be slow to hash. Return [] if directory doesn't exist."""
+
+    matcher = re.compile(filterRegex,re.IGNORECASE)
+    listing = []
+    for dirPath,_,fileNames in os.walk(directory):
+        for fileName in fileNames:
+            path = posixpath.join(dirPath.replace(os.sep,"/"),fileName)
+            if matcher.match(path):
+                with contextlib.suppress(FileNotFoundError):
+                    stat = os.stat(path)
+                    listing.append((path,stat.st_size,stat.st_mtime_ns))
+    return sorted(listing)
+
+class StageCache(FileRegister):
+    """Stores a key for the output file of each build stage (e.g. SpreadsheetDatabase.json).
+    The key is generated by StageKey from the stage's input files, the options which affect its output,
+    and the code version. A stage whose key matches the register and whose output file exists need not run again."""
+
+    def __init__(self,basePath: str,cacheFile: str = "StageCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> StageCache:
+        return self
+
+    def UpToDate(self,outputFile: str,key: str) -> bool:
+        """Return True if outputFile exists and was written by a stage with this key."""
+        if self.CheckStatus(outputFile,{"key":key}) != Status.UNCHANGED:
+            return False
+        return os.path.isfile(posixpath.join(self.basePath,outputFile))
+
+    def RecordStage(self,outputFile: str,key: str) -> Status:
+        """Register that the stage which writes outputFile has been run with this key."""
+        return self.Register(outputFile,{"key":key})
+
+class LinkCache(FileRegister):
+    """Stores the results of validating remote URLs. Each record describes a valid URL:
+    validator: the name of the LinkValidator class, which reflects the link check level
+    fingerprint: the parts of the item checked by the validator, e.g. the json of an excerpt's clips
+    size, etag, lastModified: the file size and the HTTP headers used to revalidate the link
+    "_modified" is the time the link was last validated. Invalid links are removed from the register
+    so that they are checked again on the next run."""
+
+    def __init__(self,basePath: str,cacheFile: str = "LinkCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> LinkCache:
+        return self
+
+    def ValidRecord(self,url: str,validator: str,fingerprint: str) -> Record|None:
+        """Return the record for url if it was found valid by this validator for an item with this fingerprint
+        and mark it as unchanged so that RemoveStaleRecords keeps it."""
+        record = self.record.get(url)
+        if record and record["validator"] == validator and record["fingerprint"] == fingerprint:
+            if record["_status"] == Status.STALE:
+                record["_status"] = Status.UNCHANGED
+            return record
+        return None
+
+    def RecordValid(self,url: str,validator: str,fingerprint: str,size: int|None,etag: str,lastModified: str) -> Status:
+        """Register that url has just been validated."""
+        status = self.Register(url,{"validator":validator,"fingerprint":fingerprint,"size":size,
+                                    "etag":etag,"lastModified":lastModified})
+        self.UpdateModifiedDate(url)
+        return status
+
+    def Forget(self,url: str) -> None:
+        """Remove url from the register because it is not valid."""
+        self.record.pop(url,None)
+
+class VersionedCache(FileRegister):
+    """Base class for registers of information derived from files or items which is read again only when their version
+    changes. Each record contains key "version"; subclasses define the other keys and how to store them.
+    Lookup marks the records it returns as unchanged, so records which are neither looked up nor stored remain stale
+    and RemoveStaleRecords removes them."""
+
+    def Lookup(self,key: str,version: str) -> Record|None:
+        """Return the record for key if its version matches and mark it as unchanged; otherwise return None.
+        An empty version never matches."""
+        record = self.record.get(key)
+        if version and record and record["version"] == version:
+            record["_status"] = Status.UNCHANGED
+            return record
+        return None
+
+    def RemoveUnusedRecords(self,usedKeys: set[str]|None = None) -> int:
+        """For registers keyed by local paths: remove the records which haven't been looked up or stored and
+        whose files no longer exist or, if usedKeys is given, aren't in usedKeys. Return the number removed."""
+        unused = [key for key in self.FilesWithStatus(Status.STALE)
+                  if not os.path.isfile(key) or (usedKeys is not None and key not in usedKeys)]
+        for key in unused:
+            del self.record[key]
+        return len(unused)
+
+class Mp3InfoCache(VersionedCache):
+    """Stores information read from mp3 files so that unchanged files needn't be read again.
+    Records are keyed by URL or local path. Each contains:
+    version: for remote files, the ETag or the Last-Modified date and size;
+        for local files, the size and modification time in ns (see LocalMp3.Version).
+        The file is read again if this changes.
+    size: the file size in bytes
+    duration, method: the duration in seconds and how it was calculated (see Mp3Frames.Inspect)
+    clips: the ID3 CLIP tag written by SplitMp3 or None
+    tagDigest: the md5 digest of the other ID3 tags (see LocalMp3.TagDigest); None for remote files"""
+
+    def __init__(self,basePath: str,cacheFile: str = "Mp3InfoCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> Mp3InfoCache:
+        return self
+
+    def Store(self,key: str,version: str,size: int,duration: float,method: str,clips: str|None,tagDigest: str|None = None) -> Status:
+        """Register the information read from the file."""
+        status = self.Register(key,{"version":version,"size":size,"duration":duration,"method":method,
+                                    "clips":clips,"tagDigest":tagDigest})
+        self.UpdateModifiedDate(key)
+        return status
+
+class Mp3TagCache(FileRegister):
+    """Records the tags last written to or verified in each mp3 file so that TagMp3 needn't open unchanged files.
+    Records are keyed by local path. Each contains:
+    fingerprint: a digest of the tags and the options used to write them (see TagMp3.TagFingerprint)
+    version: the size and modification time in ns of the file after its tags were checked (see LocalMp3.Version)"""
+
+    def __init__(self,basePath: str,cacheFile: str = "Mp3TagCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> Mp3TagCache:
+        return self
+
+    def Changes(self,path: str,fingerprint: str,version: str) -> list[str]:
+        """Return the fields of the record for path which don't match: "fingerprint" if the tags we want to write
+        have changed and "version" if the file has changed on disk. Return both if path isn't registered.
+        If nothing has changed, mark the record as unchanged and return []."""
+        record = self.record.get(path)
+        if not record:
+            return ["fingerprint","version"]
+        changes = [key for key,value in (("fingerprint",fingerprint),("version",version)) if record.get(key) != value]
+        if not changes:
+            record["_status"] = Status.UNCHANGED
+        return changes
+
+    def Store(self,path: str,fingerprint: str,version: str) -> Status:
+        """Register that the file at path has the tags described by fingerprint."""
+        return self.Register(path,{"fingerprint":fingerprint,"version":version})
+
+class FrameIndexCache(VersionedCache):
+    """Maps local mp3 file paths to their frame indexes (see Mp3Index). Each record contains:
+    version: the size and modification time in ns (see LocalMp3.Version); the file is hashed again if this changes
+    hash: the md5 hash of the file; its frame index is stored in basePath/hash.frames
+    frames, duration: the number of audio frames and the duration in seconds
+    Index files are named by hash so that moved, copied, or touched files needn't be scanned again."""
+
+    def __init__(self,basePath: str,cacheFile: str = "FrameIndexCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> FrameIndexCache:
+        return self
+
+    def IndexFile(self,fileHash: str) -> str:
+        """Return the path of the frame index of the file with this hash."""
+        return posixpath.join(self.basePath,fileHash + ".frames")
+
+    def Store(self,key: str,version: str,fileHash: str,frames: int,duration: float) -> Status:
+        """Register the frame index of the file."""
+        status = self.Register(key,{"version":version,"hash":fileHash,"frames":frames,"duration":duration})
+        self.UpdateModifiedDate(key)
+        return status
+
+    def Merge(self,records: dict[str,Record]) -> None:
+        """Register records stored by a copy of this register in another process.
+        Records which match ours are marked as unchanged unless we have already registered them."""
+        for key,record in records.items():
+            existing = self.record.get(key)
+            if existing and existing["version"] == record["version"] and existing["hash"] == record["hash"]:
+                if existing["_status"] == Status.STALE:
+                    existing["_status"] = Status.UNCHANGED
+            else:
+                self.Store(key,record["version"],record["hash"],record["frames"],record["duration"])
+
+    def DeleteUnusedIndexes(self) -> int:
+        """Delete index files which no record refers to. Return the number of files deleted."""
+        used = set(record["hash"] + ".frames" for record in self.record.values())
+        deleteCount = 0
+        for fileName in os.listdir(self.basePath):
+            if fileName.endswith(".frames") and fileName not in used:
+                os.remove(posixpath.join(self.basePath,fileName))
+                deleteCount += 1
+        return deleteCount
+
+class RenderCache(VersionedCache):
+    """Stores data rendered from database items keyed by item code. Each record contains:
+    version: a hash of the item, the database records, options, and code used to render it;
+        the item is rendered again if this changes
+    entry: the rendered data"""
+
+    def __init__(self,basePath: str,cacheFile: str = "RenderCache.json"):
+        super().__init__(basePath,cacheFile)
+
+    def __enter__(self) -> RenderCache:
+        return self
+
+    def Store(self,key: str,version: str,entry: dict) -> Status:
+        """Register the data rendered from an item."""
+        return self.Register(key,{"version":version,"entry":entry})
+
@@ -0,0 +1,193 @@
+"""Remove the indentation and line breaks that the templates and Html2 write into the html pages.
+Minifier reads html in chunks of any size and returns the minified html as soon as it can be decided, so it can
+minify output as it is produced; the result is the same however the input is divided.
+Outside <pre>, <script>, <textarea>, and <style> elements, which are copied unchanged:
+    Whitespace between a block-level tag and its neighbouring text or tag is removed.
+    Other runs of whitespace become a single newline if they contain one and a single space if not.
+    Whitespace inside tags outside quoted attribute values is collapsed, e.g. '<a href = "x" >' => '<a href="x">'.
+    Comments are removed except for conditional comments ('<!--[if ...').
+These rules don't change the way browsers display pages unless css sets white-space on elements other than those above.
+Like the rest of the html written by Prototype, the input must escape < and > in text and attribute values.
+Prototype passes Minify to HashWriter.WriteTextFile, which skips minifying pages that haven't changed."""
+
+from __future__ import annotations
+
+import re
+
+RAW_ELEMENTS = ("pre","script","textarea","style") # Copy these elements unchanged
+BLOCK_ELEMENTS = frozenset("""!doctype html head body title meta link base div p ul ol li dl dt dd table caption thead tbody tfoot tr td th
+    h1 h2 h3 h4 h5 h6 hr br header footer nav main section article aside form fieldset legend select option
+    blockquote figure figcaption details summary noscript pre""".split()) # Whitespace next to these tags is never displayed
+
+WHITESPACE = " \t\n\r\f" # Html whitespace; unlike \s, this excludes non-breaking spaces
+_RAW_NAMES = "|".join(RAW_ELEMENTS)
+_BLOCK_NAMES = "|".join(sorted(BLOCK_ELEMENTS,key=len,reverse=True))
+RAW = re.compile(rf"<!--(.*?)-->|<({_RAW_NAMES})\b[^>]*>.*?</\2[ \t\n\r\f]*>" # Comments and complete raw elements
+                 rf"|<!--|<(?:{_RAW_NAMES})\b",re.DOTALL | re.IGNORECASE) # The start of an incomplete comment or raw element
+TAG_NAME = re.compile(r"</?(!?[a-zA-Z][\w-]*)")
+LOOSE_TAG = re.compile(r"<[!/]?[a-zA-Z][^<>]*?(?:[ \t\n\r\f]{2}|[ \t\n\r\f]=|=[ \t\n\r\f]|[\t\n\r\f]|[ \t\n\r\f](?=>))[^<>]*>") # Tags containing whitespace to remove
+QUOTED = re.compile(r"""("[^"]*"|'[^']*')""")
+BEFORE_BLOCK = re.compile(rf"[ \t\n\r\f]+(?=</?(?:{_BLOCK_NAMES})(?![\w-]))",re.IGNORECASE)
+AFTER_BLOCK = re.compile(rf"(</?(?:{_BLOCK_NAMES})(?![\w-])[^<>]*>)[ \t\n\r\f]+",re.IGNORECASE)
+NEWLINE_RUN = re.compile(r"[ \t\r\f]*\n[ \t\n\r\f]*(?![^<>]*>)") # Whitespace outside tags
+SPACE_RUN = re.compile(r"(?:[ \t\r\f]{2,}|[\t\r\f])(?![^<>]*>)")
+WHITESPACE_RUN = re.compile(r"[ \t\n\r\f]+")
+BLOCK_TAG = re.compile(rf"</?(?:{_BLOCK_NAMES})(?![\w-])",re.IGNORECASE)
+
+# The patterns used by MinifyIndentedText begin with literal characters, which the re module finds quickly.
+TAG_SPACE = re.compile(r" =|= | >|  ") # Whitespace that may need to be removed from a tag
+DOUBLE_SPACE = re.compile(r"  +")
+SPACE_BEFORE_BLOCK = re.compile(rf" (?=</?(?:{_BLOCK_NAMES})(?![\w-]))",re.IGNORECASE)
+SPACE_AFTER_TAG = re.compile(r"> ")
+
+def MinifyTag(tag: str) -> str:
+    "Collapse the whitespace in tag outside its quoted attribute values."
+    parts = QUOTED.split(tag)
+    for n in range(0,len(parts),2): # Even parts are outside quotes
+        part = parts[n]
+        if "  " in part or any(c in part for c in "\t\n\r\f"):
+            part = WHITESPACE_RUN.sub(" ",part)
+        parts[n] = part.replace(" = ","=").replace(" =","=").replace("= ","=")
+    tag = "".join(parts)
+    return tag[:-2] + ">" if tag.endswith(" >") else tag
+
+def IsBlock(tag: str,pos: int = 0) -> bool:
+    "Is whitespace next to the tag or raw element at tag[pos:] never displayed?"
+    return bool(BLOCK_TAG.match(tag,pos))
+
+def InsideTag(html: str,pos: int) -> bool:
+    return html.rfind("<",0,pos) > html.rfind(">",0,pos)
+
+def CollapseWhitespace(whitespace: str) -> str:
+    return "\n" if "\n" in whitespace else " "
+
+def MinifyText(html: str) -> str:
+    "Apply the minification rules to html, which contains no comments or raw elements and starts and ends with non-whitespace."
+    html = LOOSE_TAG.sub(lambda match: MinifyTag(match[0]),html)
+    html = BEFORE_BLOCK.sub("",html)
+    html = AFTER_BLOCK.sub(r"\1",html)
+    return SPACE_RUN.sub(" ",NEWLINE_RUN.sub("\n",html))
+
+def MinifyIndentedText(html: str) -> str:
+    """Return the same result as MinifyText several times faster. Most of the whitespace in the pages is
+    indentation, which string methods can remove line by line. Fall back to MinifyText if any tag spans more
+    than one line or html contains tabs, carriage returns, or form feeds."""
+    lines = html.split("\n")
+    if any(line.rfind("<") > line.rfind(">") for line in lines) or any(c in html for c in "\t\r\f"):
+        return MinifyText(html)
+
+    # Remove indentation and blank lines and the line breaks next to block-level tags
+    output = []
+    previousBlock = True # Does the last line in output end with a block-level tag?
+    for line in lines:
+        line = line.strip(WHITESPACE)
+        if not line:
+            continue
+        if not previousBlock and not (line[0] == "<" and IsBlock(line)):
+            output.append("\n")
+        output.append(line)
+        previousBlock = line[-1] == ">" and IsBlock(line,line.rfind("<"))
+    html = "".join(output)
+
+    # Collapse whitespace inside tags
+    tagStarts = set()
+    for match in TAG_SPACE.finditer(html):
+        tagStart = html.rfind("<",0,match.start() + 1)
+        if tagStart > html.rfind(">",0,match.start() + 1):
+            tagStarts.add(tagStart)
+    if tagStarts:
+        parts = []
+        pos = 0
+        for tagStart in sorted(tagStarts):
+            tagEnd = html.index(">",tagStart) + 1
+            parts += [html[pos:tagStart],MinifyTag(html[tagStart:tagEnd])]
+            pos = tagEnd
+        parts.append(html[pos:])
+        html = "".join(parts)
+
+    # Collapse runs of spaces in the text and remove spaces next to block-level tags
+    html = DOUBLE_SPACE.sub(lambda match: match[0] if InsideTag(html,match.start()) else " ",html)
+    html = SPACE_BEFORE_BLOCK.sub("",html)
+    parts = []
+    pos = 0
+    for match in SPACE_AFTER_TAG.finditer(html):
+        if IsBlock(html,html.rfind("<",0,match.start())):
+            parts.append(html[pos:match.start() + 1])
+            pos = match.end()
+    parts.append(html[pos:])
+    return "".join(parts)
+
+def MinifyStretch(html: str,afterBlock: bool,beforeBlock: bool) -> str:
+    """Minify html, which contains no comments or raw elements.
+    afterBlock/beforeBlock: html is preceded/followed by a block-level tag or the start/end of the document."""
+    core = html.strip(WHITESPACE)
+    if not core:
+        return "" if (afterBlock or beforeBlock or not html) else CollapseWhitespace(html)
+
+    minified = MinifyIndentedText(core)
+    if not afterBlock and html[0] in WHITESPACE and not (minified[0] == "<" and IsBlock(minified)):
+        minified = CollapseWhitespace(html[:len(html) - len(html.lstrip(WHITESPACE))]) + minified
+    if not beforeBlock and html[-1] in WHITESPACE and not (minified[-1] == ">" and IsBlock(minified,minified.rfind("<"))):
+        minified += CollapseWhitespace(html[len(html.rstrip(WHITESPACE)):])
+    return minified
+
+class Minifier:
+    """Minify html passed to Feed in chunks. Call Close after the last chunk to return the rest of the output.
+    Input is held back from the last tag onwards, or from the start of an incomplete comment or raw element."""
+
+    def __init__(self) -> None:
+        self.buffer = ""            # Input which hasn't been minified yet
+        self.afterBlock = True      # Does the buffer follow a block-level tag? The start of the document counts as one.
+
+    def Process(self,final: bool) -> str:
+        "Minify as much of self.buffer as possible; all of it if final."
+        output = []
+        stretch = "" # Html since the last raw element, omitting comments
+        pos = 0
+        limit = len(self.buffer)
+        for match in RAW.finditer(self.buffer):
+            if match[1] is None and match[2] is None:
+                limit = match.start() # The rest of the element may be in the next chunk
+                break
+            stretch += self.buffer[pos:match.start()]
+            pos = match.end()
+            if match[1] is not None and not match[1].startswith("[if"):
+                continue # Text on both sides of a removed comment is minified together
+
+            isBlock = IsBlock(match[0])
+            output.append(MinifyStretch(stretch,self.afterBlock,isBlock))
+            output.append(match[0])
+            stretch = ""
+            self.afterBlock = isBlock
+
+        if final:
+            stretch += self.buffer[pos:limit]
+            output.append(MinifyStretch(stretch,self.afterBlock,True))
+            output.append(self.buffer[limit:]) # Copy an unterminated comment or raw element unchanged
+            self.buffer = ""
+            return "".join(output)
+
+        # Minify up to the last tag whose name is complete; we need its name to handle the whitespace before it.
+        cut = self.buffer.rfind("<",pos,limit)
+        name = TAG_NAME.match(self.buffer,cut) if cut >= 0 else None
+        if name and name.end() < len(self.buffer):
+            output.append(MinifyStretch(stretch + self.buffer[pos:cut],self.afterBlock,IsBlock(name[0])))
+            self.afterBlock = False # The buffer now starts with a tag, so this has no effect
+            self.buffer = self.buffer[cut:]
+        else:
+            self.buffer = stretch + self.buffer[pos:]
+        return "".join(output)
+
+    def Feed(self,html: str) -> str:
+        "Add html to the input and return as much minified output as can be decided."
+        self.buffer += html
+        return self.Process(final=False)
+
+    def Close(self) -> str:
+        "Return the remaining minified output."
+        return self.Process(final=True)
+
+def Minify(html: str) -> str:
+    "Return html minified."
+    minifier = Minifier()
+    return minifier.Feed(html) + minifier.Close()
@@ -0,0 +1,70 @@
+"""Read the duration and ID3 tags of local mp3 files.
+Results are cached in an Mp3InfoCache keyed by path. A record is reused as long as the file's size and
+modification time haven't changed, so checking thousands of unchanged files requires only os.stat calls."""
+
+from __future__ import annotations
+
+import os, posixpath, json, hashlib
+from io import BytesIO
+from typing import NamedTuple, Mapping
+import mutagen, mutagen.easyid3
+import FileRegister, Mp3Frames
+
+class LocalMp3(NamedTuple):
+    size: int               # The file size in bytes
+    duration: float         # seconds
+    method: str             # How the duration was calculated; see Mp3Frames.Inspect
+    clips: str|None         # The ID3 CLIP tag written by SplitMp3
+    tagDigest: str          # The digest of the other ID3 tags; see TagDigest
+
+def Version(stat: os.stat_result) -> str:
+    "Return a string that changes whenever the file changes."
+    return f"{stat.st_size}/{stat.st_mtime_ns}"
+
+def TagDigest(tags: Mapping[str,list[str]]) -> str:
+    """Return the md5 digest of EasyID3-style tags excluding the CLIP tag.
+    The values of each tag are sorted, so their order doesn't matter."""
+    canonical = {key:sorted(values) for key,values in tags.items() if key != "clips"}
+    return hashlib.md5(json.dumps(canonical,sort_keys=True,ensure_ascii=False).encode("utf-8"),usedforsecurity=False).hexdigest()
+
+def ReadTags(id3Tag: bytes) -> dict[str,list[str]]:
+    "Return the EasyID3 tags in id3Tag, the bytes of an ID3v2 tag, or {} if there are none."
+    if not id3Tag:
+        return {}
+    try:
+        return dict(mutagen.easyid3.EasyID3(BytesIO(id3Tag)))
+    except (OSError,mutagen.MutagenError):
+        return {}
+
+def Read(path: str,cache: FileRegister.Mp3InfoCache|None = None,trustCache: bool = False) -> LocalMp3:
+    """Return information about the mp3 file at path, using the record in cache if the file hasn't changed.
+    trustCache: use any record in the cache without checking whether the file has changed.
+    Raise OSError if the file can't be read and Mp3Frames.Mp3FormatError if it doesn't look like an mp3."""
+
+    key = posixpath.normpath(path)
+    if cache is not None:
+        if trustCache and key in cache.record:
+            cache.SetStatus(key,FileRegister.Status.UNCHANGED)
+            record = cache.record[key]
+        else:
+            record = cache.Lookup(key,Version(os.stat(path)))
+        if record:
+            return LocalMp3(record["size"],record["duration"],record["method"],record["clips"],record["tagDigest"])
+
+    with open(path,"rb") as file:
+        stat = os.fstat(file.fileno())
+        head = file.read(Mp3Frames.HEAD_BYTES)
+        needed = Mp3Frames.ID3v2Length(head) + 2 * Mp3Frames.MAX_FRAME_BYTES
+        if len(head) < needed:
+            head += file.read(needed - len(head))
+
+        inspection = Mp3Frames.Inspect(head,stat.st_size)
+        if inspection.method == "CBR":
+            file.seek(max(stat.st_size - Mp3Frames.TAIL_BYTES,0))
+            inspection = Mp3Frames.Inspect(head,stat.st_size,file.read())
+
+    tags = ReadTags(head[:inspection.tagLength])
+    mp3 = LocalMp3(stat.st_size,inspection.duration,inspection.method,tags.get("clips",[None])[0],TagDigest(tags))
+    if cache is not None:
+        cache.Store(key,Version(stat),*mp3)
+    return mp3
@@ -1,16 +1,22 @@
-"""Python wrapper to use mp3DirectCut to split mp3 files"""
+"""Python wrapper to use mp3DirectCut to split mp3 files.
+Alternatively, the native engine splits and joins mp3 files in Python by copying whole MPEG frames,
+which runs on any operating system."""
 
 from __future__ import annotations
 
-import os, shutil, platform
+import os, shutil, platform, mmap, contextlib
 import copy
 from datetime import time,timedelta
 from typing import List, Union, NamedTuple, Iterator, Iterable
+from functools import lru_cache
+import Mp3Frames, Mp3Index, FileRegister
 
 executable = 'mp3DirectCut.exe'
 executableDir = 'mp3DirectCut'
 joinUsingPydub = False
 pydubBitrate = "64k"
+engine = "auto" # "native": split in Python; "mp3DirectCut": run mp3DirectCut.exe; "auto": mp3DirectCut.exe if available
+frameIndexCache:FileRegister.FrameIndexCache|None = None # If given, the native engine reuses the stored frame indexes of source files
 class Mp3CutError(Exception):
     "Raised if mp3DirectCut returns with an error code"
     pass
@@ -169,6 +175,92 @@ def ConfigureMp3DirectCut() -> str:
     return mp3DirectCutProgram
 
 
+@lru_cache(maxsize=None)
+def Mp3DirectCutFound(program: str) -> bool:
+    """Return True if ConfigureMp3DirectCut finds mp3DirectCut.exe at program (executableDir/executable).
+    The result is cached because UseNativeEngine is called for every file we split or join."""
+    try:
+        ConfigureMp3DirectCut()
+        return True
+    except ExecutableNotFound:
+        return False
+
+def UseNativeEngine() -> bool:
+    "Should we split files in Python rather than with mp3DirectCut.exe?"
+    if engine == "native":
+        return True
+    if engine == "mp3DirectCut":
+        return False
+    return not Mp3DirectCutFound(os.path.join(executableDir,executable))
+
+@contextlib.contextmanager
+def OpenFrames(file: str,storeIndex: bool = True) -> Iterator[tuple[mmap.mmap,Mp3Frames.FrameIndex]]:
+    """Memory-map file and index its frames. Yield (data,frameIndex).
+    storeIndex: use and update the stored index in frameIndexCache if available. Pass False for temporary files."""
+    with open(file,"rb") as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as data:
+        if storeIndex and frameIndexCache is not None:
+            yield data,Mp3Index.Load(file,frameIndexCache,data)
+        else:
+            yield data,Mp3Frames.BuildFrameIndex(data)
+
+def ClipFrames(index: Mp3Frames.FrameIndex,clip: ClipTD) -> range:
+    """Return the range of frames to copy for clip: those from the frame boundaries nearest its start and end times
+    plus any earlier frames which contain bit reservoir data needed to decode the first frame."""
+
+    start = index.FrameAt(clip.start.total_seconds())
+    end = index.FrameCount() if clip.end is None else index.FrameAt(clip.end.total_seconds())
+    if start >= index.FrameCount():
+        raise TimeError(f"Start time {clip.start} is later than file duration {timedelta(seconds=index.Duration())}.")
+    if end <= start:
+        raise TimeError(f"Split point {clip}: Clip end must be after clip start.")
+    return range(index.ReservoirStart(start),end)
+
+FrameSegment = tuple[mmap.mmap,Mp3Frames.FrameIndex,range] # A range of frames in a memory-mapped file
+
+def WriteFrames(outputFile: str,segments: list[FrameSegment]) -> None:
+    """Write the frames in segments to outputFile preceded by a Xing/Info header frame describing them.
+    The frames are copied directly from the memory-mapped source files."""
+
+    if len(set(index.sampleRate for _,index,_ in segments)) > 1:
+        raise Mp3CutError(f"Cannot join mp3 files with different sample rates to create {outputFile}.")
+    
+    lengths = []
+    for _,index,frames in segments:
+        lengths.extend(index.offsets[n + 1] - index.offsets[n] for n in frames)
+    firstData,firstIndex,firstFrames = segments[0]
+    firstOffset = firstIndex.offsets[firstFrames.start]
+    
+    with open(outputFile,"wb") as output:
+        output.write(Mp3Frames.VbrHeaderFrame(firstData[firstOffset:firstOffset + 4],len(lengths),lengths))
+        for data,index,frames in segments:
+            if frames:
+                with memoryview(data) as view:
+                    output.write(view[index.offsets[frames.start]:index.offsets[frames.stop]])
+
+def NativeSplit(file: str,clips: list[ClipTD],outputDir: str) -> None:
+    """Split file into clips without running mp3DirectCut. The clips may overlap and needn't be sorted.
+    Each clip begins and ends at the frame boundaries closest to its start and end times."""
+
+    with OpenFrames(file) as (data,index):
+        for clip in clips:
+            WriteFrames(os.path.join(outputDir,clip.file),[(data,index,ClipFrames(index,clip))])
+
+def NativeSplitJoin(fileClips: dict[str,list[ClipTD]],inputDir: str,outputDir: str) -> None:
+    """Create each file in fileClips by copying the frames of its clips directly from the source files.
+    No temporary files are needed. Each source file is memory-mapped and indexed only once."""
+
+    with contextlib.ExitStack() as stack:
+        sources:dict[str,tuple[mmap.mmap,Mp3Frames.FrameIndex]] = {}
+        for sourceFile in sorted(SourceFiles(fileClips)):
+            sources[sourceFile] = stack.enter_context(OpenFrames(os.path.join(inputDir,sourceFile)))
+        
+        for outputFile,clips in fileClips.items():
+            segments = []
+            for clip in clips:
+                data,index = sources[clip.file]
+                segments.append((data,index,ClipFrames(index,clip.ToClipTD())))
+            WriteFrames(os.path.join(outputDir,outputFile),segments)
+
 def WriteCue(cueTime,cueNum,cueFile):
     "Write a cue to a Mp3DirectCut .cue file"
     print(f'  TRACK {cueNum:02d} AUDIO',file=cueFile)
@@ -256,7 +348,7 @@ def SinglePassSplit(file:str, clips:list[ClipTD],outputDir:str = None,deleteCueF
         os.remove(cueFilePath)
 
 def Split(file:str, clips:list[Clip],outputDir:str = None,deleteCueFile:str = True) -> None:
-    """Run Mp3DirectCut (possibly multiple times) to split an mp3 file into tracks.
+    """Run Mp3DirectCut (possibly multiple times) or the native engine to split an mp3 file into tracks.
     file - Name and path of the file to split. Write access is required to this directory.
     clips - a list of clips to split the file into. The fields are:
         file (str): - the name of the output file for this clip.
@@ -277,6 +369,10 @@ def Split(file:str, clips:list[Clip],outputDir:str = None,deleteCueFile:str = Tr
     for clip in wholeFileClips:
         Join([file],os.path.join(outputDir,clip.file))
 
+    if UseNativeEngine():
+        NativeSplit(file,clipsRemaining,outputDir) # The native engine can split overlapping clips in one pass
+        return
+
     clipsRemaining.sort(key = lambda clip:clip.start)
     while clipsRemaining:
         lastClipEnd = timedelta(0)
@@ -307,29 +403,41 @@ def SourceFiles(clips:Clip|Iterable[Clip]|dict[object,Clip]) -> set[str]:
 def GroupBySourceFiles(outputFiles:dict[str,list[Clip]]) -> Iterator[tuple[set[str],dict[str,list[Clip]]]]:
     """Group the outputFiles by source files. Returns an iterator of tuples:
     (sourceFiles,theseOutputFiles), where sourceFiles is a set of source files and theseOutputFiles is the dict of files that use
-    these source files."""
-
-    filesRemaining = outputFiles
-    while filesRemaining:
-        sourceFiles:set[str] = SourceFiles(next(iter(filesRemaining.values())))
-            # Begin with the first file of the first item in clipsRemaining
-        prevSourceFiles:set[str] = set()
-
-        while (prevSourceFiles != sourceFiles):
-            filesWithTheseSources:dict[str,list[Clip]] = {}
-            for filename,clips in filesRemaining.items():
-                for clip in clips:
-                    if clip.file in sourceFiles:
-                        filesWithTheseSources[filename] = clips
-            
-            prevSourceFiles = sourceFiles
-            sourceFiles = SourceFiles(filesWithTheseSources)
-        
-        yield sourceFiles,filesWithTheseSources
-        filesRemaining = {file:clips for file,clips in filesRemaining.items() if file not in filesWithTheseSources}
+    these source files. Source files used by the same output file are merged using a union-find structure,
+    so this takes nearly linear time in the number of clips. Groups are returned in order of their first output file."""
+
+    parent:dict[str,str] = {} # parent[file] is the next source file on the path to the representative of its group
+    def Find(file: str) -> str:
+        root = file
+        while parent[root] != root:
+            root = parent[root]
+        while parent[file] != root: # Compress the path
+            parent[file],file = root,parent[file]
+        return root
+
+    for clips in outputFiles.values():
+        sources = SourceFiles(clips)
+        for file in sources:
+            parent.setdefault(file,file)
+        if sources:
+            root = Find(sources.pop())
+            for file in sources:
+                otherRoot = Find(file)
+                if otherRoot != root:
+                    parent[otherRoot] = root
+
+    groups:dict[str|None,tuple[set[str],dict[str,list[Clip]]]] = {}
+    for filename,clips in outputFiles.items():
+        sources = SourceFiles(clips)
+        root = Find(next(iter(sources))) if sources else None
+        sourceFiles,theseOutputFiles = groups.setdefault(root,(set(),{}))
+        sourceFiles.update(sources)
+        theseOutputFiles[filename] = clips
+    
+    yield from groups.values()
 
 def MultiFileSplitJoin(fileClips:dict[str,list[Clip]],inputDir:str = ".",outputDir:str|None = None) -> None:
-    """Split and join multiple mp3 files using Mp3DirectCut.
+    """Split and join multiple mp3 files using Mp3DirectCut or the native engine.
     fileClips: each key is the name of a file to create in outputDir.
         each value is a list of Clips to join. The Clip fields mean:
             file: the name of a file in inputDir
@@ -341,6 +449,10 @@ def MultiFileSplitJoin(fileClips:dict[str,list[Clip]],inputDir:str = ".",outputD
     if outputDir is None:
         outputDir = inputDir
 
+    if UseNativeEngine(): # Joining whole frames is seamless, so ignore joinUsingPydub
+        NativeSplitJoin(fileClips,inputDir,outputDir)
+        return
+
     for sourceFiles,selectFileClips in GroupBySourceFiles(fileClips):
 
         # Strategy: Create dictionaries describing the operations that need to be executed, then run these operations
@@ -353,7 +465,8 @@ def MultiFileSplitJoin(fileClips:dict[str,list[Clip]],inputDir:str = ".",outputD
             # keys: the name of a final output file that requires joining (relative to outputDir)
             # values: the clips to join to create the final output file (clip files relative to outputDir)
         
-        tempFilePrefix = "__QStemp_"
+        tempFilePrefix = f"__QStemp_{os.path.splitext(next(iter(selectFileClips)))[0]}_"
+            # Name temporary files after the first output file so that groups split in parallel don't collide
         tempFileCount = 0
 
         # 1. Create dictionaries
@@ -393,13 +506,14 @@ def MultiFileSplitJoin(fileClips:dict[str,list[Clip]],inputDir:str = ".",outputD
                 os.remove(os.path.join(outputDir,filename))
         
 def Join(fileList: List[str],outputFile: str,heal = True) -> None:
-    """Join mp3 files into a single file using simple file copying operations.
+    """Join mp3 files into a single file using simple file copying operations, or pydub if joinUsingPydub
+    and the native engine isn't in use.
     fileList: list of pathnames of the files to join.
     outFile: pathname of output file.
     heal: Use Mp3DirectCut to clean up the output file. Usually a good idea.
     This operation fails with mp3 files with different sample rates."""
 
-    if len(fileList) > 1 and joinUsingPydub:
+    if len(fileList) > 1 and joinUsingPydub and not UseNativeEngine():
         try:
             from pydub import AudioSegment
 
@@ -414,6 +528,12 @@ def Join(fileList: List[str],outputFile: str,heal = True) -> None:
     if len(fileList) == 1:
         heal = False # In this case, we're just copying the file
 
+    if heal and UseNativeEngine():
+        with contextlib.ExitStack() as stack:
+            segments = [(data,index,range(index.FrameCount())) for data,index in (stack.enter_context(OpenFrames(f,storeIndex=False)) for f in fileList)]
+            WriteFrames(outputFile,segments)
+        return
+
     name, ext = os.path.splitext(outputFile)
     tempFile = name + "_temp" + ext
 
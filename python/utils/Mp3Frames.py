@@ -0,0 +1,358 @@
+"""Parse MPEG audio frame headers and the ID3v2, Xing/Info/LAME, and VBRI headers of mp3 files.
+Inspect() calculates the duration of an mp3 file from the first few kilobytes of the file, its size,
+and optionally its last few kilobytes, so that remote files can be checked using small Range requests.
+BuildFrameIndex() locates every frame in a file so that it can be cut at frame boundaries.
+PackFrameIndex() and UnpackFrameIndex() convert frame indexes to and from a compact binary format."""
+
+from __future__ import annotations
+
+import array, itertools, struct, sys, zlib
+from typing import NamedTuple
+
+HEAD_BYTES = 16384      # Read this many bytes from the beginning of the file; enough for our ID3 tags and the first frame
+TAIL_BYTES = 8192       # Read this many bytes from the end of CBR files to find trailing tags and check the bitrate
+MAX_FRAME_BYTES = 2881  # The longest possible MPEG audio frame
+
+class Mp3FormatError(ValueError):
+    "Raised when the data doesn't look like an mp3 file."
+    pass
+
+BITRATES = { # kbps indexed by (MPEG version 1?, layer) and then by the bitrate index
+    (True,1): [0,32,64,96,128,160,192,224,256,288,320,352,384,416,448],
+    (True,2): [0,32,48,56,64,80,96,112,128,160,192,224,256,320,384],
+    (True,3): [0,32,40,48,56,64,80,96,112,128,160,192,224,256,320],
+    (False,1): [0,32,48,56,64,80,96,112,128,144,160,176,192,224,256],
+    (False,2): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160],
+    (False,3): [0,8,16,24,32,40,48,56,64,80,96,112,128,144,160]
+}
+SAMPLE_RATES = {1: [44100,48000,32000],2: [22050,24000,16000],2.5: [11025,12000,8000]}
+VERSIONS = {0b00: 2.5,0b10: 2,0b11: 1}
+LAYERS = {0b01: 3,0b10: 2,0b11: 1}
+
+class FrameHeader(NamedTuple):
+    version: float      # MPEG version 1, 2, or 2.5
+    layer: int          # 1, 2, or 3
+    bitrate: int        # bits per second
+    sampleRate: int     # Hz
+    padding: bool
+    mono: bool
+    protected: bool     # A 16-bit CRC follows the header
+    length: int         # The length of the frame in bytes, including the header
+    samples: int        # The number of audio samples in the frame
+
+    def SideInfoLength(self) -> int:
+        "Return the length of the layer 3 side information that follows the header."
+        if self.version == 1:
+            return 17 if self.mono else 32
+        else:
+            return 9 if self.mono else 17
+
+    def SameStream(self,other: FrameHeader) -> bool:
+        "Could other be a frame in the same stream?"
+        return (self.version,self.layer,self.sampleRate) == (other.version,other.layer,other.sampleRate)
+
+def ParseFrameHeader(data: bytes,offset: int = 0) -> FrameHeader|None:
+    """Parse the four-byte frame header at data[offset]. Return None if it isn't a valid header.
+    Free-format frames (bitrate index 0) aren't supported."""
+
+    if offset < 0 or offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    b1,b2,b3 = data[offset + 1],data[offset + 2],data[offset + 3]
+    version = VERSIONS.get((b1 >> 3) & 0b11)
+    layer = LAYERS.get((b1 >> 1) & 0b11)
+    bitrateIndex = b2 >> 4
+    sampleRateIndex = (b2 >> 2) & 0b11
+    if version is None or layer is None or bitrateIndex in (0,15) or sampleRateIndex == 3:
+        return None
+
+    bitrate = BITRATES[(version == 1,layer)][bitrateIndex] * 1000
+    sampleRate = SAMPLE_RATES[version][sampleRateIndex]
+    padding = bool((b2 >> 1) & 1)
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sampleRate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate // sampleRate + padding
+    return FrameHeader(version,layer,bitrate,sampleRate,padding,(b3 >> 6) == 0b11,not (b1 & 1),length,samples)
+
+def ID3v2Length(data: bytes) -> int:
+    """Return the length of the ID3v2 tag at the start of data including its header and footer, or 0 if there is none."""
+    if len(data) < 10 or data[0:3] != b"ID3" or any(b & 0x80 for b in data[6:10]):
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9] # A syncsafe integer
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def FindFrame(data: bytes,start: int = 0,end: int|None = None) -> int|None:
+    """Return the offset of the first frame header in data[start:end] that is followed by a header of the same stream.
+    A header at the very end of data is accepted without confirmation. Return None if no frame is found."""
+
+    end = len(data) if end is None else min(end,len(data))
+    offset = data.find(b"\xFF",start,end)
+    while offset >= 0:
+        header = ParseFrameHeader(data,offset)
+        if header:
+            nextOffset = offset + header.length
+            if nextOffset + 4 > len(data):
+                return offset
+            nextHeader = ParseFrameHeader(data,nextOffset)
+            if nextHeader and nextHeader.SameStream(header):
+                return offset
+        offset = data.find(b"\xFF",offset + 1,end)
+    return None
+
+class VbrHeader(NamedTuple):
+    kind: str           # "Xing", "Info" (the LAME name for Xing headers in CBR files), or "VBRI"
+    frames: int|None    # The number of audio frames, not including the header frame
+    bytes: int|None     # The number of bytes of audio, including the header frame
+    delay: int          # Encoder delay and padding in samples from the LAME extension
+    padding: int
+
+def ParseVbrHeader(data: bytes,offset: int,header: FrameHeader) -> VbrHeader|None:
+    """Look for a Xing/Info (with optional LAME extension) or VBRI header in the frame at data[offset].
+    Return None if there is none."""
+
+    xingOffset = offset + 4 + header.SideInfoLength() if header.layer == 3 else offset + 4
+    tag = data[xingOffset:xingOffset + 4]
+    if tag in (b"Xing",b"Info") and len(data) >= xingOffset + 8:
+        flags = int.from_bytes(data[xingOffset + 4:xingOffset + 8],"big")
+        position = xingOffset + 8
+        fields = {}
+        for flag,name,length in ((1,"frames",4),(2,"bytes",4),(4,"toc",100),(8,"quality",4)):
+            if flags & flag:
+                fields[name] = data[position:position + length]
+                position += length
+        frames = int.from_bytes(fields["frames"],"big") if len(fields.get("frames",b"")) == 4 else None
+        byteCount = int.from_bytes(fields["bytes"],"big") if len(fields.get("bytes",b"")) == 4 else None
+
+        delay = padding = 0
+        if data[position:position + 4] == b"LAME" and len(data) >= position + 24:
+            delayAndPadding = int.from_bytes(data[position + 21:position + 24],"big")
+            delay,padding = delayAndPadding >> 12,delayAndPadding & 0xFFF
+        return VbrHeader(tag.decode(),frames,byteCount,delay,padding)
+
+    vbriOffset = offset + 4 + 32
+    if data[vbriOffset:vbriOffset + 4] == b"VBRI" and len(data) >= vbriOffset + 18:
+        byteCount = int.from_bytes(data[vbriOffset + 10:vbriOffset + 14],"big")
+        frames = int.from_bytes(data[vbriOffset + 14:vbriOffset + 18],"big")
+        delay = int.from_bytes(data[vbriOffset + 6:vbriOffset + 8],"big")
+        return VbrHeader("VBRI",frames,byteCount,delay,0)
+    return None
+
+def TrailingTagLength(tail: bytes) -> int:
+    "Return the combined length of the ID3v1 and APEv2 tags at the end of tail."
+    length = 0
+    if tail[-128:-125] == b"TAG":
+        length += 128
+    apeFooter = tail[len(tail) - length - 32:len(tail) - length]
+    if apeFooter[0:8] == b"APETAGEX":
+        apeLength = int.from_bytes(apeFooter[12:16],"little")
+        hasHeader = bool(int.from_bytes(apeFooter[20:24],"little") & 0x80000000)
+        length += apeLength + (32 if hasHeader else 0)
+    return length
+
+class Mp3Inspection(NamedTuple):
+    duration: float     # seconds
+    method: str         # How the duration was calculated: "Xing", "Info", "VBRI", "CBR", or "estimate"
+    bitrate: int        # The bitrate of the first frame
+    sampleRate: int
+    audioStart: int     # The offset of the first frame
+    tagLength: int      # The length of the ID3v2 tag
+
+    def Exact(self) -> bool:
+        "Is the duration exact rather than estimated from the bitrate of the first frame?"
+        return self.method != "estimate"
+
+def Inspect(head: bytes,fileSize: int,tail: bytes|None = None) -> Mp3Inspection:
+    """Calculate the duration of an mp3 file of length fileSize.
+    head: the beginning of the file, which must contain the ID3v2 tag and first frame.
+    tail: the end of the file. It is needed only if the file has no Xing/Info or VBRI header, in which case
+    we check for trailing tags and compare the bitrate of a frame near the end with that of the first frame.
+    If tail is None, the method returned is "CBR" if the duration would be calculated from the bitrate.
+    Raise Mp3FormatError if we can't find a frame header."""
+
+    tagLength = ID3v2Length(head)
+    audioStart = FindFrame(head,tagLength)
+    if audioStart is None:
+        raise Mp3FormatError(f"No MPEG audio frame found in the first {len(head)} bytes.")
+    header = ParseFrameHeader(head,audioStart)
+
+    vbr = ParseVbrHeader(head,audioStart,header)
+    if vbr and vbr.frames:
+        samples = vbr.frames * header.samples - vbr.delay - vbr.padding
+        return Mp3Inspection(max(samples,0) / header.sampleRate,vbr.kind,header.bitrate,header.sampleRate,audioStart,tagLength)
+
+    audioEnd = fileSize
+    method = "CBR"
+    if tail is not None:
+        audioEnd -= TrailingTagLength(tail)
+        tailFrame = FindFrame(tail,0,max(len(tail) - MAX_FRAME_BYTES,1))
+        if tailFrame is not None and ParseFrameHeader(tail,tailFrame).bitrate != header.bitrate:
+            method = "estimate" # A VBR file without a header; we can't know the duration without reading every frame
+    if vbr: # A Xing/Info header without a frame count; skip the header frame
+        audioStart += header.length
+    return Mp3Inspection(max(audioEnd - audioStart,0) * 8 / header.bitrate,method,header.bitrate,header.sampleRate,audioStart,tagLength)
+
+def MainDataBegin(data: bytes,offset: int,header: FrameHeader) -> int:
+    """Return main_data_begin of the layer 3 frame at data[offset]: the number of bytes of audio data for this
+    frame stored in the bit reservoir, i.e. in the frames before it. Return 0 for other layers."""
+    if header.layer != 3:
+        return 0
+    position = offset + 4 + (2 if header.protected else 0)
+    if header.version == 1:
+        return (data[position] << 1) | (data[position + 1] >> 7)
+    else:
+        return data[position]
+
+def MainDataLength(header: FrameHeader) -> int:
+    "Return the number of bytes in a frame available for audio data, some of which may belong to later frames."
+    if header.layer != 3:
+        return header.length - 4
+    return header.length - 4 - (2 if header.protected else 0) - header.SideInfoLength()
+
+class FrameIndex(NamedTuple):
+    """The location of each audio frame in an mp3 file. All frames have the same sample rate and number of samples."""
+    sampleRate: int
+    samples: int                # The number of samples per frame
+    offsets: array.array        # 'Q' array: offsets[n] is the position of frame n; offsets[-1] is the end of the last frame
+    reservoir: array.array      # 'H' array: the main_data_begin of each frame
+    mainData: array.array       # 'H' array: MainDataLength of each frame
+
+    def FrameCount(self) -> int:
+        return len(self.offsets) - 1
+
+    def Duration(self) -> float:
+        "The duration of the audio in seconds."
+        return self.FrameCount() * self.samples / self.sampleRate
+
+    def FrameAt(self,seconds: float) -> int:
+        "Return the number of the frame boundary closest to time seconds."
+        return min(max(round(seconds * self.sampleRate / self.samples),0),self.FrameCount())
+
+    def ReservoirStart(self,frame: int) -> int:
+        """Return the first frame needed to decode frame: go back far enough that the earlier
+        frames contain the main_data_begin bytes that frame takes from the bit reservoir."""
+        if frame >= self.FrameCount():
+            return frame
+        needed = self.reservoir[frame]
+        while needed > 0 and frame > 0:
+            frame -= 1
+            needed -= self.mainData[frame]
+        return frame
+
+def BuildFrameIndex(data: bytes) -> FrameIndex:
+    """Scan the mp3 file contents data (typically an mmap) and return an index of its audio frames.
+    Skip ID3v2, ID3v1, and APE tags and any Xing/Info or VBRI header frame. Resynchronize after damaged frames.
+    Raise Mp3FormatError if there are no frames."""
+
+    end = len(data) - TrailingTagLength(data[max(len(data) - TAIL_BYTES,0):])
+    offset = FindFrame(data,ID3v2Length(data[:10]),end)
+    if offset is None:
+        raise Mp3FormatError("No MPEG audio frames found.")
+    first = ParseFrameHeader(data,offset)
+    if ParseVbrHeader(data,offset,first):
+        offset += first.length
+
+    offsets = array.array("Q")
+    reservoir = array.array("H")
+    mainData = array.array("H")
+    while offset + 4 <= end:
+        header = ParseFrameHeader(data,offset)
+        if header and header.SameStream(first) and offset + header.length <= end:
+            offsets.append(offset)
+            reservoir.append(MainDataBegin(data,offset,header))
+            mainData.append(MainDataLength(header))
+            offset += header.length
+        else:
+            offset = FindFrame(data,offset + 1,end)
+            if offset is None:
+                break
+    if not offsets:
+        raise Mp3FormatError("No MPEG audio frames found.")
+    offsets.append(offsets[-1] + ParseFrameHeader(data,offsets[-1]).length)
+    return FrameIndex(first.sampleRate,first.samples,offsets,reservoir,mainData)
+
+INDEX_MAGIC = b"QSFI"
+INDEX_FORMAT_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHIHQI") # magic, format version, sample rate, samples per frame, first frame offset, frame count
+
+def PackFrameIndex(index: FrameIndex) -> bytes:
+    """Return index in a compact binary format: a fixed header followed by the zlib-compressed arrays of
+    the distances between frames, main_data_begin values, and main data lengths."""
+
+    gaps = array.array("I",(b - a for a,b in itertools.pairwise(index.offsets)))
+    arrays = [gaps,array.array("H",index.reservoir),array.array("H",index.mainData)]
+    if sys.byteorder == "big":
+        for a in arrays:
+            a.byteswap()
+    header = INDEX_HEADER.pack(INDEX_MAGIC,INDEX_FORMAT_VERSION,index.sampleRate,index.samples,index.offsets[0],index.FrameCount())
+    return header + zlib.compress(b"".join(a.tobytes() for a in arrays))
+
+def UnpackFrameIndex(data: bytes) -> FrameIndex:
+    """Return the FrameIndex packed by PackFrameIndex.
+    Raise Mp3FormatError if data isn't a frame index in the current format."""
+
+    try:
+        magic,formatVersion,sampleRate,samples,firstOffset,frameCount = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or formatVersion != INDEX_FORMAT_VERSION:
+            raise Mp3FormatError("Unknown frame index format.")
+        contents = zlib.decompress(data[INDEX_HEADER.size:])
+    except (struct.error,zlib.error) as error:
+        raise Mp3FormatError(f"Damaged frame index: {error}")
+
+    gaps,reservoir,mainData = array.array("I"),array.array("H"),array.array("H")
+    position = 0
+    for a in (gaps,reservoir,mainData):
+        length = frameCount * a.itemsize
+        a.frombytes(contents[position:position + length])
+        position += length
+        if sys.byteorder == "big":
+            a.byteswap()
+    if position != len(contents) or len(mainData) != frameCount:
+        raise Mp3FormatError("Damaged frame index: wrong length.")
+    
+    offsets = array.array("Q",itertools.accumulate(gaps,initial=firstOffset))
+    return FrameIndex(sampleRate,samples,offsets,reservoir,mainData)
+
+def VbrHeaderFrame(headerBytes: bytes,frameCount: int,byteCounts: list[int]) -> bytes:
+    """Return a Xing/Info header frame describing frameCount audio frames with the given lengths in bytes.
+    headerBytes: the four header bytes of the first audio frame, which determine the format of the header frame.
+    The header is named "Info" if all frames have the same length (+/-1 for padding) and "Xing" otherwise.
+    Like LAME, write an Info frame at the bitrate of the audio frames, since readers take the CBR bitrate from it.
+    Write a Xing frame at the smallest bitrate whose frames hold the header."""
+
+    template = ParseFrameHeader(headerBytes)
+    kind = b"Info" if byteCounts and max(byteCounts) - min(byteCounts) <= 1 else b"Xing"
+    header = bytearray(headerBytes[:4])
+    header[1] |= 0x01 # No CRC
+    audioBitrateIndex = header[2] >> 4
+    header[2] &= 0x0D # Clear the bitrate index and padding bits
+    xingOffset = 4 + template.SideInfoLength() if template.layer == 3 else 4
+    needed = xingOffset + 116 # "Xing", flags, frame count, byte count, and table of contents
+    bitrateIndexes = list(range(1,15))
+    if kind == b"Info":
+        bitrateIndexes.insert(0,audioBitrateIndex)
+    for bitrateIndex in bitrateIndexes:
+        header[2] = (header[2] & 0x0F) | (bitrateIndex << 4)
+        frameHeader = ParseFrameHeader(bytes(header))
+        if frameHeader.length >= needed:
+            break
+    
+    frame = bytearray(frameHeader.length)
+    frame[0:4] = header
+    totalBytes = frameHeader.length + sum(byteCounts)
+    toc = bytearray(100)
+    position = frameHeader.length
+    positions = []
+    for length in byteCounts:
+        positions.append(position)
+        position += length
+    for percent in range(100):
+        if positions:
+            frameNumber = min(percent * len(positions) // 100,len(positions) - 1)
+            toc[percent] = min(positions[frameNumber] * 256 // totalBytes,255)
+    
+    frame[xingOffset:needed] = kind + (0x07).to_bytes(4,"big") + frameCount.to_bytes(4,"big") + \
+        totalBytes.to_bytes(4,"big") + bytes(toc)
+    return bytes(frame)
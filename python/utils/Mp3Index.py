@@ -0,0 +1,74 @@
+"""Persistent indexes of the frames in local mp3 files.
+Scanning a multi-hour session mp3 file to find its frames reads the entire file, so we store each file's
+Mp3Frames.FrameIndex in a small binary file named after the md5 hash of the mp3 file. A FrameIndexCache
+register maps paths to hashes by file size and modification time, so unchanged files needn't be hashed either.
+Clip times then map directly to frame numbers and byte ranges without reading the mp3 file."""
+
+from __future__ import annotations
+
+import os, posixpath, mmap, hashlib, tempfile, contextlib
+import FileRegister, Mp3Frames, LocalMp3
+
+def ReadIndex(cache: FileRegister.FrameIndexCache,fileHash: str) -> Mp3Frames.FrameIndex|None:
+    "Return the stored index of the file with this hash or None if there is no usable index."
+    try:
+        with open(cache.IndexFile(fileHash),"rb") as file:
+            return Mp3Frames.UnpackFrameIndex(file.read())
+    except (OSError,Mp3Frames.Mp3FormatError):
+        return None
+
+def WriteIndex(cache: FileRegister.FrameIndexCache,fileHash: str,index: Mp3Frames.FrameIndex) -> None:
+    """Store index. Write a uniquely named temporary file first so that an interrupted write doesn't leave
+    a damaged index and processes indexing identical files don't interfere with each other."""
+    indexFile = cache.IndexFile(fileHash)
+    os.makedirs(posixpath.dirname(indexFile),exist_ok=True)
+    handle,tempFile = tempfile.mkstemp(".tmp",dir=posixpath.dirname(indexFile))
+    try:
+        with os.fdopen(handle,"wb") as file:
+            file.write(Mp3Frames.PackFrameIndex(index))
+        os.replace(tempFile,indexFile)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tempFile)
+        raise
+
+def Load(path: str,cache: FileRegister.FrameIndexCache,data: bytes|None = None) -> Mp3Frames.FrameIndex:
+    """Return the frame index of the mp3 file at path, scanning the file only if no stored index matches it.
+    data: the contents of the file (typically an mmap) if the caller has already opened it.
+    Raise OSError if the file can't be read and Mp3Frames.Mp3FormatError if it contains no frames."""
+
+    key = posixpath.normpath(path)
+    version = LocalMp3.Version(os.stat(path))
+    record = cache.Lookup(key,version)
+    if record:
+        index = ReadIndex(cache,record["hash"])
+        if index:
+            return index
+        fileHash = record["hash"]
+    else:
+        if data is None:
+            fileHash = FileRegister.FileHash(path)
+        else:
+            fileHash = hashlib.md5(data,usedforsecurity=False).hexdigest()
+        index = ReadIndex(cache,fileHash)
+
+    if not index:
+        if data is None:
+            with open(path,"rb") as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as data:
+                index = Mp3Frames.BuildFrameIndex(data)
+        else:
+            index = Mp3Frames.BuildFrameIndex(data)
+        with contextlib.suppress(OSError): # The index is only an optimization
+            WriteIndex(cache,fileHash,index)
+
+    cache.Store(key,version,fileHash,index.FrameCount(),index.Duration())
+    return index
+
+def Duration(path: str,cache: FileRegister.FrameIndexCache) -> float|None:
+    """Return the exact duration of the mp3 file at path in seconds if it has an up-to-date index; otherwise None.
+    Never scan the file."""
+    try:
+        record = cache.Lookup(posixpath.normpath(path),LocalMp3.Version(os.stat(path)))
+    except OSError:
+        return None
+    return record["duration"] if record else None
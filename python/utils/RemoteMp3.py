@@ -0,0 +1,106 @@
+"""Read the duration and ID3 tags of remote mp3 files using a few small HTTP Range requests rather than
+downloading the entire file. We read the beginning of the file, which contains the ID3v2 tag and the
+first frame (with its Xing/Info/LAME or VBRI header if any). If there is no such header, the file is
+probably CBR, so we calculate its duration from its size after reading the last few kilobytes to find
+trailing tags and confirm that the bitrate doesn't change.
+Results are cached by URL and ETag in an Mp3InfoCache so unchanged files need only a HEAD request."""
+
+from __future__ import annotations
+
+from io import BytesIO
+from typing import NamedTuple
+import mutagen, mutagen.easyid3
+import AsyncHttp, FileRegister, Mp3Frames
+
+class RemoteMp3(NamedTuple):
+    status: int                 # The HTTP status of the first request
+    reason: str
+    headers: dict[str,str]      # The headers of the first response
+    size: int|None              # The file size in bytes
+    duration: float|None        # seconds
+    method: str                 # How the duration was calculated; see Mp3Frames.Inspect
+    clips: str|None             # The ID3 CLIP tag written by SplitMp3
+    bytesRead: int              # The number of bytes of the file we transferred
+
+    def Ok(self) -> bool:
+        return 200 <= self.status < 300
+
+def FileSize(response: AsyncHttp.HttpResponse) -> int|None:
+    "Return the total file size from the Content-Range or Content-Length header of response."
+    if response.status == 206:
+        total = response.headers.get("content-range","").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("content-length","")
+    return int(length) if length.isdigit() else None
+
+def Version(headers: dict[str,str],size: int|None) -> str:
+    "Return a string that changes whenever the file changes or '' if the server doesn't tell us."
+    if headers.get("etag"):
+        return headers["etag"]
+    if headers.get("last-modified") and size is not None:
+        return f"{headers['last-modified']}|{size}"
+    return ""
+
+def ClipsTag(id3Tag: bytes) -> str|None:
+    "Return the ID3 CLIP tag in id3Tag, the bytes of an ID3v2 tag."
+    if not id3Tag:
+        return None
+    try:
+        tags = mutagen.easyid3.EasyID3(BytesIO(id3Tag))
+    except (OSError,mutagen.MutagenError):
+        return None
+    return tags.get("clips",[None])[0]
+
+async def Inspect(url: str,client: AsyncHttp.AsyncHttpClient,cache: FileRegister.Mp3InfoCache|None = None) -> RemoteMp3:
+    """Return the duration and CLIP tag of the mp3 file at url.
+    If the request fails, return a RemoteMp3 whose Ok() is False.
+    Raise Mp3Frames.Mp3FormatError if the file doesn't look like an mp3 and OSError on network errors."""
+
+    if cache and url in cache.record:
+        response = await client.Request("HEAD",url)
+        if response.status in (405,501): # The server doesn't implement HEAD
+            response = await client.Request("GET",url,{"Range":"bytes=0-0"},maxBody=1)
+        if not response.Ok():
+            return RemoteMp3(response.status,response.reason,response.headers,None,None,"",None,len(response.body))
+        size = FileSize(response)
+        record = cache.Lookup(url,Version(response.headers,size))
+        if record:
+            return RemoteMp3(response.status,response.reason,response.headers,record["size"],record["duration"],
+                             record["method"],record["clips"],len(response.body))
+
+    headBytes = Mp3Frames.HEAD_BYTES
+    firstResponse = response = await client.Request("GET",url,{"Range":f"bytes=0-{headBytes - 1}"},maxBody=headBytes)
+    if not response.Ok():
+        return RemoteMp3(response.status,response.reason,response.headers,None,None,"",None,len(response.body))
+    size = FileSize(response)
+    head = response.body
+    bytesRead = len(head)
+
+    needed = Mp3Frames.ID3v2Length(head) + 2 * Mp3Frames.MAX_FRAME_BYTES # The tag, the first frame, and the next header
+    if response.status == 206 and len(head) < needed and (size is None or len(head) < size):
+        response = await client.Request("GET",url,{"Range":f"bytes={len(head)}-{needed - 1}"},maxBody=needed - len(head))
+        if response.status == 206:
+            head += response.body
+            bytesRead += len(response.body)
+    if size is None:
+        size = len(head)
+
+    inspection = Mp3Frames.Inspect(head,size)
+    if inspection.method == "CBR":
+        tail = None
+        if size <= len(head):
+            tail = head[:size]
+        elif firstResponse.status == 206:
+            response = await client.Request("GET",url,{"Range":f"bytes=-{Mp3Frames.TAIL_BYTES}"},maxBody=Mp3Frames.TAIL_BYTES)
+            if response.status == 206:
+                tail = response.body
+                bytesRead += len(tail)
+        inspection = Mp3Frames.Inspect(head,size,tail)
+
+    clips = ClipsTag(head[:inspection.tagLength])
+    if cache is not None:
+        version = Version(firstResponse.headers,size)
+        if version:
+            cache.Store(url,version,size,inspection.duration,inspection.method,clips)
+    return RemoteMp3(firstResponse.status,firstResponse.reason,firstResponse.headers,size,inspection.duration,
+                     inspection.method,clips,bytesRead)
@@ -0,0 +1,115 @@
+"""Build and query the trigram index written to assets/SearchIndex.json.
+For each search (excerpts, tags, teachers...) the index maps every three-character sequence that occurs in
+the items' blobs to the list of items containing it. A query term can match an item only if the item contains
+every trigram of the literal text between the term's wildcards, so search.js intersects these posting lists
+to find a few candidate items before running the exact regular expressions.
+
+Posting lists are sorted item numbers stored as gaps (the difference from the previous number minus one).
+Each gap is written as a sequence of base64url characters, most significant first, carrying five bits each;
+all but the last character of a gap have the 32 bit set. Runs of consecutive items therefore cost one
+character per item.
+
+Each search in the index and in SearchDatabase.json stores blobHash, a hash of its items' blobs, so that
+search.js can ignore an index which doesn't match the database it loaded."""
+
+from __future__ import annotations
+
+import re, json, hashlib
+from collections import defaultdict
+from collections.abc import Iterable
+from SearchQuery import SearchQuery, StripWildcards
+
+FORMAT_VERSION = 1
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+DIGIT_VALUE = {c:n for n,c in enumerate(ALPHABET)}
+
+def Trigrams(text: str) -> set[str]:
+    "Return the set of three-character substrings of text."
+    return {text[n:n+3] for n in range(len(text) - 2)}
+
+def ItemTrigrams(item: dict) -> set[str]:
+    "Return the trigrams in any of item's blobs. Trigrams spanning two blobs are excluded because no term can match them."
+    trigrams = set()
+    for blob in item["blobs"]:
+        trigrams.update(Trigrams(blob))
+    return trigrams
+
+def LiteralTrigrams(literal: str) -> set[str]:
+    """Return the trigrams that every blob matching this search term literal must contain:
+    those of the literal text between the wildcards *, _, and $."""
+    trigrams = set()
+    for segment in re.split(r"[*_$]",StripWildcards(literal)):
+        trigrams.update(Trigrams(segment))
+    return trigrams
+
+def QueryTrigrams(query: SearchQuery) -> set[str]:
+    """Return the trigrams that every item matching query must contain.
+    Negated terms don't narrow the search."""
+    trigrams = set()
+    for term in query.terms:
+        if not term.negate:
+            trigrams.update(LiteralTrigrams(term.literal))
+    return trigrams
+
+def EncodePostings(itemNumbers: Iterable[int]) -> str:
+    "Delta-encode a sorted sequence of item numbers."
+    digits = []
+    previous = -1
+    for n in itemNumbers:
+        gap = n - previous - 1
+        previous = n
+        groups = [gap & 31]
+        gap >>= 5
+        while gap:
+            groups.append(gap & 31 | 32)
+            gap >>= 5
+        digits.extend(ALPHABET[g] for g in reversed(groups))
+    return "".join(digits)
+
+def DecodePostings(encoded: str) -> list[int]:
+    "Return the item numbers in a posting list encoded by EncodePostings."
+    itemNumbers = []
+    previous = -1
+    gap = 0
+    for digit in encoded:
+        value = DIGIT_VALUE[digit]
+        gap = gap << 5 | value & 31
+        if not value & 32:
+            previous += gap + 1
+            itemNumbers.append(previous)
+            gap = 0
+    return itemNumbers
+
+def BlobHash(items: list[dict]) -> str:
+    "Return a hash of the blobs of a list of search items."
+    blobs = json.dumps([item["blobs"] for item in items],ensure_ascii=False,separators=(",",":"))
+    return hashlib.md5(blobs.encode("utf-8"),usedforsecurity=False).hexdigest()
+
+def BuildIndex(items: list[dict]) -> dict:
+    "Return the index of a list of search items, each of which is a dict containing a list of 'blobs'."
+    postings = defaultdict(list)
+    for n,item in enumerate(items):
+        for trigram in ItemTrigrams(item):
+            postings[trigram].append(n)
+
+    return {
+        "itemCount": len(items),
+        "blobHash": BlobHash(items),
+        "postings": {trigram:EncodePostings(postings[trigram]) for trigram in sorted(postings)}
+    }
+
+def Candidates(index: dict,query: SearchQuery) -> list[int]|None:
+    """Return the sorted numbers of the items which might match query, or None if the index can't narrow the search.
+    Every item that query matches is in the returned list."""
+    trigrams = QueryTrigrams(query)
+    if not trigrams:
+        return None
+
+    postings = index["postings"]
+    encoded = sorted((postings.get(t,"") for t in trigrams),key=len) # Start with the shortest list
+    candidates = set(DecodePostings(encoded[0]))
+    for posting in encoded[1:]:
+        if not candidates:
+            break
+        candidates.intersection_update(DecodePostings(posting))
+    return sorted(candidates)
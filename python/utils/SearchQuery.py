@@ -0,0 +1,189 @@
+"""A Python reference implementation of the query language in pages/search.js.
+Queries are parsed into terms exactly as search.js parses them and each term is translated into the same
+regular expression, so the results match what the search page displays. Search evaluates a query against
+the searches in SearchDatabase.json in the same way as the search page's search buttons.
+SearchIndex uses this module to check that its candidate sets never omit an item that the exact search would find,
+and python/tools/SearchBenchmark.py compares its results with those recorded from search.js."""
+
+from __future__ import annotations
+
+import re, unicodedata, hashlib
+from collections.abc import Iterable
+
+TEXT_DELIMITERS = "][{}<>^"
+METADATA_DELIMITERS = "#&@"
+METADATA_SEPARATOR = "|"
+SPECIAL_SEARCH_CHARS = TEXT_DELIMITERS + METADATA_DELIMITERS + "()"
+
+PALI_DIACRITICS = {
+    "a":"ā","i":"ī","u":"ū",
+    "d":"ḍ","l":"ḷ","t":"ṭ",
+    "n":"ñṇṅ","m":"ṁṃ",
+    "'": '‘’"“”'                # A single quote matches all types of quotes
+}
+PALI_DIACRITIC_MATCH_ALL = {letter:f"[{letter}{diacritics}]" for letter,diacritics in PALI_DIACRITICS.items()}
+
+SEARCH_KINDS = { # The searches run by each search button; see gSearchers in search.js
+    "x": ["x"],
+    "multi-tag": ["k","b","g"],
+    "t": ["t"],
+    "e": ["e"],
+    "all": ["k","b","g","t","e","x"]
+}
+
+def RegExpEscape(literal: str) -> str:
+    "Escape the same characters as regExpEscape in search.js."
+    return re.sub(r"[-[\]{}()*+!<>=:?./\\^$|#\s,]",lambda m: "\\" + m[0],literal)
+
+ESCAPED_HTML_CHARS = RegExpEscape(SPECIAL_SEARCH_CHARS)
+MATCH_END_DELIMITERS = re.compile(r"^\\[" + RegExpEscape(TEXT_DELIMITERS) + r"]+|\\[" + RegExpEscape(TEXT_DELIMITERS) + r"]+$")
+
+def MatchEnclosedText(separators: str,dontMatchAfterSpace: str) -> str:
+    """Return a regex string that matches the contents between separators, e.g. '{}'.
+    See matchEnclosedText in search.js."""
+    escapedStart = RegExpEscape(separators[0])
+    escapedEnd = RegExpEscape(separators[1])
+    return f"{escapedStart}[^{escapedEnd} ]*(?:[^{escapedEnd + RegExpEscape(dontMatchAfterSpace)}]*{escapedEnd})"
+
+def StripWildcards(queryString: str) -> str:
+    "Strip the leading and trailing * and $ wildcards from queryString."
+    return re.sub(r"[$*]+$","",re.sub(r"^[$*]+","",queryString))
+
+def SubstituteWildcards(queryString: str) -> str:
+    """Convert the wildcards * (any characters), _ (one character), and $ (word boundary) to a regex string.
+    See substituteWildcards in search.js."""
+    bounded = RegExpEscape(StripWildcards(queryString))
+    if re.match(r"[$*]*",queryString)[0].endswith("$"):
+        bounded = r"\b" + bounded
+    if re.search(r"[$*]*$",queryString)[0].startswith("$"):
+        bounded += r"\b"
+
+    return bounded.replace(r"\*",f"[^{ESCAPED_HTML_CHARS}]*?").replace("_",f"[^{ESCAPED_HTML_CHARS}]").replace(r"\$",r"\b")
+
+def AsciiWordBoundaries(regex: str) -> str:
+    """Make each \\b in regex match only at ASCII word boundaries like JavaScript does.
+    Needed for regexes that can't use re.ASCII because they must ignore the case of non-ASCII letters."""
+    return re.sub(r"\\(.)",lambda m: r"(?a:\b)" if m[1] == "b" else m[0],regex)
+
+def NormalizeQuery(queryText: str) -> str:
+    "Convert queryText to lowercase and remove diacritics."
+    return re.sub("[\u0300-\u036f]","",unicodedata.normalize("NFD",queryText.lower()))
+
+class SearchTerm:
+    """A single term in a search query; see class SearchTerm in search.js."""
+    negate: bool            # Match only items that don't match this term
+    matchesMetadata: bool   # Does this term apply to the metadata after METADATA_SEPARATOR?
+    literal: str            # The search element with wildcards; used to build the regex and find trigrams
+    matcher: re.Pattern
+    boldTextMatcher: str    # A regex string used to highlight this term when displaying results; "" if none
+
+    def __init__(self,searchElement: str) -> None:
+        self.matchesMetadata = bool(re.search(f"[{METADATA_DELIMITERS}]",searchElement))
+
+        self.negate = searchElement.startswith("!")
+        searchElement = re.sub(r"^!","",searchElement)
+
+        if re.fullmatch(r"[0-9]+",searchElement): # Enclose bare numbers in quotes so 7 does not match 37
+            searchElement = '"' + searchElement + '"'
+
+        qTagMatch = aTagMatch = False
+        if re.search(r"\]//$",searchElement): # Does this query match qTags only?
+            searchElement = re.sub(r"/*$","",searchElement,count=1)
+            qTagMatch = True
+        if re.match(r"//\[",searchElement): # Does this query match aTags only?
+            searchElement = re.sub(r"^/*","",searchElement)
+            aTagMatch = True
+
+        if searchElement.startswith('"'): # Items in quotes must match on word boundaries.
+            searchElement = "$" + re.sub(r'"+$',"",re.sub(r'^"+',"",searchElement)) + "$"
+        self.literal = searchElement
+
+        escaped = SubstituteWildcards(searchElement)
+        regex = escaped
+        if qTagMatch:
+            regex += "(?=.*//)"
+        if aTagMatch:
+            regex += "(?!.*//)"
+        self.matcher = re.compile(regex,re.ASCII) # JavaScript \b considers only ASCII word characters
+
+        self.boldTextMatcher = ""
+        if self.matchesMetadata:
+            return # Don't apply boldface to metadata searches
+
+        boldItem = MATCH_END_DELIMITERS.sub("",escaped)
+        for letter,matchAll in PALI_DIACRITIC_MATCH_ALL.items():
+            boldItem = boldItem.replace(letter,matchAll)
+        self.boldTextMatcher = boldItem
+
+    def MatchesBlob(self,blob: str) -> bool:
+        "Does this term match blob (ignoring negate)?"
+        if not self.matchesMetadata:
+            blob = blob.split(METADATA_SEPARATOR)[0]
+        return bool(self.matcher.search(blob))
+
+    def MatchesItem(self,item: dict) -> bool:
+        "Does this term match any of item's blobs?"
+        for blob in item["blobs"]:
+            if self.MatchesBlob(blob):
+                return not self.negate
+        return self.negate
+
+    def __repr__(self) -> str:
+        return f"SearchTerm({'!' if self.negate else ''}{self.matcher.pattern!r})"
+
+class SearchQuery:
+    """An entire search query. Each term is a group of its own, and an item matches the query only if it
+    matches all terms."""
+    terms: list[SearchTerm]
+    boldTextRegex: re.Pattern   # Matches found text which should be displayed in bold
+
+    def __init__(self,queryText: str) -> None:
+        parts = [
+            MatchEnclosedText('""',''), # Match text enclosed in quotes
+            MatchEnclosedText('{}',SPECIAL_SEARCH_CHARS), # Match teachers enclosed in braces
+            "/*" + MatchEnclosedText('[]',SPECIAL_SEARCH_CHARS) + r"\+?/*",
+                # Match tags enclosed in brackets in the forms: [tag]// (qTag only), //[tag] (aTag only), [tag]+ (fTag only)
+            "[^ ]+" # Match everything else until we encounter a space
+        ]
+        partsSearch = r"\s*(" + "|".join("!?" + p for p in parts) + ")"
+        self.terms = [SearchTerm(match[1].strip()) for match in re.finditer(partsSearch,NormalizeQuery(queryText))]
+
+        textMatchItems = [term.boldTextMatcher for term in self.terms if term.boldTextMatcher]
+        if textMatchItems: # Negative lookahead assertion to avoid modifying html tags.
+            self.boldTextRegex = re.compile(AsciiWordBoundaries(f"({'|'.join(textMatchItems)})(?![^<]*\\>)"),re.IGNORECASE)
+        else:
+            self.boldTextRegex = re.compile(r"^a\ba") # A regex that doesn't match anything
+
+    def MatchesItem(self,item: dict) -> bool:
+        return all(term.MatchesItem(item) for term in self.terms)
+
+    def Matches(self,items: list[dict],candidates: Iterable[int]|None = None) -> list[int]:
+        """Return the numbers of the items that match this query.
+        candidates: check only these item numbers; None means check all items."""
+        if candidates is None:
+            candidates = range(len(items))
+        return [n for n in candidates if self.MatchesItem(items[n])]
+
+    def DisplayMatchesInBold(self,html: str) -> str:
+        "Add <b> and </b> tags to html to display matches in bold."
+        return self.boldTextRegex.sub(r"<b>\g<0></b>",html)
+
+    def __repr__(self) -> str:
+        return f"SearchQuery({self.terms!r})"
+
+def Search(database: dict,query: SearchQuery|str,kind: str = "all") -> dict[str,list[int]]:
+    """Search the items in database, the contents of SearchDatabase.json, like the search page's search buttons.
+    kind: a key of SEARCH_KINDS.
+    Return a dict mapping each search code to the numbers of the items found. A blank query finds nothing.
+    Queries of the form '#N', which display featured excerpt N, aren't searches and also find nothing."""
+    if isinstance(query,str):
+        if not query.strip() or re.search(r"#[0-9]+$",query.strip()):
+            return {code:[] for code in SEARCH_KINDS[kind]}
+        query = SearchQuery(query)
+    return {code:query.Matches(database["searches"][code]["items"]) for code in SEARCH_KINDS[kind]}
+
+def ResultDigest(results: dict[str,list[int]]) -> str:
+    """Return a short digest of the results of Search to compare with results recorded from search.js.
+    tools/unitTest/recordSearchCorpus.mjs calculates the same digest."""
+    canonical = ";".join(f"{code}:{','.join(str(n) for n in numbers)}" for code,numbers in results.items())
+    return hashlib.md5(canonical.encode("utf-8"),usedforsecurity=False).hexdigest()[:12]
@@ -0,0 +1,104 @@
+"""Dictionary-encode the html fragments repeated throughout the json databases loaded by the web pages.
+SearchDatabase.json and RandomExcerpts.json contain the rendered html of thousands of excerpts, which repeat the
+same tag links, teacher links, star icons, and paragraph markup over and over. Encode finds the html tags and
+complete <a> elements that are worth storing once, lists them in database["stringTable"]["strings"], and replaces
+each encoded html string with a list of literal strings and integer references to the table:
+    '[<a href = "../tags/merit.html">Merit</a>] // ...' => ["[",12,"] // ..."]
+Strings without references are left as they are. pages/stringTable.js and Decode reverse the encoding."""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from collections.abc import Iterable, Iterator
+
+FORMAT_VERSION = 1
+ENCODED_KEYS = ("html","sessionHeader") # Encode strings that are the values of these keys or the values of dicts under them
+FRAGMENT = re.compile(r"(<a\b[^>]*>.*?</a>|<[^>]+>)",re.DOTALL)
+REFERENCE_COST = 6 # The approximate number of characters needed to reference a fragment, e.g. '",123,"'
+
+def _EncodedSlots(node,keys: Iterable[str]) -> Iterator[tuple[dict,str]]:
+    "Yield (container,key) for each string in node that should be encoded."
+    if isinstance(node,list):
+        for item in node:
+            yield from _EncodedSlots(item,keys)
+    elif isinstance(node,dict):
+        for key,value in node.items():
+            if key in keys:
+                if isinstance(value,str):
+                    yield node,key
+                elif isinstance(value,dict):
+                    yield from ((value,k) for k,v in value.items() if isinstance(v,str))
+            else:
+                yield from _EncodedSlots(value,keys)
+
+def BuildTable(strings: Iterable[str]) -> list[str]:
+    "Return the fragments of strings worth storing in a table, most frequent first."
+    counts = Counter()
+    for s in strings:
+        counts.update(FRAGMENT.findall(s))
+    worthwhile = [(count,fragment) for fragment,count in counts.items()
+                  if count > 1 and (count - 1) * len(fragment) > count * REFERENCE_COST]
+    worthwhile.sort(key=lambda pair: (-pair[0],pair[1]))
+    return [fragment for _,fragment in worthwhile]
+
+def EncodeString(s: str,references: dict[str,int]) -> str|list[str|int]:
+    "Encode s using references, which maps fragments to their table index."
+    parts = []
+    literal = ""
+    for piece in FRAGMENT.split(s):
+        if piece in references:
+            if literal:
+                parts.append(literal)
+                literal = ""
+            parts.append(references[piece])
+        else:
+            literal += piece
+    if literal:
+        parts.append(literal)
+    return parts if any(isinstance(p,int) for p in parts) else s
+
+def Encode(database: dict,keys: Iterable[str] = ENCODED_KEYS) -> dict:
+    "Dictionary-encode the html strings in database in place and return it."
+    keys = tuple(keys)
+    slots = list(_EncodedSlots(database,keys))
+    table = BuildTable(container[key] for container,key in slots)
+    references = {fragment:n for n,fragment in enumerate(table)}
+    for container,key in slots:
+        container[key] = EncodeString(container[key],references)
+
+    database["stringTable"] = {"version":FORMAT_VERSION,"keys":list(keys),"strings":table}
+    return database
+
+def DecodeString(encoded: str|list[str|int],table: list[str]) -> str:
+    "Reverse EncodeString."
+    if isinstance(encoded,str):
+        return encoded
+    return "".join(table[p] if isinstance(p,int) else p for p in encoded)
+
+def Decode(database: dict) -> dict:
+    """Reverse Encode in place and return database. Databases without a string table are returned unchanged.
+    Raise ValueError if the table was written by an unknown version of this module."""
+    stringTable = database.pop("stringTable",None)
+    if stringTable is None:
+        return database
+    if stringTable["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unknown string table version {stringTable['version']}")
+
+    table = stringTable["strings"]
+    def DecodeNode(node) -> None:
+        if isinstance(node,list):
+            for item in node:
+                DecodeNode(item)
+        elif isinstance(node,dict):
+            for key,value in node.items():
+                if key not in stringTable["keys"]:
+                    DecodeNode(value)
+                elif isinstance(value,dict):
+                    for k,v in value.items():
+                        value[k] = DecodeString(v,table)
+                else:
+                    node[key] = DecodeString(value,table)
+
+    DecodeNode(database)
+    return database
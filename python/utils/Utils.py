@@ -7,6 +7,8 @@ import copy
 import re, os,argparse
 from urllib.parse import urlparse
 from typing import BinaryIO
+from types import ModuleType
+import inspect
 import Alert
 import pathlib, posixpath
 from collections import Counter
@@ -268,9 +270,9 @@ def SummarizeDict(d: dict,printer: Alert.AlertClass) -> None:
 
 class MockFuture():
     def __init__(self, result) -> None:
-        self.result = result
+        self._result = result
     def result(self, timeout=None):
-        return self.result
+        return self._result
     def cancel(self):
         pass
 
@@ -295,6 +297,18 @@ class MockThreadPoolExecutor():
     def shutdown(self, wait=True):
         pass
 
+def ClearDatabaseCaches(modules: Iterable[ModuleType]) -> None:
+    """Clear all caches in modules which may have been computed from an old database:
+    functions decorated by lru_cache and dictionary default arguments whose names end in 'Cache'."""
+    for module in modules:
+        for function in list(vars(module).values()):
+            if hasattr(function,"cache_clear"):
+                function.cache_clear()
+            elif inspect.isfunction(function):
+                for name,parameter in inspect.signature(function).parameters.items():
+                    if name.endswith("Cache") and isinstance(parameter.default,dict):
+                        parameter.default.clear()
+
 def ConditionalThreader() -> ThreadPoolExecutor|MockThreadPoolExecutor:
     return ThreadPoolExecutor() if gOptions.multithread else MockThreadPoolExecutor()
 
@@ -0,0 +1,54 @@
+// Record the results of search.js for each query in searchCorpus.json so that
+// python/tools/SearchBenchmark.py can check that python/utils/SearchQuery.py returns the same results.
+// Usage (from the directory containing QSarchive.py): node tools/unitTest/recordSearchCorpus.mjs [corpus] [database]
+
+import fs from 'fs';
+import crypto from 'crypto';
+
+// search.js imports the page framework, which expects a browser. Provide just enough of one to load the module.
+globalThis.document = {querySelector: () => null, getElementById: () => null};
+globalThis.window = {addEventListener: () => {}};
+globalThis.self = globalThis;
+globalThis.location = {hash: "", href: ""};
+const log = console.log;
+console.log = () => {}; // Silence search.js debugging messages
+
+const {SearchQuery} = await import('../../pages/search.js');
+
+const SEARCH_KINDS = { // The searches run by each search button; see gSearchers in search.js
+    "x": ["x"],
+    "multi-tag": ["k","b","g"],
+    "t": ["t"],
+    "e": ["e"],
+    "all": ["k","b","g","t","e","x"]
+};
+
+function resultDigest(results) {
+    // Return the same digest as ResultDigest in SearchQuery.py.
+    let canonical = Object.entries(results).map(([code,numbers]) => `${code}:${numbers.join(",")}`).join(";");
+    return crypto.createHash("md5").update(canonical,"utf8").digest("hex").slice(0,12);
+}
+
+const corpusFile = process.argv[2] || "tools/unitTest/searchCorpus.json";
+const databaseFile = process.argv[3] || "pages/assets/SearchDatabase.json";
+const corpus = JSON.parse(fs.readFileSync(corpusFile,"utf8"));
+const database = JSON.parse(fs.readFileSync(databaseFile,"utf8"));
+
+let itemNumbers = {}; // itemNumbers[code] maps each item to its position in the database
+for (const code in database.searches)
+    if (Array.isArray(database.searches[code].items))
+        itemNumbers[code] = new Map(database.searches[code].items.map((item,n) => [item,n]));
+
+for (const entry of corpus.queries) {
+    const query = new SearchQuery(entry.query);
+    let results = {};
+    for (const code of SEARCH_KINDS[entry.kind])
+        results[code] = query.filterItems(database.searches[code].items).map((item) => itemNumbers[code].get(item));
+
+    entry.counts = Object.fromEntries(Object.entries(results).map(([code,numbers]) => [code,numbers.length]));
+    entry.digest = resultDigest(results);
+}
+
+corpus.recorded = new Date().toISOString();
+fs.writeFileSync(corpusFile,JSON.stringify(corpus,null,2) + "\n");
+log(`Recorded results of ${corpus.queries.length} queries to ${corpusFile}.`);
@@ -1,4 +1,5 @@
 import {SearchQuery,ExcerptSearcher} from '../../pages/search.js';
+import {decodeStringTable} from '../../pages/stringTable.js';
 
 let gDatabase = null;
 let gSearcher = null;
@@ -25,11 +26,20 @@ async function loadDatabase() {
         await fetch('../../pages/assets/SearchDatabase.json')
         .then((response) => response.json())
         .then((json) => {
-            gDatabase = json;
+            gDatabase = decodeStringTable(json);
             showStatus(`Loaded search database. Keys: ${Object.keys(gDatabase)}`);
             gSearcher = new ExcerptSearcher();
             gSearcher.loadItemsFomDatabase(gDatabase);
         });
+        await fetch('../../pages/assets/SearchIndex.json')
+        .then((response) => response.json())
+        .then((json) => {
+            gSearcher.loadIndex(json);
+            showStatus(`Loaded search database and index. Keys: ${Object.keys(gDatabase)}`);
+        })
+        .catch((error) => {
+            showStatus(`Loaded search database without index (${error}). Keys: ${Object.keys(gDatabase)}`);
+        });
     }
 }
 